@@ -35,13 +35,16 @@ def markov_step(x, M):
         M_DH * H + M_DD * D       # D
     ])
 
-def iterate_model(x0, T, params):
+def iterate_model(x0, T, params, tol=None):
     '''
     Solves the markovian model for `T` time steps (days) for the initial conditions `x0` and the set of parameters `params` and `ext_params`.
 
     Inputs:
     `x0`: list with the initial compartiment densities (S0, E0, A0, I0, H0, R0, D0)
     `params`': list of parameters in the same order than in Arenas report [2]: (β, kg, ηg, αg, ν, μg, γg, ωg, ψg, χg, n_ig, σ, κ0, ϕ, tc, tf, κf)
+                or an `ArenasParams` record (see parameter_sets.py)
+    `tol`: adaptive horizon (None runs the T days): stop once the outbreak has died out and fill the remaining days analytically.
+           Same criterion as in `iterate_model_batch`.
 
     Output:
     `flow`: 7-dimensional time series. Each dimension corresponds to S(t), E(t), A(t), I(t), H(t), R(t), D(t) respectively.
@@ -115,6 +118,12 @@ def iterate_model(x0, T, params):
 
     x_old = x0
 
+    if tol is not None:
+        # Last intervention day and infectious exposure of a new case (see `iterate_model_batch`)
+        last_event = max([e for e in (tc, tc+tf) if np.isfinite(e)], default=-np.inf)
+        exposure = 1/α + ν/(1 - M_II)
+        λ = -np.log1p(-β)
+
     ## MODEL DYNAMICS
     for t in range(T):
 
@@ -159,10 +168,460 @@ def iterate_model(x0, T, params):
             M[0] = (1 - Π_t)*(1 + (1 - ϕ)*κf*C_tc)
             M[1] = Π_t*(1 + (1 - ϕ)*κf*C_tc)
 
+        # Adaptive horizon: weekly check for a died out outbreak, then fill the remaining days analytically
+        if tol is not None and (t+1) % 7 == 0 and t+1 < T:
+            if x_new[1:5].sum() < tol and last_event < t+1 and x_new[0]*k*λ*exposure < 1:
+                linear_tail(x_new[:, None], T-t-1, *[np.atleast_1d(p) for p in (x_new[0]*k*λ, ν, η, α, M_EE, M_AA, M_II, M_HI, M_HH, M_RᴵI, M_RᴴH, M_DH)],
+                            out=flow[t+1:, :, None])
+                break
+
         x_old = x_new
 
     return flow
 
+def iterate_model_batch(x0, T, params, tol=None):
+    '''
+    Solves the markovian model for a batch of B initial conditions and/or parameter sets at once. Same dynamics as `iterate_model`.
+
+    Inputs:
+    `x0`: (B, 8) array with the initial compartiment densities (S0, E0, A0, I0, H0, Rᴵ0, Rᴴ0, D0) of every batch member.
+          A single (8,) vector is broadcast against the parameters.
+    `T`: number of days
+    `params`: list of parameters in the same order as in `iterate_model`. Every entry can be a scalar (shared) or a (B,) array.
+              An `ArenasParamsBatch` (see parameter_sets.py) is passed as is: its columns are used without copies.
+    `tol`: adaptive horizon for the whole batch (None runs the T days). A member is steady once E+A+I+H < `tol`, its
+           containment and release are behind it and the outbreak can no longer grow (linearised reproduction number below 1),
+           checked weekly. The stepping stops only when every member is steady, and the remaining days are filled with the
+           closed form of the model linearised around that day (see `linear_tail`). Members do not stop on their own: the
+           closed form costs about as much per member-day as the vectorised step, so setting steady members aside does not
+           pay, and a batch with a single slow member (e.g. a sweep over β and k) runs the T days. Batch together members
+           that settle at similar times, or use `iterate_model` with `tol` for single long runs.
+
+    Output:
+    `flow`: (T+1, B, 8) array. flow[:, b] is the flow of `iterate_model` for member b.
+    '''
+
+    β, k, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ = [np.asarray(p, dtype=np.float64) for p in params[:11]]
+    σ, κ0, ϕ, tc, tf, κf = [np.asarray(p, dtype=np.float64) for p in params[12:18]]
+
+    x0 = np.asarray(x0, dtype=np.float64)
+    B = np.broadcast(x0[..., 0], β, k, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ, σ, κ0, ϕ, tc, tf, κf).shape
+    B = B[0] if len(B) else 1
+    x = np.broadcast_to(x0, (B, 8)).T.copy() # (8, B) for cheap row access
+
+    # Constant interaction terms
+    M_EE   = 1 - η
+    M_AA   = 1 - α
+    M_II   = γ * (1 - μ) + (1 - γ) * (1 - χᴵ)
+    M_HI   = γ * μ
+    M_HH   = ω * (1 - ψ) + (1 - ω) * (1 - χᴴ)
+    M_RᴵI  = (1 - γ) * χᴵ
+    M_RᴴH  = (1 - ω) * χᴴ
+    M_DH   = ω * ψ
+
+    ## PREALLOCATION
+    flow = np.zeros([T+1, 8, B])
+    flow[0] = x
+
+    # Case when containtment happens before initial conditions
+    k = np.broadcast_to(k, (B,)).copy()
+    C_tc = np.full(B, np.nan)
+    contained_t0 = np.broadcast_to(tc < 0, (B,))
+    k = np.where(contained_t0, (1-κ0)*k + κ0*(σ-1), k)
+    C_tc = np.where(contained_t0, (x[0] + x[5])**σ, C_tc)
+    c = np.where(contained_t0, 1 - (1 - ϕ)*κ0*C_tc, 1.0)
+    Π_t = Π_1D(x[2] + ν*x[3], β, k)
+
+    if tol is not None:
+        # Last intervention day (containment or release) and infectious exposure of a new case (A days + ν I days)
+        last_event = np.fmax(np.where(np.isfinite(tc), tc, -np.inf), np.where(np.isfinite(tc + tf), tc + tf, -np.inf))
+        exposure = 1/α + ν/(1 - M_II)
+        λ = -np.log1p(-β)
+
+    ## MODEL DYNAMICS
+    for t in range(T):
+        S, E, A, I, H, Rᴵ, Rᴴ, D = x
+
+        # Take markov step
+        x = flow[t+1]
+        x[0] = (1 - Π_t)*c * S
+        x[1] = Π_t*c * S + M_EE * E
+        x[2] = η * E + M_AA * A
+        x[3] = α * A + M_II * I
+        x[4] = M_HI * I + M_HH * H
+        x[5] = M_RᴵI * I + Rᴵ
+        x[6] = M_RᴴH * H + Rᴴ
+        x[7] = M_DH * H + D
+
+        # Containtment
+        containment = (t+1 == tc)
+        k = np.where(containment, (1-κ0)*k + κ0*(σ-1), k)
+        C_tc = np.where(containment, (x[0] + x[5])**σ, C_tc)
+        c = np.where(containment, 1 - (1 - ϕ)*κ0*C_tc, 1.0)
+
+        # end of containtment
+        release = (t+1 == tc+tf)
+        k = np.where(release, (1-κf)*( k - κ0*(σ-1) ) / (1 - κ0) + κf*(σ-1), k)
+        c = np.where(release, 1 + (1 - ϕ)*κf*C_tc, c)
+
+        # Update probability of transmission
+        Π_t = Π_1D(x[2] + ν*x[3], β, k)
+
+        # Weekly check of the adaptive horizon: negligible active compartments, no intervention ahead and no possible regrowth
+        if tol is None or (t+1) % 7 or t+1 == T:
+            continue
+        steady = (x[1] + x[2] + x[3] + x[4] < tol) & (last_event < t+1) & (x[0]*k*λ*exposure < 1)
+        if steady.all():
+            linear_tail(x, T-t-1, *np.broadcast_arrays(x[0]*k*λ, ν, η, α, M_EE, M_AA, M_II, M_HI, M_HH, M_RᴵI, M_RᴴH, M_DH),
+                        out=flow[t+1:])
+            break
+
+    return flow.transpose(0, 2, 1)
+
+def linear_tail(x, n, g, ν, η, α, M_EE, M_AA, M_II, M_HI, M_HH, M_RᴵI, M_RᴴH, M_DH, out=None):
+    '''
+    Closed form of the model linearised around a state with negligible A and I, without interventions ahead, for n days.
+
+    The infection probability Π_1D(A + νI, β, k) is replaced by its first order term g (A + νI), with g = S k (-log(1 - β))
+    evaluated at that state. The active compartments a = (E, A, I, H) then follow a linear map, a(m) = L^m a(0), computed
+    with O(log n) products of the 4x4 matrices L^m instead of n steps. S, Rᴵ, Rᴴ and D only accumulate the outflows of
+    A, I and H, so they are cumulative sums of the active compartments.
+
+    Inputs:
+    `x`: (8, b) array with the initial states
+    `n`: number of days
+    `g`: (b,) array with the linear force of infection of every member
+    `ν`, ..., `M_DH`: (b,) arrays with the parameters and constant interaction terms of `iterate_model_batch`
+    `out`: optional (n+1, 8, b) array where the tail is written (e.g. the remaining days of the flow)
+
+    Output:
+    `tail`: (n+1, 8, b) array, with tail[0] = x
+    '''
+    L = np.zeros([4, 4, len(g)])
+    L[0, 0], L[0, 1], L[0, 2] = M_EE, g, g*ν
+    L[1, 0], L[1, 1] = η, M_AA
+    L[2, 1], L[2, 2] = α, M_II
+    L[3, 2], L[3, 3] = M_HI, M_HH
+
+    tail = np.empty([n+1, *x.shape]) if out is None else out
+    tail[0] = x
+    a = tail[:, 1:5]
+    # a[m:2m] = L^m a[0:m], squaring L^m each time. E, A and I do not depend on H.
+    # S is filled last, so its rows serve as scratch for the products.
+    m, Q = 1, L
+    while m <= n:
+        j = min(m, n+1-m)
+        new, scratch = a[m:m+j], tail[m:m+j, 0]
+        for r in range(4):
+            np.multiply(Q[r, 0], a[:j, 0], out=new[:, r])
+            for s in range(1, 4 if r == 3 else 3):
+                new[:, r] += np.multiply(Q[r, s], a[:j, s], out=scratch)
+        m, Q = 2*m, np.einsum('ijb,jkb->ikb', Q, Q)
+
+    # Outflows of A, I and H accumulated up to the day before
+    S, Rᴵ, Rᴴ, D = tail[1:, 0], tail[1:, 5], tail[1:, 6], tail[1:, 7]
+    np.cumsum(a[:-1, 1], axis=0, out=S)
+    np.cumsum(a[:-1, 2], axis=0, out=Rᴵ)
+    np.cumsum(a[:-1, 3], axis=0, out=Rᴴ)
+    S += np.multiply(Rᴵ, ν, out=D)
+    S *= -g
+    S += x[0]
+    np.multiply(Rᴵ, M_RᴵI, out=Rᴵ)
+    Rᴵ += x[5]
+    np.multiply(Rᴴ, M_DH, out=D)
+    D += x[7]
+    np.multiply(Rᴴ, M_RᴴH, out=Rᴴ)
+    Rᴴ += x[6]
+    return tail
+
+def iterate_model_stochastic(x0, T, params, R=1000, seed=None):
+    '''
+    Stochastic chain-binomial version of `iterate_model` for `R` replicates at once.
+
+    Every day each individual moves between compartments with the same transition probabilities as `markov_step`
+    (infection probability `Π_1D`, η, α, γ, μ, χᴵ, ω, ψ, χᴴ), so the counts are binomial (multinomial for the
+    exits from I and H) draws. The containment factor c of `iterate_model` is applied by binomial thinning of S
+    (c < 1) or by adding back a binomial draw of (c - 1) S (c > 1). The expected trajectory follows the deterministic model
+    while the counts are large, and small populations can go extinct.
+
+    Inputs:
+    `x0`: list with the initial compartiment densities (S0, E0, A0, I0, H0, Rᴵ0, Rᴴ0, D0). They are rounded to people with N = params[11]
+    `T`: number of days
+    `params`: list of parameters in the same order as in `iterate_model`
+    `R`: number of replicates
+    `seed`: seed (or numpy Generator) of the random number generator
+
+    Output:
+    `flow`: (T+1, R, 8) integer array with the number of people in each compartment for every replicate
+    '''
+
+    β, k, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ = [float(p) for p in params[:11]]
+    N = float(params[11])
+    σ, κ0, ϕ, tc, tf, κf = [float(p) for p in params[12:18]]
+
+    rng = np.random.default_rng(seed)
+
+    # Initial conditions in people; S takes the rounding remainder
+    x0 = np.rint(np.asarray(x0, dtype=np.float64) * N).astype(np.int64)
+    x0[0] = int(N) - x0[1:].sum()
+
+    # Exit probabilities of I and H (the remaining mass stays)
+    p_HI   = γ * μ
+    p_RᴵI  = (1 - γ) * χᴵ
+    p_DH   = ω * ψ
+    p_RᴴH  = (1 - ω) * χᴴ
+
+    ## PREALLOCATION
+    flow = np.zeros([T+1, 8, R], dtype=np.int64)
+    flow[0] = x0[:, None]
+    x = flow[0]
+
+    # Case when containtment happens before initial conditions
+    C_tc = np.full(R, np.nan)
+    c = np.ones(R)
+    if tc < 0:
+        k = (1-κ0)*k + κ0*(σ-1)
+        C_tc = ((x[0] + x[5]) / N)**σ
+        c = 1 - (1 - ϕ)*κ0*C_tc
+    Π_t = Π_1D((x[2] + ν*x[3]) / N, β, k)
+
+    ## MODEL DYNAMICS
+    for t in range(T):
+        S, E, A, I, H, Rᴵ, Rᴴ, D = x
+
+        # Containment factor on the susceptibles
+        if (c != 1).any():
+            S = np.where(c < 1, rng.binomial(S, np.clip(c, 0, 1)), S + rng.binomial(S, np.clip(c - 1, 0, 1)))
+
+        # Transitions
+        S_E  = rng.binomial(S, Π_t)
+        E_A  = rng.binomial(E, η)
+        A_I  = rng.binomial(A, α)
+        I_H  = rng.binomial(I, p_HI)
+        I_Rᴵ = rng.binomial(I - I_H, p_RᴵI / (1 - p_HI))
+        H_D  = rng.binomial(H, p_DH)
+        H_Rᴴ = rng.binomial(H - H_D, p_RᴴH / (1 - p_DH))
+
+        x = flow[t+1]
+        x[0] = S - S_E
+        x[1] = E + S_E - E_A
+        x[2] = A + E_A - A_I
+        x[3] = I + A_I - I_H - I_Rᴵ
+        x[4] = H + I_H - H_D - H_Rᴴ
+        x[5] = Rᴵ + I_Rᴵ
+        x[6] = Rᴴ + H_Rᴴ
+        x[7] = D + H_D
+
+        c = np.ones(R)
+        # Containtment
+        if t+1 == tc:
+            k = (1-κ0)*k + κ0*(σ-1)
+            C_tc = ((x[0] + x[5]) / N)**σ
+            c = 1 - (1 - ϕ)*κ0*C_tc
+
+        # end of containtment
+        if t+1 == tc+tf:
+            k = (1-κf)*( k - κ0*(σ-1) ) / (1 - κ0) + κf*(σ-1)
+            c = 1 + (1 - ϕ)*κf*C_tc
+
+        # Update probability of transmission
+        Π_t = Π_1D((x[2] + ν*x[3]) / N, β, k)
+
+    return flow.transpose(0, 2, 1)
+
+def model_states(x0, params):
+    '''
+    Generator over the daily states of the markovian model, starting with `x0`. Same dynamics as `iterate_model`.
+
+    It steps plain Python floats instead of numpy arrays, which is much cheaper for the short horizons of the fits,
+    and lets the caller stop as soon as it has the days it needs (e.g. `zip(range(T+1), model_states(x0, params))`).
+
+    Inputs:
+    `x0`: list with the initial compartiment densities (S0, E0, A0, I0, H0, Rᴵ0, Rᴴ0, D0)
+    `params`: list of parameters in the same order as in `iterate_model`
+
+    Yields:
+    `x`: tuple (S, E, A, I, H, Rᴵ, Rᴴ, D) for t = 0, 1, 2, ...
+    '''
+
+    β, k, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ = [float(p) for p in params[:11]]
+    σ, κ0, ϕ, tc, tf, κf = [float(p) for p in params[12:18]]
+
+    # Constant interaction terms
+    M_EE   = 1 - η
+    M_AA   = 1 - α
+    M_II   = γ * (1 - μ) + (1 - γ) * (1 - χᴵ)
+    M_HI   = γ * μ
+    M_HH   = ω * (1 - ψ) + (1 - ω) * (1 - χᴴ)
+    M_RᴵI  = (1 - γ) * χᴵ
+    M_RᴴH  = (1 - ω) * χᴴ
+    M_DH   = ω * ψ
+
+    S, E, A, I, H, Rᴵ, Rᴴ, D = [float(x) for x in x0]
+
+    # Factor of the susceptible row at each step (1 except at containment and release)
+    c = 1.0
+    if tc < 0:
+        k = (1-κ0)*k + κ0*(σ-1)
+        C_tc = (S + Rᴵ)**σ
+        c = 1 - (1 - ϕ)*κ0*C_tc
+    Π_t = Π_1D(A + ν*I, β, k)
+
+    t = 0
+    while True:
+        yield (S, E, A, I, H, Rᴵ, Rᴴ, D)
+
+        # Take markov step
+        S, E, A, I, H, Rᴵ, Rᴴ, D = (
+            (1 - Π_t)*c * S,
+            Π_t*c * S + M_EE * E,
+            η * E + M_AA * A,
+            α * A + M_II * I,
+            M_HI * I + M_HH * H,
+            M_RᴵI * I + Rᴵ,
+            M_RᴴH * H + Rᴴ,
+            M_DH * H + D,
+        )
+        t += 1
+
+        # Containtment
+        c = 1.0
+        if t == tc:
+            k = (1-κ0)*k + κ0*(σ-1)
+            C_tc = (S + Rᴵ)**σ
+            c = 1 - (1 - ϕ)*κ0*C_tc
+
+        # end of containtment
+        if t == tc+tf:
+            k = ( k - κ0*(σ-1) ) / (1 - κ0)
+            k = (1-κf)*k + κf*(σ-1)
+            c = 1 + (1 - ϕ)*κf*C_tc
+
+        Π_t = Π_1D(A + ν*I, β, k)
+
+def iterate_model_sensitivities(x0, T, params, wrt=(0, 1, 6)):
+    '''
+    Solves the markovian model as `iterate_model` and propagates the forward sensitivities of the flow
+    with respect to the initial conditions `x0` and the parameters `params[wrt]`.
+
+    The sensitivities are the exact derivatives of the discrete map, including the containment and release steps
+    (the contained fraction C_tc depends on the state at tc, so it carries its own sensitivities).
+
+    Inputs:
+    `x0`: list with the initial compartiment densities (S0, E0, A0, I0, H0, Rᴵ0, Rᴴ0, D0)
+    `T`: number of days
+    `params`: list of parameters in the same order as in `iterate_model`
+    `wrt`: indices of the parameters to differentiate (any of β, k, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ: 0 to 10). Default: β, k, γ
+
+    Output:
+    `flow`: (T+1, 8) array, as in `iterate_model`
+    `sens`: (T+1, 8, 8 + len(wrt)) array. sens[t, i, j] is d x_i(t) / d x0_j for j < 8 and d x_i(t) / d params[wrt[j-8]] after that.
+    '''
+
+    wrt = list(wrt)
+    if any(not 0 <= i <= 10 for i in wrt):
+        raise ValueError('Only the rate parameters (indices 0 to 10) have sensitivities, got {}.'.format(wrt))
+
+    β, k, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ = [float(p) for p in params[:11]]
+    σ, κ0, ϕ, tc, tf, κf = [float(p) for p in params[12:18]]
+
+    P = 8 + len(wrt)
+    # Unit vector of parameter `i` among the sensitivity columns (zeros if it is not differentiated)
+    def unit(i):
+        e = np.zeros(P)
+        if i in wrt:
+            e[8 + wrt.index(i)] = 1
+        return e
+    e_β, e_k, e_η, e_α, e_ν, e_μ, e_γ, e_ω, e_ψ, e_χᴵ, e_χᴴ = [unit(i) for i in range(11)]
+
+    # Constant interaction terms and their parameter derivatives
+    M_II = γ * (1 - μ) + (1 - γ) * (1 - χᴵ)
+    M_HH = ω * (1 - ψ) + (1 - ω) * (1 - χᴴ)
+    dM_II = -γ * e_μ + (χᴵ - μ) * e_γ - (1 - γ) * e_χᴵ
+    dM_HH = (χᴴ - ψ) * e_ω - ω * e_ψ - (1 - ω) * e_χᴴ
+    dM_HI = μ * e_γ + γ * e_μ
+    dM_RᴵI = -χᴵ * e_γ + (1 - γ) * e_χᴵ
+    dM_RᴴH = -χᴴ * e_ω + (1 - ω) * e_χᴴ
+    dM_DH = ψ * e_ω + ω * e_ψ
+    L = np.log(1 - β)
+    dL = -e_β / (1 - β)
+
+    ## PREALLOCATION
+    x = np.array(x0, dtype=np.float64)
+    J = np.zeros([8, P])
+    J[:, :8] = np.eye(8)
+
+    flow = np.zeros([T+1, 8])
+    sens = np.zeros([T+1, 8, P])
+    flow[0], sens[0] = x, J
+
+    # Contacts (and their derivative with respect to k) and susceptible factor at each step
+    dk = e_k.copy()
+    c, dc = 1.0, np.zeros(P)
+
+    def contained(x, J):
+        C = (x[0] + x[5])**σ
+        dC = σ * (x[0] + x[5])**(σ - 1) * (J[0] + J[5])
+        return C, dC
+
+    if tc < 0:
+        k = (1-κ0)*k + κ0*(σ-1)
+        dk = (1-κ0) * dk
+        C_tc, dC_tc = contained(x, J)
+        c, dc = 1 - (1 - ϕ)*κ0*C_tc, -(1 - ϕ)*κ0*dC_tc
+
+    ## MODEL DYNAMICS
+    for t in range(T):
+        S, E, A, I, H, Rᴵ, Rᴴ, D = x
+        J_S, J_E, J_A, J_I, J_H, J_Rᴵ, J_Rᴴ, J_D = J
+
+        # Probability of infection and its derivative
+        ρ = A + ν*I
+        dρ = J_A + ν*J_I + I*e_ν
+        e_Π = np.exp(k*ρ*L) # 1 - Π
+        Π_t = 1 - e_Π
+        dΠ = -e_Π * (L*(ρ*dk + k*dρ) + k*ρ*dL)
+
+        # Take markov step
+        x = np.array([
+            (1 - Π_t)*c * S,
+            Π_t*c * S + (1 - η) * E,
+            η * E + (1 - α) * A,
+            α * A + M_II * I,
+            γ*μ * I + M_HH * H,
+            (1 - γ)*χᴵ * I + Rᴵ,
+            (1 - ω)*χᴴ * H + Rᴴ,
+            ω*ψ * H + D,
+        ])
+        J = np.array([
+            (1 - Π_t)*c * J_S + S * ((1 - Π_t)*dc - c*dΠ),
+            Π_t*c * J_S + S * (Π_t*dc + c*dΠ) + (1 - η) * J_E - E*e_η,
+            η * J_E + (1 - α) * J_A + E*e_η - A*e_α,
+            α * J_A + M_II * J_I + A*e_α + I*dM_II,
+            γ*μ * J_I + M_HH * J_H + I*dM_HI + H*dM_HH,
+            (1 - γ)*χᴵ * J_I + J_Rᴵ + I*dM_RᴵI,
+            (1 - ω)*χᴴ * J_H + J_Rᴴ + H*dM_RᴴH,
+            ω*ψ * J_H + J_D + H*dM_DH,
+        ])
+        flow[t+1], sens[t+1] = x, J
+
+        # Containtment
+        c, dc = 1.0, np.zeros(P)
+        if t+1 == tc:
+            k = (1-κ0)*k + κ0*(σ-1)
+            dk = (1-κ0) * dk
+            C_tc, dC_tc = contained(x, J)
+            c, dc = 1 - (1 - ϕ)*κ0*C_tc, -(1 - ϕ)*κ0*dC_tc
+
+        # end of containtment
+        if t+1 == tc+tf:
+            k = ( k - κ0*(σ-1) ) / (1 - κ0)
+            k = (1-κf)*k + κf*(σ-1)
+            dk = (1-κf) * dk / (1 - κ0)
+            c, dc = 1 + (1 - ϕ)*κf*C_tc, (1 - ϕ)*κf*dC_tc
+
+    return flow, sens
+
 ## Helper functions
 # Probability of infection for 1D treatment of the model
 def Π_1D(ρ, β, k):
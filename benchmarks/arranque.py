@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+'''
+    Benchmark del tiempo de arranque (importación) de los módulos del modelo.
+
+    Cada ruta de importación se mide en un intérprete nuevo, varias veces, y se reporta la mediana y el mínimo
+    junto con las dependencias pesadas que quedaron cargadas. La ruta 'simulador' (solo `iterate_model` y
+    `get_params_arenas`) no debe cargar pandas, scipy, matplotlib ni scikit-learn.
+
+    Uso:
+        python benchmarks/arranque.py [--repeticiones 10] [--salida arranque.json] [--limite-ms 500]
+
+    Con `--limite-ms`, termina con código 1 si la ruta 'simulador' tarda más (mediana) o carga alguna dependencia pesada.
+'''
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Rutas de importación a medir
+RUTAS = {
+    'simulador': 'import arenas_model; from data_handling.parameters import get_params_arenas',
+    'calibracion': 'import data_handling.initial_conditions',
+    'pipeline': 'import data_handling.pipeline',
+}
+
+# Dependencias cuya carga se reporta
+PESADAS = ['pandas', 'scipy', 'scipy.optimize', 'matplotlib', 'sklearn']
+
+_PROGRAMA = '''
+import sys, time, json
+t = time.perf_counter()
+{importacion}
+t = time.perf_counter() - t
+print(json.dumps({{'segundos': t, 'cargados': [m for m in {pesadas!r} if m in sys.modules]}}))
+'''
+
+
+def mide_ruta(importacion, repeticiones=10):
+    '''
+    Mide `importacion` en `repeticiones` intérpretes nuevos.
+
+    Output:
+        - resultado: diccionario con la mediana y el mínimo en milisegundos y las dependencias pesadas cargadas
+    '''
+
+    tiempos = []
+    cargados = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, '-c', _PROGRAMA.format(importacion=importacion, pesadas=PESADAS)],
+                                cwd=RAIZ, capture_output=True, text=True, check=True)
+        medicion = json.loads(salida.stdout.strip().splitlines()[-1])
+        tiempos.append(1000 * medicion['segundos'])
+        cargados = medicion['cargados']
+
+    return {'mediana_ms': statistics.median(tiempos), 'minimo_ms': min(tiempos), 'cargados': cargados}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tiempo de importación de los módulos del modelo')
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--salida', default=None, help='archivo JSON de resultados')
+    parser.add_argument('--limite-ms', type=float, default=None, help='límite de la mediana de la ruta simulador')
+    args = parser.parse_args(argv)
+
+    resultados = {nombre: mide_ruta(importacion, args.repeticiones) for (nombre, importacion) in RUTAS.items()}
+    resultados['python'] = sys.version.split()[0]
+
+    texto = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if args.salida is not None:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto)
+    print(texto)
+
+    if args.limite_ms is not None:
+        simulador = resultados['simulador']
+        if simulador['mediana_ms'] > args.limite_ms or simulador['cargados']:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
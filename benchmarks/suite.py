@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+'''
+    Suite de benchmarks de los simuladores y del procesamiento de datos a escala de producción.
+
+    Casos (grupos):
+        - modelo:      `iterate_model` (un miembro) e `iterate_model_batch` para varios T y tamaños de lote, y con horizonte
+                       adaptivo (tol) en un horizonte largo, con barridos sólo en β y en β y k
+        - acoplado:    `iterate_model` del modelo acoplado con NP ∈ {10, 100, 1000, 2500}, R_ij densa y dispersa
+        - ext_params:  `get_ext_params` del modelo acoplado para los mismos NP
+        - panel:       `series_panel_por_estado` con 1M, 5M y 10M de renglones sintéticos
+        - ajuste:      `correccion_x0_latentes` de punta a punta (condiciones iniciales, subreporte y ajuste)
+
+    Cada caso se prepara fuera de la medición, se corre `--repeticiones` veces (se reporta la mediana y el mínimo)
+    y una vez más con tracemalloc para el pico de memoria de la corrida. Los resultados se guardan en JSON junto con
+    el commit y las versiones, para comparar entre commits con `--compara`.
+
+    Uso:
+        python benchmarks/suite.py [--grupos modelo panel] [--rapido] [--salida resultados.json] [--compara base.json]
+'''
+
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import datetime
+import itertools
+import statistics
+import subprocess
+import tracemalloc
+import importlib.util
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# Tamaños de cada grupo: completos y con --rapido
+TAMANOS = {
+    'modelo':     {'T': [100, 365], 'B': [1, 100, 1000, 10000], 'T_largo': 1000, 'tol': [None, 1e-6]},
+    'acoplado':   {'NP': [10, 100, 1000, 2500], 'T': 100},
+    'ext_params': {'NP': [10, 100, 1000, 2500]},
+    'panel':      {'filas': [1_000_000, 5_000_000, 10_000_000]},
+    'ajuste':     {'metodos': ['nelder-mead', 'l-bfgs-b'], 'filas': 500_000},
+}
+TAMANOS_RAPIDOS = {
+    'modelo':     {'T': [100], 'B': [1, 1000], 'T_largo': 1000, 'tol': [None, 1e-6]},
+    'acoplado':   {'NP': [10, 100], 'T': 50},
+    'ext_params': {'NP': [10, 100]},
+    'panel':      {'filas': [200_000]},
+    'ajuste':     {'metodos': ['l-bfgs-b'], 'filas': 200_000},
+}
+
+# Columnas de los datos abiertos que usa `series_panel_por_estado`
+COLUMNAS_PANEL = ['ORIGEN', 'ENTIDAD_UM', 'FECHA_INGRESO', 'FECHA_SINTOMAS', 'FECHA_DEF', 'RESULTADO', 'TIPO_PACIENTE']
+
+
+class Caso:
+    '''
+    Un caso de benchmark: `prepara()` arma la entrada (no se mide) y `corre(entrada)` es lo que se mide.
+    `unidades` es la cantidad de trabajo de una corrida en `unidad` (para el throughput).
+    '''
+
+    def __init__(self, grupo, nombre, parametros, prepara, corre, unidades, unidad):
+        self.grupo = grupo
+        self.nombre = nombre
+        self.parametros = parametros
+        self.prepara = prepara
+        self.corre = corre
+        self.unidades = unidades
+        self.unidad = unidad
+
+
+def mide(caso, repeticiones=3):
+    '''
+    Corre `caso` y regresa el diccionario de resultados.
+    '''
+
+    tiempos = []
+    for _ in range(repeticiones):
+        entrada = caso.prepara()
+        gc.collect()
+        inicio = time.perf_counter()
+        caso.corre(entrada)
+        tiempos.append(time.perf_counter() - inicio)
+        del entrada
+
+    # Pico de memoria en una corrida aparte (tracemalloc alenta la ejecución)
+    entrada = caso.prepara()
+    gc.collect()
+    tracemalloc.start()
+    caso.corre(entrada)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del entrada
+
+    mediana = statistics.median(tiempos)
+    return {'grupo': caso.grupo, 'nombre': caso.nombre, 'parametros': caso.parametros,
+            'segundos_mediana': mediana, 'segundos_min': min(tiempos), 'repeticiones': repeticiones,
+            'throughput': caso.unidades / mediana, 'unidad': caso.unidad + '/s',
+            'pico_memoria_mb': pico / 2**20}
+
+
+## CASOS
+
+def casos_modelo(tamanos):
+    from arenas_model import iterate_model, iterate_model_batch
+    from data_handling.parameters import get_params_arenas
+
+    params = get_params_arenas()
+    params[11] = 1e6
+    params[15], params[16] = 30, 60
+    x0 = np.array([1 - 1e-4, 5e-5, 3e-5, 2e-5, 0, 0, 0, 0])
+    rng = np.random.default_rng(0)
+
+    casos = []
+    for T in tamanos['T']:
+        casos.append(Caso('modelo', 'iterate_model', {'T': T},
+                          lambda: None, lambda _, T=T: iterate_model(x0, T, params), T, 'días'))
+        for B in tamanos['B']:
+            def prepara(B=B):
+                lote = list(params)
+                lote[0] = params[0] * rng.uniform(0.5, 1.5, B)
+                lote[1] = rng.uniform(5, 15, B)
+                return lote
+            casos.append(Caso('modelo', 'iterate_model_batch', {'T': T, 'B': B},
+                              prepara, lambda lote, T=T: iterate_model_batch(x0, T, lote), T * B, 'miembro-días'))
+
+    # Horizonte largo con y sin horizonte adaptivo (tol)
+    T = tamanos['T_largo']
+    for tol in tamanos['tol']:
+        casos.append(Caso('modelo', 'iterate_model', {'T': T, 'tol': tol},
+                          lambda: None, lambda _, tol=tol: iterate_model(x0, T, params, tol=tol), T, 'días'))
+        # Barrido sólo en β (todos los miembros se asientan) y en β y k (el lote sólo para cuando el último se asienta)
+        for (barrido, B) in itertools.product(['β', 'β,k'], tamanos['B']):
+            def prepara(B=B, barrido=barrido):
+                lote = list(params)
+                lote[0] = params[0] * rng.uniform(0.5, 1.5, B)
+                if barrido == 'β,k':
+                    lote[1] = rng.uniform(5, 15, B)
+                return lote
+            casos.append(Caso('modelo', 'iterate_model_batch', {'T': T, 'B': B, 'tol': tol, 'barrido': barrido},
+                              prepara, lambda lote, tol=tol: iterate_model_batch(x0, T, lote, tol=tol), T * B, 'miembro-días'))
+    return casos
+
+
+def _modulos_acoplados():
+    '''
+    Módulos del modelo acoplado (coupled_dynamics usa importaciones planas y su propio `arenas_model`).
+    '''
+    carpeta = os.path.join(RAIZ, 'coupled_dynamics')
+    if carpeta not in sys.path:
+        sys.path.append(carpeta)
+    modulos = _MODULOS_ACOPLADOS
+    for nombre in ['arenas_model', 'ext_params', 'arenas_params']:
+        if nombre in modulos:
+            continue
+        spec = importlib.util.spec_from_file_location('acoplado_' + nombre, os.path.join(carpeta, nombre + '.py'))
+        modulos[nombre] = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modulos[nombre])
+    return modulos['arenas_model'].iterate_model, modulos['ext_params'].get_ext_params
+
+
+_MODULOS_ACOPLADOS = {}
+
+
+def _sistema_acoplado(NP, disperso, semilla=0):
+    '''
+    Parámetros, condiciones iniciales y ext_params de un sistema acoplado sintético con NP parches y 3 estratos.
+    Con `disperso`, R_ij tiene 10 destinos por parche (CSR); si no, es densa.
+    '''
+    import scipy.sparse
+    _, get_ext_params = _modulos_acoplados()
+    ap = _MODULOS_ACOPLADOS['arenas_params']
+
+    rng = np.random.default_rng(semilla)
+    NG = 3
+    n_ig = rng.integers(1_000, 100_000, (NP, NG)).astype(np.float64)
+    s_i = rng.uniform(10, 1_000, NP)
+
+    if disperso:
+        destinos = min(10, NP)
+        filas = np.repeat(np.arange(NP), destinos)
+        columnas = np.concatenate([rng.choice(NP, destinos, replace=False) for _ in range(NP)])
+        R_ij = scipy.sparse.csr_matrix((rng.random(NP * destinos), (filas, columnas)), shape=(NP, NP))
+        R_ij = scipy.sparse.csr_matrix(R_ij.multiply(1 / R_ij.sum(axis=0)))
+    else:
+        R_ij = rng.random((NP, NP))
+        R_ij = R_ij / R_ij.sum(axis=0)
+
+    params = [ap.β, ap.kg, ap.η, ap.αg, ap.ν, ap.μg, ap.γg, ap.ωg, ap.ψg, ap.χg, n_ig, R_ij, ap.Cgh, ap.ξ, ap.pg, ap.σ, ap.κ0, ap.ϕ, 30, 30]
+    ext_params = get_ext_params(n_ig, s_i, R_ij, ap.pg, 1 - ap.pg, ap.ξ, ap.kg)
+
+    x0 = np.zeros([7, NP, NG])
+    x0[0] = 1 - 1e-3
+    x0[2] = 1e-3
+    return params, x0, ext_params, s_i
+
+
+def casos_acoplado(tamanos):
+    iterate_model, _ = _modulos_acoplados()
+    casos = []
+    T = tamanos['T']
+    for NP in tamanos['NP']:
+        for disperso in [False, True]:
+            sistema = _sistema_acoplado(NP, disperso)
+            casos.append(Caso('acoplado', 'iterate_model', {'NP': NP, 'T': T, 'R_ij': 'dispersa' if disperso else 'densa'},
+                              lambda sistema=sistema: sistema,
+                              lambda s, T=T: iterate_model(s[1], T, s[0], s[2]), NP * T, 'parche-días'))
+    return casos
+
+
+def casos_ext_params(tamanos):
+    _, get_ext_params = _modulos_acoplados()
+    casos = []
+    for NP in tamanos['NP']:
+        for disperso in [False, True]:
+            params, _, _, s_i = _sistema_acoplado(NP, disperso)
+            casos.append(Caso('ext_params', 'get_ext_params', {'NP': NP, 'R_ij': 'dispersa' if disperso else 'densa'},
+                              lambda params=params, s_i=s_i: (params, s_i),
+                              lambda e: get_ext_params(e[0][10], e[1], e[0][11], e[0][14], 1 - e[0][14], e[0][13], e[0][1]),
+                              1, 'llamadas'))
+    return casos
+
+
+def datos_abiertos_sinteticos(filas, semilla=0):
+    '''
+    Corte sintético (ver data_handling.sinteticos) con las columnas que lee `series_panel_por_estado`.
+    '''
+    from data_handling.sinteticos import get_datos_abiertos_sinteticos
+    return get_datos_abiertos_sinteticos(filas, semilla=semilla, columnas=COLUMNAS_PANEL)
+
+
+def casos_panel(tamanos):
+    from data_handling.data_processing import series_panel_por_estado
+
+    casos = []
+    for filas in tamanos['filas']:
+        # La función modifica su entrada: cada repetición recibe una copia
+        datos = {}
+        def prepara(filas=filas):
+            if 'df' not in datos:
+                datos['df'] = datos_abiertos_sinteticos(filas)
+            return datos['df'].copy()
+        casos.append(Caso('panel', 'series_panel_por_estado', {'filas': filas},
+                          prepara, series_panel_por_estado, filas, 'renglones'))
+    return casos
+
+
+def casos_ajuste(tamanos):
+    from data_handling.data_processing import series_panel_por_estado
+    from data_handling.panel import get_panel
+    from data_handling.initial_conditions import (get_params_arenas, get_parametros, get_poblacion, get_t0, get_fit_param,
+                                                  get_k_optimo, get_condiciones_iniciales, multiplicador_subreporte,
+                                                  correccion_x0_latentes)
+    from parameter_sets import ArenasParams
+
+    panel = get_panel(series_panel_por_estado(datos_abiertos_sinteticos(tamanos['filas'])))
+    estado = 'JALISCO'
+
+    # Misma secuencia que data_handling.pipeline.calibra_estado hasta antes del ajuste de las latentes
+    t0 = get_t0(panel, estado)
+    γ, ω, χᴵ, σ = get_parametros(panel, 'Nacional')
+    params = ArenasParams.from_list(get_params_arenas()).replace(γ=γ, ω=ω, χᴵ=χᴵ, σ=σ, N=get_poblacion(estado))
+    params = params.replace(k=get_k_optimo(get_fit_param(panel, estado), params))
+    x0, params = multiplicador_subreporte(get_condiciones_iniciales(panel, estado, params, t0), params)
+
+    return [Caso('ajuste', 'correccion_x0_latentes', {'estado': estado, 'method': method},
+                 lambda: None, lambda _, method=method: correccion_x0_latentes(panel, estado, x0, params, t0, method=method),
+                 1, 'ajustes')
+            for method in tamanos['metodos']]
+
+
+GRUPOS = {'modelo': casos_modelo, 'acoplado': casos_acoplado, 'ext_params': casos_ext_params,
+          'panel': casos_panel, 'ajuste': casos_ajuste}
+
+
+## RESULTADOS
+
+def metadatos():
+    import pandas as pd
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=RAIZ, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'plataforma': platform.platform(), 'nucleos': os.cpu_count()}
+
+
+def _llave(resultado):
+    return (resultado['grupo'], resultado['nombre'], json.dumps(resultado['parametros'], sort_keys=True))
+
+
+def compara(resultados, base):
+    '''
+    Razón de tiempos (actual / base) de los casos comunes. Menor a 1 es una mejora.
+    '''
+    anteriores = {_llave(r): r for r in base['casos']}
+    filas = []
+    for resultado in resultados['casos']:
+        anterior = anteriores.get(_llave(resultado))
+        if anterior is not None:
+            filas.append({'grupo': resultado['grupo'], 'nombre': resultado['nombre'], 'parametros': resultado['parametros'],
+                          'razon_tiempo': resultado['segundos_mediana'] / anterior['segundos_mediana'],
+                          'razon_memoria': resultado['pico_memoria_mb'] / max(anterior['pico_memoria_mb'], 1e-9)})
+    return filas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks de los simuladores y del procesamiento de datos')
+    parser.add_argument('--grupos', nargs='*', default=list(GRUPOS), choices=list(GRUPOS))
+    parser.add_argument('--rapido', action='store_true', help='tamaños reducidos (para verificar la suite)')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--salida', default=None, help='archivo JSON de resultados')
+    parser.add_argument('--compara', default=None, help='JSON de una corrida anterior')
+    args = parser.parse_args(argv)
+
+    tamanos = TAMANOS_RAPIDOS if args.rapido else TAMANOS
+    resultados = {'meta': metadatos(), 'casos': []}
+
+    for grupo in args.grupos:
+        for caso in GRUPOS[grupo](tamanos[grupo]):
+            resultado = mide(caso, args.repeticiones)
+            resultados['casos'].append(resultado)
+            print('{:<12} {:<26} {:<50} {:>10.4f} s {:>14.4g} {:<16} {:>9.1f} MB'.format(
+                grupo, caso.nombre, json.dumps(caso.parametros, ensure_ascii=False), resultado['segundos_mediana'],
+                resultado['throughput'], resultado['unidad'], resultado['pico_memoria_mb']), flush=True)
+
+    if args.salida is not None:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+
+    if args.compara is not None:
+        with open(args.compara, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        for fila in compara(resultados, base):
+            print('{:<12} {:<26} {:<50} tiempo x{:.2f}  memoria x{:.2f}'.format(
+                fila['grupo'], fila['nombre'], json.dumps(fila['parametros'], ensure_ascii=False),
+                fila['razon_tiempo'], fila['razon_memoria']))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
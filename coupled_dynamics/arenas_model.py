@@ -45,7 +45,7 @@ def iterate_model(x0, T, params, ext_params):
 
     # Read parameters
     β = params[0]
-    kg = params[1]#[1]
+    kg = np.array(params[1], dtype=np.float64) # copy: containment changes kg in place
     ηg = params[2]
     αg = params[3]#[1]
     ν  = params[4]
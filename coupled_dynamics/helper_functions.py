@@ -1,4 +1,5 @@
 ## Helper functions for the Arenas et al model [1,2]
+# The mobility matrix R_ij is only used through `R_ij @ x`, so it can be a dense array or a scipy.sparse matrix.
 
 import numpy as np
 
@@ -50,13 +51,13 @@ def get_n_i_eff(n_ig, R_ij, pg):
     except:
         pg = np.array([pg])
 
-    return np.dot( np.dot( R_ij, n_ig ), pg ) + np.dot( n_ig, 1 - pg )
+    return np.dot( R_ij @ n_ig, pg ) + np.dot( n_ig, 1 - pg )
 
 def get_n_ig_eff(n_ig, R_ij, pg):
     '''
     Returns the effective population matrix per patch per age strata considering the mobility patterns of the model.
     '''
-    return (1 - pg) * n_ig  +  pg *  np.dot( R_ij, n_ig )
+    return (1 - pg) * n_ig  +  pg *  ( R_ij @ n_ig )
 
 # densities
 def get_ρ_ig_eff(ρ_ig, n_ig, n_ig_eff, R_ij, C_gh, pg, one_minus_pg):
@@ -72,7 +73,7 @@ def get_ρ_ig_no_coupling(ρ_ig, n_ig, R_ij, pg, one_minus_pg):
     `ρ_ig`: population density matrix of a given compartiment.
     '''
     nρ_ig = n_ig * ρ_ig
-    return one_minus_pg * nρ_ig  +  pg * np.dot( R_ij, nρ_ig  )
+    return one_minus_pg * nρ_ig  +  pg * ( R_ij @ nρ_ig )
 
 
 def Q_ig(zk_g, f_i, ρ_ig_eff):
@@ -94,7 +95,7 @@ def Π_ig( P_t, R_ij, pg, one_minus_pg ):
     Returns the probability of infection per patch per age strata per day considering the effective mobility patterns.
     The output is an NPxNG matrix.
     '''
-    return one_minus_pg * P_t  +  pg *  np.dot( R_ij, P_t )
+    return one_minus_pg * P_t  +  pg *  ( R_ij @ P_t )
 
 
 ## Use this when running the aggregate one-dimensional model
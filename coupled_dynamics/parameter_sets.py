@@ -0,0 +1,85 @@
+## Structured, immutable parameter set for the coupled Arenas model (arenas_model.py in this folder).
+# It behaves like the legacy 20-slot list (params[0], params[-2], list(params), ...), so it can be passed
+# directly to `iterate_model`. Array entries (kg, n_ig, R_ij, C_gh, ...) are stored as read-only copies.
+
+from collections import namedtuple
+
+import numpy as np
+
+# Slot names in the order used by `iterate_model`
+COUPLED_FIELDS = ('β', 'kg', 'ηg', 'αg', 'ν', 'μg', 'γg', 'ωg', 'ψg', 'χg', 'n_ig', 'R_ij', 'C_gh', 'ξ', 'pg', 'σ', 'κ0', 'ϕ', 'tc', 'tf')
+
+
+def _freeze(value):
+    '''
+    Read-only copy of array values (R_ij may also be a scipy.sparse matrix); scalars are returned as floats.
+    '''
+    if hasattr(value, 'tocsr'):
+        value = value.tocsr(copy=True)
+        for array in (value.data, value.indices, value.indptr):
+            array.setflags(write=False)
+        return value
+    if np.ndim(value) == 0:
+        return float(value)
+    value = np.array(value, dtype=np.float64)
+    value.setflags(write=False)
+    return value
+
+
+def _key(value):
+    '''
+    Hashable key of a field value (arrays by shape and content).
+    '''
+    if isinstance(value, np.ndarray):
+        return (value.shape, value.tobytes())
+    if hasattr(value, 'tocsr'):
+        return (value.shape, value.data.tobytes(), value.indices.tobytes(), value.indptr.tobytes())
+    return value
+
+
+class CoupledParams(namedtuple('CoupledParams', COUPLED_FIELDS)):
+    '''
+    Frozen, hashable record with one parameter set of the coupled model.
+    Fields are accessible by name (`p.R_ij`) or by legacy slot (`p[11]`).
+
+    Use `replace` instead of assigning to a slot:
+        params = CoupledParams.from_list(params).replace(tc=10, tf=10)
+    '''
+    __slots__ = ()
+
+    def __new__(cls, *values, **named):
+        record = super().__new__(cls, *values, **named)
+        return super().__new__(cls, *[_freeze(value) for value in record])
+
+    @classmethod
+    def from_list(cls, params):
+        '''
+        Builds the record from a legacy 20-slot list.
+        '''
+        if len(params) != len(COUPLED_FIELDS):
+            raise ValueError('Expected {} parameters, got {}'.format(len(COUPLED_FIELDS), len(params)))
+        return cls(*params)
+
+    def to_list(self):
+        '''
+        Legacy (mutable) 20-slot list. Array entries are writable copies.
+        '''
+        return [value.copy() if hasattr(value, 'copy') else value for value in self]
+
+    def replace(self, **changes):
+        '''
+        New record with the given fields changed.
+        '''
+        return self._replace(**changes)
+
+    def _replace(self, **changes):
+        return CoupledParams(*[changes.get(name, value) for (name, value) in zip(COUPLED_FIELDS, self)])
+
+    def __hash__(self):
+        return hash(tuple(_key(value) for value in self))
+
+    def __eq__(self, other):
+        return isinstance(other, CoupledParams) and all(_key(a) == _key(b) for (a, b) in zip(self, other))
+
+    def __ne__(self, other):
+        return not self == other
@@ -4,6 +4,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from arenas_model import *
+from parameter_sets import CoupledParams
 
 if __name__ == '__main__':
 
@@ -36,9 +37,8 @@ if __name__ == '__main__':
 
     ## Containtment parameters
     tc = 10
-    params[-2] = tc
     tf = 10
-    params[-1] = tf
+    params = CoupledParams.from_list(params).replace(tc=tc, tf=tf)
 
     ##--PRECOMPUTE ADDITIONAL PARAMETERS--##
 
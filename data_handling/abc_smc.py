@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo hace la calibración bayesiana aproximada (ABC-SMC) del modelo para uno o varios estados.
+
+    Se usa el esquema de Monte Carlo de población adaptativo de Lenormand et al. (2013):
+        1. Se muestrean `n_particulas` de la distribución previa y se simulan todas en lote.
+        2. La tolerancia ε de cada generación es el cuantil `alfa` de las distancias; se conservan las partículas por debajo.
+        3. Se proponen nuevas partículas perturbando las conservadas con un kernel normal (covarianza 2Σ ponderada),
+           se simulan en lote, se ponderan por previa / densidad de propuesta y se juntan con las conservadas.
+        4. Se repite hasta que la fracción de propuestas aceptadas baje de `p_aceptacion_min`.
+
+    Las variables calibradas son β, k, γ y las latentes (E0, A0, I0, Rᴵ0, Rᴴ0), con previas uniformes.
+    Internamente se trabaja en el cubo unitario de la previa para que el kernel no dependa de las escalas.
+    La distancia es el RMSE de hospitalizados y fallecidos, igual que en `correccion_x0_latentes`.
+'''
+
+import os
+import traceback
+import numpy as np
+import pandas as pd
+import scipy.linalg
+import scipy.special
+from concurrent.futures import ProcessPoolExecutor
+
+from data_handling.panel import get_panel
+from data_handling.initial_conditions import COLUMNAS_AJUSTE, _datos_ajuste
+from data_handling.pipeline import get_params_tabla
+from arenas_model import iterate_model_batch
+
+# Variables calibradas y su posición en params (β, k, γ) o en x0 (latentes)
+VARIABLES = ['β', 'k', 'γ', 'E0', 'A0', 'I0', 'Rᴵ0', 'Rᴴ0']
+INDICES_PARAMS = [0, 1, 6]
+INDICES_LATENTES = [1, 2, 3, 5, 6]
+
+# Panel de solo lectura de cada proceso del pool
+_panel = None
+
+
+def get_previa(params, x0, escala=10, k_max=30):
+    '''
+    Previa uniforme por default alrededor de una calibración puntual (p. ej. la de `calibra_estado`).
+
+    Inputs:
+        - params: parámetros del modelo
+        - x0: condiciones iniciales
+        - escala=10: las latentes van de 0 a `escala` veces su valor puntual (o `escala` personas si es nulo)
+        - k_max=30: cota superior de k
+
+    Output:
+        - previa: diccionario variable → (mínimo, máximo)
+    '''
+
+    N = float(params[11])
+    β, k, γ = [float(params[i]) for i in INDICES_PARAMS]
+
+    previa = {'β': (β / 2, min(2 * β, 1.)),
+              'k': (1., max(k_max, 2 * k)),
+              'γ': (γ / 2, min(2 * γ, 1.))}
+    for (nombre, i) in zip(VARIABLES[3:], INDICES_LATENTES):
+        previa[nombre] = (0., escala * max(float(x0[i]), 1 / N))
+
+    return previa
+
+
+def get_distancia_lote(data, params, tamano_lote=20000):
+    '''
+    Distancia (RMSE) entre los datos y el modelo para un lote de partículas (β, k, γ, E0, A0, I0, Rᴵ0, Rᴴ0).
+
+    Inputs:
+        - data: DataFrame o arreglo (T+1, 2) con hospitalizados y fallecidos acumulados
+        - params: parámetros del modelo (los de las partículas se reemplazan)
+        - tamano_lote=20000: partículas por llamada a `iterate_model_batch` (acota la memoria)
+
+    Output:
+        - distancia: función de un arreglo (B, 8) que regresa el arreglo (B,) de RMSE (inf si x0 no es factible)
+    '''
+
+    hospitalizados, fallecidos = _datos_ajuste(data)
+    hospitalizados_vivos = hospitalizados - fallecidos
+    N = float(params[11])
+    T = len(fallecidos) - 1
+    D0 = fallecidos[0] / N
+    H0_total = hospitalizados[0] / N - D0
+
+    def distancia(θ):
+        θ = np.atleast_2d(θ)
+        rmse = np.full(len(θ), np.inf)
+
+        for inicio in range(0, len(θ), tamano_lote):
+            lote = θ[inicio:inicio + tamano_lote]
+            E0, A0, I0, Rᴵ0, Rᴴ0 = lote[:, 3:].T
+            H0 = H0_total - Rᴴ0
+            S0 = 1 - E0 - A0 - I0 - H0 - Rᴵ0 - Rᴴ0 - D0
+            x0 = np.column_stack([S0, E0, A0, I0, H0, Rᴵ0, Rᴴ0, np.full_like(S0, D0)])
+
+            factibles = (x0 >= 0).all(axis=1)
+            if not factibles.any():
+                continue
+
+            params_lote = list(params)
+            for (j, i) in enumerate(INDICES_PARAMS):
+                params_lote[i] = lote[factibles, j]
+
+            flow = iterate_model_batch(x0[factibles], T, params_lote) * N
+            error = (np.square(fallecidos[:, None] - flow[:, :, 7]).sum(axis=0)
+                     + np.square(hospitalizados_vivos[:, None] - flow[:, :, 4] - flow[:, :, 6]).sum(axis=0))
+            rmse[inicio + np.flatnonzero(factibles)] = np.sqrt(error / (T + 1))
+
+        return rmse
+
+    return distancia
+
+
+def _log_densidad_propuesta(u, centros, log_pesos, L, tamano_bloque=256):
+    '''
+    Logaritmo de la densidad de la mezcla normal Σ_j w_j φ(u - centros_j; LLᵀ) en cada fila de `u`, por bloques.
+    '''
+
+    # Coordenadas blanqueadas: la distancia de Mahalanobis es la euclidiana
+    z = scipy.linalg.solve_triangular(L, u.T, lower=True).T
+    z_c = scipy.linalg.solve_triangular(L, centros.T, lower=True).T
+    norma_c = np.square(z_c).sum(axis=1)
+    log_normal = -np.log(np.diag(L)).sum() - len(L) / 2 * np.log(2 * np.pi)
+
+    log_q = np.empty(len(u))
+    for inicio in range(0, len(u), tamano_bloque):
+        bloque = z[inicio:inicio + tamano_bloque]
+        maha = np.square(bloque).sum(axis=1)[:, None] + norma_c[None, :] - 2 * bloque @ z_c.T
+        log_q[inicio:inicio + tamano_bloque] = scipy.special.logsumexp(log_pesos[None, :] - maha / 2, axis=1)
+
+    return log_q + log_normal
+
+
+def _covarianza_kernel(u, log_pesos):
+    '''
+    Factor de Cholesky de dos veces la covarianza ponderada de la población (kernel de Beaumont et al. 2009).
+    '''
+    pesos = np.exp(log_pesos - scipy.special.logsumexp(log_pesos))
+    Σ = 2 * np.cov(u, rowvar=False, aweights=pesos)
+    # Las variables sin dispersión (p. ej. una latente que se fue a cero) no deben hacer singular al kernel
+    Σ += 1e-12 * np.eye(len(Σ))
+    return np.linalg.cholesky(Σ)
+
+
+def abc_smc(data, params, x0, previa=None, n_particulas=10000, alfa=0.5, p_aceptacion_min=0.02,
+            max_generaciones=50, tamano_lote=20000, semilla=None):
+    '''
+    Calibración ABC-SMC de β, k, γ y las latentes para los datos `data`.
+
+    Inputs:
+        - data: DataFrame o arreglo (T+1, 2) con hospitalizados y fallecidos acumulados desde t0
+        - params: parámetros del modelo (los no calibrados quedan fijos)
+        - x0: condiciones iniciales puntuales (para la previa por default)
+        - previa=None: diccionario variable → (mínimo, máximo). Por default, `get_previa(params, x0)`
+        - n_particulas=10000: partículas por generación
+        - alfa=0.5: fracción de partículas que se conservan en cada generación (define la tolerancia)
+        - p_aceptacion_min=0.02: se detiene cuando la fracción de propuestas aceptadas es menor
+        - max_generaciones=50: número máximo de generaciones
+        - tamano_lote=20000: partículas por llamada al simulador
+        - semilla=None: semilla (o SeedSequence) del generador aleatorio
+
+    Output:
+        - posterior: DataFrame con las partículas finales (columnas de VARIABLES), su 'peso' normalizado y su 'distancia'
+        - historia: DataFrame por generación con la tolerancia 'epsilon', 'p_aceptacion' y las 'simulaciones' acumuladas
+    '''
+
+    if previa is None:
+        previa = get_previa(params, x0)
+    lo = np.array([previa[nombre][0] for nombre in VARIABLES], dtype=np.float64)
+    hi = np.array([previa[nombre][1] for nombre in VARIABLES], dtype=np.float64)
+
+    rng = np.random.default_rng(semilla)
+    distancia_lote = get_distancia_lote(data, params, tamano_lote=tamano_lote)
+
+    def distancia(u):
+        return distancia_lote(lo + u * (hi - lo))
+
+    n_conservadas = int(alfa * n_particulas)
+    n_nuevas = n_particulas - n_conservadas
+
+    # Generación 0: muestra de la previa (uniforme en el cubo unitario)
+    u = rng.random((n_particulas, len(VARIABLES)))
+    d = distancia(u)
+    log_pesos = np.zeros(n_particulas)
+    simulaciones = n_particulas
+
+    historia = []
+    p_aceptacion = 1.
+    for generacion in range(max_generaciones):
+        # Tolerancia adaptativa: cuantil alfa de las distancias de la población
+        orden = np.argsort(d, kind='stable')[:n_conservadas]
+        ε = d[orden[-1]]
+        u, d, log_pesos = u[orden], d[orden], log_pesos[orden]
+        historia.append({'generacion': generacion, 'epsilon': ε, 'p_aceptacion': p_aceptacion, 'simulaciones': simulaciones})
+
+        if p_aceptacion < p_aceptacion_min or generacion == max_generaciones - 1:
+            break
+
+        # Propuestas: partículas conservadas elegidas por peso y perturbadas con el kernel normal,
+        # truncadas al soporte de la previa
+        L = _covarianza_kernel(u, log_pesos)
+        probabilidades = np.exp(log_pesos - scipy.special.logsumexp(log_pesos))
+        nuevas = np.empty((0, len(VARIABLES)))
+        while len(nuevas) < n_nuevas:
+            padres = rng.choice(n_conservadas, size=n_nuevas, p=probabilidades)
+            candidatas = u[padres] + rng.standard_normal((n_nuevas, len(VARIABLES))) @ L.T
+            dentro = ((candidatas >= 0) & (candidatas <= 1)).all(axis=1)
+            nuevas = np.vstack([nuevas, candidatas[dentro]])
+        nuevas = nuevas[:n_nuevas]
+
+        d_nuevas = distancia(nuevas)
+        simulaciones += n_nuevas
+
+        # Peso de importancia: previa (constante en el cubo) entre la densidad de la propuesta
+        log_pesos_nuevas = -_log_densidad_propuesta(nuevas, u, log_pesos - scipy.special.logsumexp(log_pesos), L)
+
+        p_aceptacion = np.mean(d_nuevas < ε)
+
+        u = np.vstack([u, nuevas])
+        d = np.concatenate([d, d_nuevas])
+        log_pesos = np.concatenate([log_pesos, log_pesos_nuevas])
+
+    pesos = np.exp(log_pesos - scipy.special.logsumexp(log_pesos))
+    posterior = pd.DataFrame(lo + u * (hi - lo), columns=VARIABLES)
+    posterior['peso'] = pesos
+    posterior['distancia'] = d
+
+    return posterior, pd.DataFrame(historia)
+
+
+def abc_smc_estado(series, estado, params, x0, t0, t_fit=20, **opciones):
+    '''
+    Calibración ABC-SMC de `estado` con los datos de t0 a t0 + t_fit.
+
+    Inputs:
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
+        - estado: entidad federativa (o 'Nacional')
+        - params, x0: calibración puntual del estado (p. ej. de `get_params_tabla`)
+        - t0: fecha inicial del ajuste
+        - t_fit=20: días de ajuste desde t0
+        - **opciones: argumentos de `abc_smc`
+
+    Output:
+        - posterior, historia: como en `abc_smc`
+    '''
+
+    panel = get_panel(series)
+    d0 = panel.dia(t0)
+    data = panel.ventana(estado, d0, d0 + t_fit, COLUMNAS_AJUSTE)
+    return abc_smc(data, params, x0, **opciones)
+
+
+def _inicializa(panel):
+    global _panel
+    _panel = panel
+
+
+def _abc_smc(tarea):
+    '''
+    ABC-SMC de un estado con el panel del proceso. Las excepciones se regresan como parte del resultado.
+    '''
+    estado, params, x0, t0, semilla, opciones = tarea
+    try:
+        posterior, historia = abc_smc_estado(_panel, estado, params, x0, t0, semilla=semilla, **opciones)
+        return estado, posterior, historia, None
+    except Exception as e:
+        return estado, None, None, '{}: {}\n{}'.format(type(e).__name__, e, traceback.format_exc())
+
+
+def abc_smc_estados(series, tabla, estados=None, n_procesos=None, semilla=None, **opciones):
+    '''
+    Calibración ABC-SMC de varias entidades en paralelo, a partir de la tabla de calibraciones puntuales.
+
+    Inputs:
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
+        - tabla: DataFrame de `calibra_estados` (da t0, los parámetros y las condiciones iniciales de cada estado)
+        - estados=None: lista de entidades. Por default, todas las de la tabla que se calibraron sin error.
+        - n_procesos=None: número de procesos. Por default, los núcleos disponibles. Con 1 se corre en serie.
+        - semilla=None: semilla global; cada estado recibe una subsemilla independiente
+        - **opciones: argumentos de `abc_smc_estado` y `abc_smc` (t_fit, n_particulas, alfa, ...)
+
+    Output:
+        - posterior: DataFrame con las partículas de todos los estados (columna 'estado')
+        - historia: DataFrame con las generaciones de todos los estados (columna 'estado'). Los estados que fallaron
+          aparecen con una sola fila con la columna 'excepcion'.
+    '''
+
+    panel = get_panel(series)
+
+    if estados is None:
+        estados = [estado for estado in tabla.index if pd.isna(tabla.loc[estado, 'excepcion'])]
+
+    semillas = np.random.SeedSequence(semilla).spawn(len(estados))
+    tareas = []
+    for (estado, semilla_estado) in zip(estados, semillas):
+        params, x0 = get_params_tabla(tabla, estado)
+        tareas.append((estado, params, x0, tabla.loc[estado, 't0'], semilla_estado, opciones))
+
+    if n_procesos is None:
+        n_procesos = os.cpu_count() or 1
+    n_procesos = max(1, min(n_procesos, len(tareas)))
+
+    if n_procesos == 1:
+        _inicializa(panel)
+        resultados = [_abc_smc(tarea) for tarea in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializa, initargs=(panel,)) as pool:
+            resultados = list(pool.map(_abc_smc, tareas))
+
+    posteriores, historias = [], []
+    for (estado, posterior, historia, excepcion) in resultados:
+        if excepcion is None:
+            posteriores.append(posterior.assign(estado=estado))
+            historias.append(historia.assign(estado=estado, excepcion=None))
+        else:
+            historias.append(pd.DataFrame([{'estado': estado, 'excepcion': excepcion}]))
+
+    posterior = pd.concat(posteriores, ignore_index=True) if posteriores else pd.DataFrame(columns=VARIABLES + ['peso', 'distancia', 'estado'])
+    return posterior, pd.concat(historias, ignore_index=True)
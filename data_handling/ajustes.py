@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo guarda en disco las calibraciones de cada estado para reutilizarlas como punto de arranque.
+
+    Cada registro se identifica por (estado, fecha de corte de los datos, t0, versión de parámetros) y guarda
+    las latentes ajustadas, las condiciones iniciales, el vector de parámetros y el diagnóstico del optimizador.
+    Al recalibrar con datos de un corte nuevo, el ajuste arranca del registro compatible más reciente
+    (mismo estado, mismo t0, misma versión y corte anterior o igual).
+
+    La versión de parámetros por default es un hash de `get_params_arenas()`: si cambian los parámetros de la
+    literatura, los ajustes anteriores dejan de ser compatibles.
+'''
+
+import os
+import pickle
+import hashlib
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from data_handling.parameters import get_params_arenas
+
+PATH_AJUSTES = './data/cache/ajustes.pkl'
+
+# Columnas de la tabla de registros
+COLUMNAS = ['estado', 'fecha_corte', 't0', 'version', 'latentes', 'x0', 'params', 'tasa', 'error',
+            'iteraciones', 'evaluaciones', 'metodo', 'arranque', 'guardado']
+
+
+def version_parametros(params=None):
+    '''
+    Hash corto de un vector de parámetros (por default, los de `get_params_arenas`).
+    '''
+    if params is None:
+        params = get_params_arenas()
+    texto = ','.join('{:.12g}'.format(float(p)) for p in params)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:10]
+
+
+class AlmacenAjustes:
+    '''
+    Almacén local de calibraciones: un DataFrame con un registro por llave (estado, fecha_corte, t0, version),
+    persistido con escritura atómica. Las lecturas recargan el archivo si otro proceso lo modificó.
+    '''
+
+    def __init__(self, path=PATH_AJUSTES):
+        self.path = path
+        self._mtime = None
+        self._tabla = pd.DataFrame(columns=COLUMNAS)
+
+    def _carga(self):
+        if not os.path.exists(self.path):
+            return
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'rb') as archivo:
+                    self._tabla = pickle.load(archivo)
+                self._mtime = mtime
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+
+    def tabla(self):
+        '''
+        Todos los registros, ordenados por estado y fecha de corte.
+        '''
+        self._carga()
+        return self._tabla.sort_values(['estado', 'fecha_corte']).reset_index(drop=True)
+
+    def guarda(self, registros):
+        '''
+        Agrega (o reemplaza, si la llave ya existe) uno o varios registros y reescribe el archivo.
+
+        Inputs:
+            - registros: diccionario o lista de diccionarios con las columnas de COLUMNAS
+        '''
+
+        if isinstance(registros, dict):
+            registros = [registros]
+        if not registros:
+            return
+        nuevos = pd.DataFrame([{columna: registro.get(columna) for columna in COLUMNAS} for registro in registros])
+        nuevos['guardado'] = nuevos['guardado'].fillna(pd.Timestamp(dt.datetime.now()))
+        for columna in ['fecha_corte', 't0']:
+            nuevos[columna] = pd.to_datetime(nuevos[columna])
+
+        self._carga()
+        tabla = pd.concat([self._tabla, nuevos], ignore_index=True)
+        tabla = tabla.drop_duplicates(subset=['estado', 'fecha_corte', 't0', 'version'], keep='last').reset_index(drop=True)
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Escritura atómica para que procesos concurrentes no lean un archivo a medias
+        temporal = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temporal, 'wb') as archivo:
+            pickle.dump(tabla, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, self.path)
+
+        self._tabla = tabla
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def busca(self, estado, t0, fecha_corte=None, version=None):
+        '''
+        Registro compatible más reciente: mismo estado, t0 y versión, con corte anterior o igual a `fecha_corte`.
+
+        Inputs:
+            - estado: entidad federativa
+            - t0: fecha inicial del ajuste
+            - fecha_corte=None: corte de los datos actuales. Por default, cualquiera.
+            - version=None: versión de parámetros. Por default, `version_parametros()`.
+
+        Output:
+            - registro: diccionario con las columnas de COLUMNAS, o None si no hay registro compatible
+        '''
+
+        if version is None:
+            version = version_parametros()
+
+        self._carga()
+        tabla = self._tabla
+        if len(tabla) == 0:
+            return None
+
+        compatibles = (tabla['estado'] == estado) & (tabla['t0'] == pd.Timestamp(t0)) & (tabla['version'] == version)
+        if fecha_corte is not None:
+            compatibles &= tabla['fecha_corte'] <= pd.Timestamp(fecha_corte)
+        if not compatibles.any():
+            return None
+
+        return tabla[compatibles].sort_values(['fecha_corte', 'guardado']).iloc[-1].to_dict()
+
+
+def get_registro_ajuste(resultado, fecha_corte, version=None):
+    '''
+    Registro del almacén a partir de un resultado de `calibra_estado`.
+    '''
+
+    x0 = np.asarray(resultado['x0'], dtype=np.float64)
+    diagnostico = resultado.get('diagnostico', {})
+    return {'estado': resultado['estado'],
+            'fecha_corte': fecha_corte,
+            't0': resultado['t0'],
+            'version': version_parametros() if version is None else version,
+            'latentes': x0[[1, 2, 3, 5, 6]],
+            'x0': x0,
+            'params': [float(p) for p in resultado['params']],
+            'tasa': resultado.get('tasa'),
+            'error': resultado.get('error'),
+            'iteraciones': diagnostico.get('iteraciones'),
+            'evaluaciones': diagnostico.get('evaluaciones'),
+            'metodo': diagnostico.get('metodo'),
+            'arranque': diagnostico.get('arranque')}
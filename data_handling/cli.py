@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+'''
+    Línea de comandos del flujo completo: datos abiertos → panel de series → calibración → pronósticos.
+
+    Subcomandos:
+        ingesta     lee un corte de los datos abiertos (descarga por fecha o archivo local) y lo guarda en el caché
+        panel       arma el panel de series por estado (`series_panel_por_estado`) de un corte
+        calibra     calibra los estados seleccionados (o todos) en paralelo (`calibra_estados`)
+        pronostica  simula escenarios de contención con las calibraciones (`iterate_model_batch`, todos a la vez)
+        reporta     figuras por estado y escenario, dibujadas en paralelo sin interfaz gráfica (ver data_handling.reportes)
+        sirve       servicio HTTP local de consultas de escenarios (ver data_handling.servicio)
+
+    Cada paso guarda su resultado en el directorio de caché (--cache) junto con un archivo .json con la llave de sus
+    entradas (archivo de origen, opciones, versión de parámetros). Una invocación posterior reutiliza el artefacto
+    si la llave coincide y lo recalcula si cambió; los pasos previos que falten se construyen solos (salvo la ingesta).
+    Con --forzar se recalcula todo.
+
+    Uso:
+        python -m data_handling.cli ingesta --archivo datos_abiertos_20200509.zip
+        python -m data_handling.cli panel --salida series.csv
+        python -m data_handling.cli calibra --estados JALISCO PUEBLA --procesos 4 --salida calibracion.json
+        python -m data_handling.cli pronostica --dias 60 --tc 10 20 --tf 30 --salida pronostico.csv
+        python -m data_handling.cli reporta --dias 60 --tc 10 --tf 30 --directorio reportes
+
+    Con --perfil perfil.json se enciende la instrumentación (ver data_handling.instrumentacion) y se exporta al
+    terminar (formato "collapsed" si el archivo termina en .txt).
+'''
+
+import os
+import sys
+import glob
+import json
+import pickle
+import hashlib
+import argparse
+import datetime as dt
+
+PATH_CACHE = './data/cache'
+
+# Formatos de salida por extensión
+FORMATOS = {'.csv': 'csv', '.json': 'json', '.pkl': 'pickle', '.pickle': 'pickle'}
+
+
+## ARTEFACTOS
+
+def get_llave(**entradas):
+    '''
+    Llave corta de un conjunto de entradas (serializables en JSON).
+    '''
+    texto = json.dumps(entradas, sort_keys=True, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:12]
+
+
+def _lee_meta(path):
+    try:
+        with open(path + '.json', encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def artefacto(path, llave, construye, forzar=False, entradas=None):
+    '''
+    Carga el artefacto `path` si su llave coincide con `llave`; si no, lo construye con `construye()` y lo guarda.
+
+    Inputs:
+        - path: archivo pickle del artefacto. Su llave se guarda en `path + '.json'`.
+        - llave: llave de las entradas (ver `get_llave`)
+        - construye: función sin argumentos que calcula el artefacto
+        - forzar=False: recalcula aunque la llave coincida
+        - entradas=None: diccionario que se guarda junto a la llave (informativo)
+
+    Output:
+        - valor del artefacto
+    '''
+
+    meta = _lee_meta(path)
+    if not forzar and meta is not None and meta.get('llave') == llave and os.path.exists(path):
+        print('Reutilizando {}'.format(path))
+        with open(path, 'rb') as archivo:
+            return pickle.load(archivo)
+
+    valor = construye()
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Escritura atómica: primero el artefacto y al final su llave
+    temporal = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporal, 'wb') as archivo:
+        pickle.dump(valor, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporal, path)
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump({'llave': llave, 'creado': dt.datetime.now().isoformat(timespec='seconds'), 'entradas': entradas or {}},
+                  archivo, indent=2, ensure_ascii=False, default=str)
+    os.replace(temporal, path + '.json')
+    print('Guardado {}'.format(path))
+
+    return valor
+
+
+def escribe_salida(tabla, path, formato=None):
+    '''
+    Escribe un DataFrame en csv, json o pickle (por default, según la extensión de `path`).
+    '''
+    if formato is None:
+        formato = FORMATOS.get(os.path.splitext(path)[1].lower(), 'csv')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if formato == 'csv':
+        tabla.to_csv(path)
+    elif formato == 'json':
+        tabla.reset_index().to_json(path, orient='records', date_format='iso', force_ascii=False, indent=1)
+    elif formato == 'pickle':
+        tabla.to_pickle(path)
+    else:
+        raise ValueError('Formato desconocido: {}'.format(formato))
+    print('Escrito {}'.format(path))
+
+
+def _path_cache(args, nombre):
+    return os.path.join(args.cache, nombre)
+
+
+def _ultimo_corte(args):
+    '''
+    Corte ingerido más reciente del caché.
+    '''
+    cortes = sorted(os.path.basename(path)[len('datos_abiertos_'):-len('.pkl')]
+                    for path in glob.glob(_path_cache(args, 'datos_abiertos_*.pkl')))
+    if not cortes:
+        raise SystemExit('No hay cortes en {}: corre primero `ingesta`.'.format(args.cache))
+    return cortes[-1]
+
+
+## PASOS
+
+def ingesta(args):
+    '''
+    Datos abiertos del corte `args.corte` (de `args.archivo` o descargados por `args.fecha`).
+    '''
+    import pandas as pd
+    from data_handling import data_reading
+
+    if args.archivo is not None:
+        origen = os.path.abspath(args.archivo)
+        estado_origen = os.stat(origen)
+        entradas = {'archivo': origen, 'tamano': estado_origen.st_size, 'mtime': estado_origen.st_mtime_ns}
+        construye = lambda: pd.read_csv(origen, low_memory=False)
+        corte = args.corte or os.path.basename(origen).split('.')[0].split('_')[-1]
+    else:
+        if args.fecha is None:
+            raise SystemExit('ingesta necesita --archivo o --fecha.')
+        entradas = {'fecha': args.fecha}
+        construye = lambda: data_reading.main(args.fecha)
+        corte = args.corte or args.fecha
+
+    path = _path_cache(args, 'datos_abiertos_{}.pkl'.format(corte))
+    datos = artefacto(path, get_llave(**entradas), construye, forzar=args.forzar, entradas=entradas)
+    args.corte = corte
+    return datos
+
+
+def panel(args):
+    '''
+    Panel de series por estado del corte `args.corte` (por default, el último ingerido).
+    '''
+    from data_handling.data_processing import series_panel_por_estado
+
+    corte = args.corte or _ultimo_corte(args)
+    path_datos = _path_cache(args, 'datos_abiertos_{}.pkl'.format(corte))
+    meta = _lee_meta(path_datos)
+    if meta is None:
+        raise SystemExit('No existe el corte {} en {}: corre primero `ingesta`.'.format(corte, args.cache))
+
+    def construye():
+        with open(path_datos, 'rb') as archivo:
+            return series_panel_por_estado(pickle.load(archivo))
+
+    path = _path_cache(args, 'series_{}.pkl'.format(corte))
+    series = artefacto(path, get_llave(datos=meta['llave']), construye, forzar=args.forzar, entradas={'corte': corte})
+    args.corte = corte
+
+    if getattr(args, 'salida', None) and args.comando == 'panel':
+        escribe_salida(series, args.salida, args.formato)
+    return series
+
+
+def _opciones_calibracion(args):
+    return {'umbral': args.umbral, 'umbral_fit': args.umbral_fit, 'm': args.m, 't_fit': args.t_fit,
+            'parametros_nacionales': not args.parametros_estatales, 'method': args.metodo}
+
+
+def calibra(args):
+    '''
+    Tabla de calibración de los estados seleccionados del corte.
+    '''
+    from data_handling.ajustes import AlmacenAjustes, version_parametros
+    from data_handling.pipeline import calibra_estados
+
+    series = panel(args)
+    meta_series = _lee_meta(_path_cache(args, 'series_{}.pkl'.format(args.corte)))
+    estados = sorted(args.estados) if args.estados else None
+    opciones = _opciones_calibracion(args)
+
+    entradas = {'series': meta_series['llave'], 'estados': estados, 'nacional': not args.sin_nacional,
+                'opciones': opciones, 'version': version_parametros()}
+    llave = get_llave(**entradas)
+
+    def construye():
+        extra = {}
+        if args.almacen:
+            extra['almacen'] = AlmacenAjustes(os.path.join(args.cache, 'ajustes.pkl'))
+        return calibra_estados(series, estados=estados, nacional=not args.sin_nacional, n_procesos=args.procesos,
+                               **opciones, **extra)
+
+    if args.almacen:
+        # El almacén de ajustes hace de caché (arranque tibio) y se actualiza en cada corrida: no se usa el artefacto
+        tabla = construye()
+    else:
+        path = _path_cache(args, 'calibracion_{}_{}.pkl'.format(args.corte, llave[:8]))
+        tabla = artefacto(path, llave, construye, forzar=args.forzar, entradas=entradas)
+
+    fallidos = tabla['excepcion'].dropna()
+    for (estado, excepcion) in fallidos.items():
+        print('La calibración de {} falló: {}'.format(estado, excepcion), file=sys.stderr)
+
+    if args.salida and args.comando == 'calibra':
+        escribe_salida(tabla, args.salida, args.formato)
+    return tabla
+
+
+def _simula(args):
+    '''
+    Simula en un solo lote los estados calibrados × escenarios (tc, tf) hasta `args.dias` después del corte.
+
+    Output:
+        - miembros: lista de (estado, tc, tf, t0) de cada miembro del lote
+        - flow: arreglo (T+1, B, 8) de `iterate_model_batch` (densidades)
+        - lote: parámetros del lote (`ArenasParamsBatch`)
+        - x0: condiciones iniciales (B, 8)
+        - dias: días desde t0 hasta el fin del pronóstico de cada miembro
+    '''
+    import numpy as np
+    import pandas as pd
+    from arenas_model import iterate_model_batch
+    from parameter_sets import ArenasParamsBatch
+    from data_handling.pipeline import get_params_tabla
+
+    tabla = calibra(args)
+    tabla = tabla[tabla['excepcion'].isna()]
+    if len(tabla) == 0:
+        raise SystemExit('No hay calibraciones exitosas para pronosticar.')
+
+    fin = _ultima_fecha(args) + pd.Timedelta(days=args.dias)
+    escenarios = [(tc, tf) for tc in (args.tc or [np.inf]) for tf in (args.tf or [np.inf])]
+
+    # Un solo lote: estados × escenarios, cada miembro con sus parámetros y condiciones iniciales
+    miembros, registros, filas_x0 = [], [], []
+    for estado in tabla.index:
+        params, x0 = get_params_tabla(tabla, estado)
+        for (tc, tf) in escenarios:
+            miembros.append((estado, tc, tf, pd.Timestamp(tabla.loc[estado, 't0'])))
+            registros.append(params.replace(tc=tc, tf=tf))
+            filas_x0.append(x0)
+
+    dias = [(fin - t0).days for (_, _, _, t0) in miembros]
+    lote = ArenasParamsBatch.from_records(registros)
+    x0 = np.array(filas_x0)
+    flow = iterate_model_batch(x0, max(dias), lote)
+    return miembros, flow, lote, x0, dias
+
+
+def _nombre_escenario(args, tc, tf):
+    return '{}:tc={:g},tf={:g}'.format(args.corte, tc, tf)
+
+
+def pronostica(args):
+    '''
+    Trayectorias (en personas) de cada estado calibrado y cada escenario (tc, tf), hasta `args.dias` después del corte.
+    '''
+    import pandas as pd
+    from data_handling.parameters import COMPARTIMENTOS
+
+    miembros, flow, lote, x0, dias_miembros = _simula(args)
+
+    partes = []
+    for (b, (estado, tc, tf, t0)) in enumerate(miembros):
+        dias = dias_miembros[b]
+        parte = pd.DataFrame(flow[:dias + 1, b] * lote[11][b], columns=COMPARTIMENTOS)
+        parte.insert(0, 'Fecha', pd.date_range(t0, periods=dias + 1))
+        parte.insert(0, 'tf', tf)
+        parte.insert(0, 'tc', tc)
+        parte.insert(0, 'estado', estado)
+        partes.append(parte)
+    pronostico = pd.concat(partes, ignore_index=True).set_index(['estado', 'tc', 'tf', 'Fecha'])
+
+    if args.resultados:
+        from data_handling.resultados import AlmacenPronosticos
+        nombres = [_nombre_escenario(args, tc, tf) for (_, tc, tf, _) in miembros]
+        segmento = AlmacenPronosticos(args.resultados).agrega(
+            nombres, [m[0] for m in miembros], flow, lote, x0, [m[3] for m in miembros],
+            dias=dias_miembros, metadatos={'corte': args.corte, 'dias': args.dias})
+        print('Agregado {} a {}'.format(segmento, args.resultados))
+
+    if args.salida:
+        escribe_salida(pronostico, args.salida, args.formato)
+    return pronostico
+
+
+def reporta(args):
+    '''
+    Figuras de cada estado calibrado (y Nacional) y cada escenario en `args.directorio`, dibujadas en paralelo.
+    Con --resultados se grafican las series del almacén de pronósticos en vez de simular.
+    '''
+    from data_handling.reportes import renderiza, trabajos_almacen, trabajos_lote
+
+    if args.resultados:
+        from data_handling.resultados import AlmacenPronosticos
+        trabajos = trabajos_almacen(AlmacenPronosticos(args.resultados), estado=args.estados)
+    else:
+        miembros, flow, lote, _, dias = _simula(args)
+        trabajos = trabajos_lote([m[0] for m in miembros], flow, lote, [m[3] for m in miembros],
+                                 escenario=[_nombre_escenario(args, tc, tf) for (_, tc, tf, _) in miembros], dias=dias)
+
+    paths = renderiza(trabajos, args.directorio, n_procesos=args.procesos, formato=args.formato_figura, dpi=args.dpi)
+    print('Escritas {} figuras en {}'.format(len(paths), args.directorio))
+    return paths
+
+
+def sirve(args):
+    '''
+    Servicio HTTP local de escenarios con las calibraciones del corte (ver data_handling.servicio).
+    '''
+    import asyncio
+    from data_handling.servicio import ServicioEscenarios
+
+    servicio = ServicioEscenarios(calibra(args), ventana=args.ventana_ms / 1000, max_lote=args.max_lote)
+    try:
+        asyncio.run(servicio.sirve(args.host, args.puerto))
+    except KeyboardInterrupt:
+        pass
+
+
+def _ultima_fecha(args):
+    '''
+    Última fecha del panel del corte.
+    '''
+    with open(_path_cache(args, 'series_{}.pkl'.format(args.corte)), 'rb') as archivo:
+        return pickle.load(archivo).index.get_level_values(1).max()
+
+
+## LÍNEA DE COMANDOS
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='python -m data_handling.cli',
+                                     description='Flujo de datos abiertos, calibración y pronósticos del modelo de Arenas')
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument('--cache', default=PATH_CACHE, help='directorio de artefactos intermedios')
+    comunes.add_argument('--corte', default=None, help='etiqueta del corte (por default, el último ingerido)')
+    comunes.add_argument('--forzar', action='store_true', help='recalcula aunque haya artefactos reutilizables')
+    comunes.add_argument('--salida', default=None, help='archivo de resultados')
+    comunes.add_argument('--formato', default=None, choices=['csv', 'json', 'pickle'],
+                         help='formato de --salida (por default, según la extensión)')
+    comunes.add_argument('--perfil', default=None, help='exporta la instrumentación a este archivo (.json o .txt)')
+
+    calibracion = argparse.ArgumentParser(add_help=False)
+    calibracion.add_argument('--estados', nargs='*', default=None, help='entidades (por default, todas)')
+    calibracion.add_argument('--sin-nacional', action='store_true', help='no calibra el agregado Nacional')
+    calibracion.add_argument('--procesos', type=int, default=None, help='procesos del pool (por default, los núcleos)')
+    calibracion.add_argument('--metodo', default='nelder-mead', help="método de ajuste de las latentes ('nelder-mead', 'l-bfgs-b', ...)")
+    calibracion.add_argument('--umbral', type=int, default=30)
+    calibracion.add_argument('--umbral-fit', type=int, default=25)
+    calibracion.add_argument('--m', type=float, default=10, help='multiplicador de subreporte')
+    calibracion.add_argument('--t-fit', type=int, default=20)
+    calibracion.add_argument('--parametros-estatales', action='store_true', help='γ, ω, χᴵ, σ con la serie de cada estado')
+    calibracion.add_argument('--almacen', action='store_true', help='arranque tibio con el almacén de ajustes del caché (que se actualiza; no usa el artefacto de calibración)')
+
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    sub = subparsers.add_parser('ingesta', parents=[comunes], help='lee un corte de datos abiertos')
+    sub.add_argument('--archivo', default=None, help='csv (o .zip/.gz) local de datos abiertos')
+    sub.add_argument('--fecha', default=None, help='fecha AAAAMMDD del corte a descargar')
+    sub.set_defaults(funcion=ingesta)
+
+    sub = subparsers.add_parser('panel', parents=[comunes], help='panel de series por estado')
+    sub.set_defaults(funcion=panel)
+
+    sub = subparsers.add_parser('calibra', parents=[comunes, calibracion], help='calibra los estados')
+    sub.set_defaults(funcion=calibra)
+
+    sub = subparsers.add_parser('pronostica', parents=[comunes, calibracion], help='simula escenarios de contención')
+    sub.add_argument('--dias', type=int, default=30, help='días a pronosticar después del corte')
+    sub.add_argument('--tc', type=float, nargs='*', default=None, help='días desde t0 para la contención (uno o varios)')
+    sub.add_argument('--tf', type=float, nargs='*', default=None, help='días de contención antes de la reactivación (uno o varios)')
+    sub.add_argument('--resultados', default=None, help='almacén de pronósticos (ver data_handling.resultados) al que se agregan')
+    sub.set_defaults(funcion=pronostica)
+
+    sub = subparsers.add_parser('reporta', parents=[comunes, calibracion], help='figuras de los escenarios por estado')
+    sub.add_argument('--dias', type=int, default=30, help='días a pronosticar después del corte')
+    sub.add_argument('--tc', type=float, nargs='*', default=None, help='días desde t0 para la contención (uno o varios)')
+    sub.add_argument('--tf', type=float, nargs='*', default=None, help='días de contención antes de la reactivación (uno o varios)')
+    sub.add_argument('--resultados', default=None, help='grafica las series de este almacén de pronósticos en vez de simular')
+    sub.add_argument('--directorio', default='./reportes', help='directorio de las figuras')
+    sub.add_argument('--formato-figura', default='png', choices=['png', 'svg', 'pdf'])
+    sub.add_argument('--dpi', type=int, default=100)
+    sub.set_defaults(funcion=reporta)
+
+    sub = subparsers.add_parser('sirve', parents=[comunes, calibracion], help='servicio HTTP local de escenarios')
+    sub.add_argument('--host', default='127.0.0.1')
+    sub.add_argument('--puerto', type=int, default=8050)
+    sub.add_argument('--ventana-ms', type=float, default=5, help='espera para juntar consultas en un lote')
+    sub.add_argument('--max-lote', type=int, default=256)
+    sub.set_defaults(funcion=sirve)
+
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    from data_handling import instrumentacion
+    if args.perfil:
+        instrumentacion.activa()
+
+    with instrumentacion.etapa(args.comando):
+        args.funcion(args)
+
+    if args.perfil:
+        if args.perfil.endswith('.txt'):
+            instrumentacion.exporta_flama(args.perfil)
+        else:
+            instrumentacion.exporta_json(args.perfil)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
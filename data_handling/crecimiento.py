@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo calcula tasas de crecimiento log-lineales en ventanas móviles para todos los estados a la vez.
+
+    Para cada ventana de `ventana` días que termina en el día d se ajusta por mínimos cuadrados
+        log y_t = a + λ t
+    en forma cerrada usando sumas acumuladas del panel, sin ajustar un regresor por estado y ventana.
+    Como en `get_fit_param`, la tasa que se reporta es el exponente más uno: y_t = (λ + 1)^t * y_0.
+'''
+
+import numpy as np
+import pandas as pd
+
+from data_handling.panel import get_panel
+
+
+def tasas_moviles(y, ventana=9):
+    '''
+    Tasas de crecimiento (exponente + 1) del ajuste log-lineal en ventanas móviles a lo largo del último eje.
+
+    Inputs:
+        - y: arreglo (..., ND) de series positivas
+        - ventana=9: número de días de cada ajuste
+
+    Output:
+        - tasas: arreglo (..., ND); la entrada d corresponde a la ventana [d - ventana + 1, d].
+          Es NaN si la ventana no está completa o contiene valores no positivos.
+    '''
+
+    y = np.asarray(y, dtype=np.float64)
+    n_dias = y.shape[-1]
+    tasas = np.full(y.shape, np.nan)
+    if n_dias < ventana or ventana < 2:
+        return tasas
+
+    # Las ventanas con ceros o negativos no tienen logaritmo
+    positivo = y > 0
+    log_y = np.log(np.where(positivo, y, 1))
+
+    t = np.arange(n_dias, dtype=np.float64)
+
+    def _suma_movil(z):
+        cumsum = np.cumsum(z, axis=-1)
+        cumsum = np.concatenate([np.zeros(z.shape[:-1] + (1,)), cumsum], axis=-1)
+        return cumsum[..., ventana:] - cumsum[..., :-ventana]
+
+    # Σ y, Σ t·y sobre cada ventana; el inicio de la ventana es s = d - ventana + 1
+    suma_y = _suma_movil(log_y)
+    suma_ty = _suma_movil(t * log_y)
+    s = t[:n_dias - ventana + 1]
+
+    # Con x = t - s: Σ x·y = Σ t·y - s Σ y; Σ (x - x̄)·y = Σ x·y - x̄ Σ y; Σ (x - x̄)² = w (w² - 1) / 12
+    x_media = (ventana - 1) / 2
+    sxx = ventana * (ventana**2 - 1) / 12
+    pendiente = (suma_ty - s * suma_y - x_media * suma_y) / sxx
+
+    completas = _suma_movil(positivo.astype(np.float64)) == ventana
+    tasas[..., ventana - 1:] = np.where(completas, pendiente + 1, np.nan)
+
+    return tasas
+
+
+def tiempos_duplicacion(tasas):
+    '''
+    Tiempo de duplicación de casos (en días) para cada `tasa` de crecimiento. Versión vectorizada de `get_tiempo_duplicacion`.
+    Las tasas menores a uno dan tiempos negativos (tiempos de reducción a la mitad).
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log(2) / np.log(np.asarray(tasas, dtype=np.float64))
+
+
+def get_tasas_crecimiento(series, metrica='hospitalizados_acumulados', ventana=9, nacional=True):
+    '''
+    Tasas de crecimiento diarias de `metrica` para todos los estados y todas las fechas de término de ventana.
+
+    Inputs:
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
+        - metrica='hospitalizados_acumulados': serie a ajustar
+        - ventana=9: número de días de cada ajuste (el mismo que en `get_fit_param`)
+        - nacional=True: agrega la columna 'Nacional'
+
+    Output:
+        - tasas: DataFrame (Fecha × entidad) con la tasa del ajuste de la ventana que termina en cada fecha
+    '''
+
+    panel = get_panel(series)
+    j = panel.ix_metrica[metrica]
+
+    y = panel.datos[:, :, j]
+    columnas = list(panel.entidades)
+    if nacional:
+        y = np.vstack([y, panel.nacional[:, j]])
+        columnas.append('Nacional')
+
+    tasas = tasas_moviles(y, ventana=ventana)
+
+    return pd.DataFrame(tasas.T, index=pd.Index(panel.fechas, name='Fecha'), columns=columnas)
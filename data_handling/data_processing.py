@@ -9,7 +9,12 @@ import numpy as np
 import pandas as pd
 import datetime as dt
 
+# Datos de referencia (catálogos y poblaciones)
+from data_handling.registro import get_registro, PATH_CATALOGOS
+from data_handling.instrumentacion import instrumenta
+
 ## Función principal de procesamiento de datos abiertos
+@instrumenta()
 def series_panel_por_estado(datos_abiertos):
     """
     Genera una tabla de panel con los siguientes datos, donde cada panel es un estado:
@@ -31,56 +36,54 @@ def series_panel_por_estado(datos_abiertos):
     [1]: https://www.gob.mx/salud/documentos/datos_abiertos-abiertos-152127
     """
 
-    df = pd.DataFrame()
-
     datos_abiertos['FECHA_INGRESO'] = pd.to_datetime(datos_abiertos['FECHA_INGRESO'])
     datos_abiertos['FECHA_SINTOMAS'] = pd.to_datetime(datos_abiertos['FECHA_SINTOMAS'])
 
     # Cleaning faulty dates (20200507 had one 1969 date -_-)
     datos_abiertos = datos_abiertos[(datos_abiertos['FECHA_INGRESO'] >= '2020-01-01') & (datos_abiertos['FECHA_SINTOMAS'] >= '2020-01-01')]
 
+    # Solo se cuenta la columna ORIGEN (contar todas las columnas del grupo es mucho más lento)
     pruebas = (datos_abiertos
-              .groupby(['ENTIDAD_UM', 'FECHA_INGRESO'])
-              .count()['ORIGEN'])
+              .groupby(['ENTIDAD_UM', 'FECHA_INGRESO'])['ORIGEN']
+              .count())
 
     confirmados = (datos_abiertos[ (datos_abiertos['RESULTADO'] == 1) ]
-              .groupby(['ENTIDAD_UM', 'FECHA_SINTOMAS']) # 'FECHA_INGRESO'
-              .count()['ORIGEN'])
+              .groupby(['ENTIDAD_UM', 'FECHA_SINTOMAS'])['ORIGEN'] # 'FECHA_INGRESO'
+              .count())
 
     # incluyendo uci
     hospitalizados = (datos_abiertos[ (datos_abiertos['RESULTADO'] == 1) & (datos_abiertos['TIPO_PACIENTE'] == 2) ]
-              .groupby(['ENTIDAD_UM', 'FECHA_INGRESO'])
-              .count()['ORIGEN'])
+              .groupby(['ENTIDAD_UM', 'FECHA_INGRESO'])['ORIGEN']
+              .count())
 
     fallecidos_por_hospitalizacion = (datos_abiertos[ (datos_abiertos['RESULTADO'] == 1) & (datos_abiertos['TIPO_PACIENTE'] == 2) & (datos_abiertos['FECHA_DEF'] != '9999-99-99') ]
-              .groupby(['ENTIDAD_UM', 'FECHA_DEF'])
-              .count()['ORIGEN'])
+              .groupby(['ENTIDAD_UM', 'FECHA_DEF'])['ORIGEN']
+              .count())
 
     fallecidos = (datos_abiertos[ (datos_abiertos['RESULTADO'] == 1) & (datos_abiertos['FECHA_DEF'] != '9999-99-99') ]
-              .groupby(['ENTIDAD_UM', 'FECHA_DEF'])
-              .count()['ORIGEN'])
+              .groupby(['ENTIDAD_UM', 'FECHA_DEF'])['ORIGEN']
+              .count())
 
     # Convierte las fechas de defunción de str a fecha
-    fallecidos.index.set_levels( pd.to_datetime(fallecidos.index.levels[1]), level=1, inplace=True )
-    fallecidos_por_hospitalizacion.index.set_levels( pd.to_datetime(fallecidos_por_hospitalizacion.index.levels[1]), level=1, inplace=True )
-
-
-    df.loc[:,'pruebas_diarias']                        = pruebas
-    df.loc[:,'confirmados_diarios']                    = confirmados
-    df.loc[:,'hospitalizados_diarios']                 = hospitalizados
-    df.loc[:,'fallecidos_diarios']                     = fallecidos
-    df.loc[:,'fallecidos_por_hospitalizacion_diarios'] = fallecidos_por_hospitalizacion
-
-    # Convierte str a fechas y llena hoyos de fechas con ceros
-    df.index.set_levels( pd.to_datetime(df.index.levels[1]), level=1, inplace=True )
-    idx = pd.date_range(df.index.levels[1].min(), df.index.levels[1].max())
-    df.index.set_levels( idx, level=1, inplace=True )
-    df.index.levels[1].name = 'Fecha'
-    df = df.fillna(0)
-
-    # Lista de entidades federativas con nombres oficiales
-    entidades = get_lista_entidades()
-    df.index.set_levels( entidades, level=0, inplace=True )
+    fallecidos.index = fallecidos.index.set_levels( pd.to_datetime(fallecidos.index.levels[1]), level=1 )
+    fallecidos_por_hospitalizacion.index = fallecidos_por_hospitalizacion.index.set_levels( pd.to_datetime(fallecidos_por_hospitalizacion.index.levels[1]), level=1 )
+
+    df = pd.DataFrame({'pruebas_diarias':                        pruebas,
+                       'confirmados_diarios':                    confirmados,
+                       'hospitalizados_diarios':                 hospitalizados,
+                       'fallecidos_diarios':                     fallecidos,
+                       'fallecidos_por_hospitalizacion_diarios': fallecidos_por_hospitalizacion})
+
+    # Llena hoyos de fechas con ceros: todas las entidades con datos por todas las fechas
+    claves = df.index.get_level_values(0).unique().sort_values()
+    fechas = df.index.get_level_values(1)
+    idx = pd.date_range(fechas.min(), fechas.max())
+    df = df.reindex( pd.MultiIndex.from_product([claves, idx]) ).fillna(0)
+
+    # Nombres oficiales de las entidades federativas (catálogo de la DGE)
+    registro = get_registro()
+    nombres = dict(zip(registro.claves_entidad, registro.nombres_entidad))
+    df.index = df.index.set_levels( [nombres[clave] for clave in claves], level=0 ).set_names([None, 'Fecha'])
 
     # Genera series acumuladas para cada tipo de caso
     df.loc[:,'pruebas_acumuladas'] = df.loc[:,'pruebas_diarias'].groupby(level=0).cumsum()
@@ -96,9 +99,12 @@ def get_serie_nacional(series): return series.groupby(level=1).sum()
 def get_serie_estatal(series, estado): return series.loc[estado]
 
 ## Funciones de ayuda
-def get_lista_entidades(path_catalogos='./data/diccionario_datos_covid19/Catalogos_0412.xlsx'):
-    return pd.read_excel(path_catalogos,
-              sheet_name='Catálogo de ENTIDADES')['ENTIDAD_FEDERATIVA'].values
+def get_lista_entidades(path_catalogos=PATH_CATALOGOS):
+    '''
+    Nombres oficiales de las entidades federativas en el orden del catálogo de la DGE.
+    Se leen del registro de datos de referencia, que evita volver a leer el Excel en cada llamada.
+    '''
+    return get_registro(path_catalogos=path_catalogos).nombres_entidad
 
 def dias_desde_t0(t0, n_dias=0):
     '''
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo reduce ensambles grandes de trayectorias del modelo a bandas de cuantiles, media y varianza
+    sin guardar las trayectorias: se alimenta por lotes y su memoria no depende del tamaño del ensamble.
+
+    Los cuantiles de cada día y compartimento se estiman con el algoritmo P² de Jain y Chlamtac (1985), que mantiene
+    cinco marcadores por cuantil y los ajusta con interpolación parabólica en cada observación. La actualización está
+    vectorizada sobre todas las celdas (cuantil, día, compartimento). La media y la varianza se combinan por lotes
+    con las fórmulas de Chan et al.
+'''
+
+import numpy as np
+import pandas as pd
+
+from data_handling.parameters import COMPARTIMENTOS
+
+
+class ReductorEnsamble:
+    '''
+    Estimador en línea de cuantiles, media y varianza por día y compartimento para un ensamble de trayectorias.
+
+    Uso:
+        reductor = ReductorEnsamble(cuantiles=(0.05, 0.5, 0.95))
+        for lote in lotes:
+            reductor.agrega(iterate_model_batch(x0, T, params_lote))
+        bandas = reductor.a_dataframe()
+
+    Atributos:
+        - cuantiles: arreglo de los cuantiles estimados
+        - n: número de trayectorias agregadas
+    '''
+
+    def __init__(self, cuantiles=(0.05, 0.5, 0.95)):
+        self.cuantiles = np.asarray(cuantiles, dtype=np.float64)
+        self.n = 0
+        self._forma = None
+
+    def _inicializa(self, forma):
+        self._forma = forma
+        nq = len(self.cuantiles)
+        # Probabilidad de cada columna (cuantil × celda) y avance de las posiciones deseadas por observación
+        p = np.repeat(self.cuantiles, int(np.prod(forma)))
+        self._dn = np.stack([np.zeros_like(p), p / 2, p, (1 + p) / 2, np.ones_like(p)])
+        self._q = None
+        self._pos = None
+        self._pos_deseadas = None
+        self._primeras = []
+        self._media = np.zeros(forma)
+        self._m2 = np.zeros(forma)
+        self._nq = nq
+
+    def agrega(self, flow):
+        '''
+        Agrega un lote de trayectorias.
+
+        Inputs:
+            - flow: arreglo (T+1, B, 8) como el de `iterate_model_batch`, o una sola trayectoria (T+1, 8)
+        '''
+
+        flow = np.asarray(flow, dtype=np.float64)
+        if flow.ndim == 2:
+            flow = flow[:, None, :]
+        lote = np.moveaxis(flow, 1, 0)   # (B, T+1, 8)
+
+        if self._forma is None:
+            self._inicializa(lote.shape[1:])
+        elif lote.shape[1:] != self._forma:
+            raise ValueError('Las trayectorias deben tener forma {}; se recibió {}'.format(self._forma, lote.shape[1:]))
+
+        # Media y varianza: combinación del lote con el acumulado
+        n_lote = len(lote)
+        media_lote = lote.mean(axis=0)
+        m2_lote = np.square(lote - media_lote).sum(axis=0)
+        total = self.n + n_lote
+        δ = media_lote - self._media
+        self._media = self._media + δ * n_lote / total
+        self._m2 = self._m2 + m2_lote + np.square(δ) * self.n * n_lote / total
+
+        for x in lote.reshape(n_lote, -1):
+            self._observa(np.tile(x, self._nq))
+        self.n = total
+
+    def _observa(self, x):
+        '''
+        Un paso de P² con la observación `x` (una entrada por columna cuantil × celda).
+        '''
+
+        if self._q is None:
+            # Los primeros cinco valores inicializan los marcadores
+            self._primeras.append(x)
+            if len(self._primeras) == 5:
+                self._q = np.sort(np.stack(self._primeras), axis=0)
+                self._pos = np.tile(np.arange(1., 6.)[:, None], (1, len(x)))
+                self._pos_deseadas = 1 + 4 * self._dn
+                self._primeras = []
+            return
+
+        q, pos = self._q, self._pos
+
+        # Celda k del marcador: q[k] <= x < q[k+1], extendiendo los extremos
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        k = np.clip((x[None, :] >= q[1:4]).sum(axis=0), 0, 3)
+
+        pos += np.arange(5)[:, None] > k[None, :]
+        self._pos_deseadas += self._dn
+
+        for i in (1, 2, 3):
+            d = self._pos_deseadas[i] - pos[i]
+            mueve = ((d >= 1) & (pos[i + 1] - pos[i] > 1)) | ((d <= -1) & (pos[i - 1] - pos[i] < -1))
+            if not mueve.any():
+                continue
+            s = np.where(d >= 0, 1., -1.)
+
+            # Interpolación parabólica; si sale del intervalo de los vecinos, lineal
+            parabolica = q[i] + s / (pos[i + 1] - pos[i - 1]) * (
+                (pos[i] - pos[i - 1] + s) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+                + (pos[i + 1] - pos[i] - s) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1]))
+            vecino = np.where(s > 0, q[i + 1], q[i - 1])
+            pos_vecino = np.where(s > 0, pos[i + 1], pos[i - 1])
+            lineal = q[i] + s * (vecino - q[i]) / (pos_vecino - pos[i])
+            nueva = np.where((q[i - 1] < parabolica) & (parabolica < q[i + 1]), parabolica, lineal)
+
+            q[i] = np.where(mueve, nueva, q[i])
+            pos[i] = np.where(mueve, pos[i] + s, pos[i])
+
+    @property
+    def media(self):
+        '''Media por día y compartimento, arreglo (T+1, 8).'''
+        return self._media
+
+    @property
+    def varianza(self):
+        '''Varianza muestral por día y compartimento, arreglo (T+1, 8).'''
+        return self._m2 / max(self.n - 1, 1)
+
+    def bandas(self):
+        '''
+        Estimación de los cuantiles.
+
+        Output:
+            - bandas: arreglo (número de cuantiles, T+1, 8)
+        '''
+
+        if self.n == 0:
+            raise ValueError('No se ha agregado ninguna trayectoria')
+        if self._q is None:
+            # Con menos de cinco trayectorias se usan los cuantiles exactos
+            primeras = np.stack(self._primeras)[:, :int(np.prod(self._forma))]
+            return np.quantile(primeras, self.cuantiles, axis=0).reshape((self._nq,) + self._forma)
+        return self._q[2].reshape((self._nq,) + self._forma)
+
+    def a_dataframe(self, N=1, fechas=None):
+        '''
+        Bandas, media y desviación estándar en un DataFrame.
+
+        Inputs:
+            - N=1: factor de escala (la población para reportar personas)
+            - fechas=None: índice de fechas. Por default, días desde cero.
+
+        Output:
+            - DataFrame (día × (compartimento, estadístico)) con las columnas 'p5', 'p50', 'p95' (según los cuantiles), 'media' y 'std'
+        '''
+
+        bandas = self.bandas() * N
+        nombres = ['p{:g}'.format(100 * c) for c in self.cuantiles]
+        estadisticos = np.concatenate([bandas, (self.media * N)[None], (np.sqrt(self.varianza) * N)[None]])
+
+        columnas = pd.MultiIndex.from_product([COMPARTIMENTOS, nombres + ['media', 'std']])
+        datos = np.moveaxis(estadisticos, 0, -1).reshape(self._forma[0], -1)
+        indice = pd.Index(np.arange(self._forma[0]), name='dia') if fechas is None else pd.Index(fechas, name='Fecha')
+
+        return pd.DataFrame(datos, index=indice, columns=columnas)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo hace el análisis espectral de la matriz de transición linealizada del modelo
+    (ver `get_matriz_transicion_linealizada`) para mallas de parámetros y todos los estados a la vez.
+
+    Matriz linealizada en función de k (componentes S, E, A, I, H):
+
+        M(k) = [[1, 0,     -b_k,     -ν b_k, 0   ],
+                [0, 1-η,    b_k,      ν b_k, 0   ],
+                [0, η,      1-α,      0,     0   ],
+                [0, 0,      α,        M_II,  0   ],
+                [0, 0,      0,        μ γ,   M_HH]],   b_k = -k log(1 - β)
+
+    El espectro de M(k) es {1, M_HH} ∪ espectro del bloque (E, A, I). El eigenvalor que gobierna el crecimiento
+    es el de Perron del bloque (E, A, I), que es real, no negativo y crece con k. Su polinomio característico
+    es lineal en b_k, así que para una tasa λ dada:
+
+        b_k = (λ - 1 + η)(λ - 1 + α)(λ - M_II) / ( η [ (λ - M_II) + ν α ] ),   para λ > max(1-η, 1-α, M_II)
+
+    El número de reproducción se obtiene del operador de siguiente generación en el mismo bloque:
+
+        R(k) = b_k ( 1/α + ν / (1 - M_II) )
+
+    Todos los parámetros pueden ser escalares o arreglos que se difunden (broadcast) entre sí.
+'''
+
+import numpy as np
+import pandas as pd
+
+from data_handling.crecimiento import get_tasas_crecimiento
+
+
+def _parametros(params):
+    '''
+    Parámetros de la linealización como arreglos: β, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ.
+    '''
+    β, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ = [np.asarray(params[i], dtype=np.float64) for i in (0, 2, 3, 4, 5, 6, 7, 8, 9, 10)]
+    return β, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ
+
+
+def _M_II(params):
+    _, _, _, _, μ, γ, _, _, χᴵ, _ = _parametros(params)
+    return γ * (1 - μ) + (1 - γ) * (1 - χᴵ)
+
+
+def _tasa_minima(params):
+    '''
+    Eigenvalor dominante del bloque (E, A, I) sin contagios (b_k = 0): ninguna k > 0 da una tasa menor.
+    '''
+    _, η, α, _, _, _, _, _, _, _ = _parametros(params)
+    return np.maximum(np.maximum(1 - η, 1 - α), _M_II(params))
+
+
+def matrices_transicion(k, params):
+    '''
+    Construye el arreglo de matrices de transición linealizadas para todos los valores de `k` y de los parámetros.
+
+    Inputs:
+        - k: número de contactos promedio; escalar o arreglo
+        - params: parámetros del modelo; cada entrada puede ser escalar o arreglo (p. ej. uno por estado)
+
+    Outputs:
+        - M: arreglo (..., 5, 5), con ... la forma difundida de `k` y los parámetros
+    '''
+
+    β, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ = _parametros(params)
+    k = np.asarray(k, dtype=np.float64)
+
+    b_k = -k * np.log(1 - β)
+    forma = np.broadcast(b_k, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ).shape
+
+    M = np.zeros(forma + (5, 5))
+    M[..., 0, 0] = 1
+    M[..., 0, 2] = -b_k
+    M[..., 0, 3] = -ν * b_k
+    M[..., 1, 1] = 1 - η
+    M[..., 1, 2] = b_k
+    M[..., 1, 3] = ν * b_k
+    M[..., 2, 1] = η
+    M[..., 2, 2] = 1 - α
+    M[..., 3, 2] = α
+    M[..., 3, 3] = γ * (1 - μ) + (1 - γ) * (1 - χᴵ)
+    M[..., 4, 3] = μ * γ
+    M[..., 4, 4] = (1 - ω) * (1 - ψ) - (1 - ω) * (1 - χᴴ)
+
+    return M
+
+
+def eigenvalor_dominante(M):
+    '''
+    Eigenvalor de Perron del bloque (E, A, I) de cada matriz en `M`, calculado en una sola llamada a `eigvals`.
+
+    Inputs:
+        - M: arreglo (..., 5, 5) de `matrices_transicion`
+
+    Outputs:
+        - λ: arreglo (...) con el eigenvalor dominante (real) de crecimiento
+    '''
+    return np.linalg.eigvals(M[..., 1:4, 1:4]).real.max(axis=-1)
+
+
+def barrido(params, indice, valores, k=None):
+    '''
+    Eigenvalor dominante para una malla de valores del parámetro `params[indice]`.
+
+    Inputs:
+        - params: parámetros del modelo; sus entradas pueden ser arreglos (p. ej. uno por estado)
+        - indice: posición del parámetro a barrer en `params` (1 para k)
+        - valores: arreglo (NV,) de valores del parámetro
+        - k=None: número de contactos si `indice` no es 1. Por default, params[1].
+
+    Outputs:
+        - λ: arreglo (NV, ...) con el eigenvalor dominante para cada valor y cada entrada de los parámetros
+    '''
+
+    valores = np.asarray(valores, dtype=np.float64)
+    extra = max([np.ndim(p) for p in params[:11]] + [0])
+    valores = valores.reshape(valores.shape + (1,) * extra)
+
+    params = list(params)
+    params[indice] = valores
+    if k is None:
+        k = params[1]
+
+    return eigenvalor_dominante(matrices_transicion(k, params))
+
+
+def resuelve_parametro(tasas, params, indice, lo, hi, iteraciones=60):
+    '''
+    Encuentra, por bisección vectorizada, el valor de `params[indice]` en [lo, hi] cuyo eigenvalor dominante es igual a `tasas`.
+    Supone que el eigenvalor dominante es monótono en el parámetro (como lo es en k y β).
+    Si no hay raíz en el intervalo, regresa el extremo más cercano a la tasa.
+
+    Inputs:
+        - tasas: arreglo de tasas de crecimiento (exponente + 1)
+        - params: parámetros del modelo, difundibles contra `tasas`
+        - indice: posición del parámetro a resolver en `params`
+        - lo, hi: intervalo de búsqueda
+        - iteraciones=60: iteraciones de bisección (todas las tasas a la vez)
+
+    Outputs:
+        - valores: arreglo con la forma de `tasas`
+    '''
+
+    tasas = np.asarray(tasas, dtype=np.float64)
+    params = list(params)
+
+    def _λ(valor):
+        params[indice] = valor
+        return eigenvalor_dominante(matrices_transicion(params[1], params))
+
+    forma = np.broadcast(tasas, *[np.asarray(p) for p in params[:11]]).shape
+    a = np.full(forma, lo, dtype=np.float64)
+    b = np.full(forma, hi, dtype=np.float64)
+    f_a = _λ(a) - tasas
+    crece = (_λ(b) - tasas) > f_a
+
+    for _ in range(iteraciones):
+        c = (a + b) / 2
+        f_c = _λ(c) - tasas
+        # Avanza el extremo que conserva el cambio de signo (según la monotonía)
+        izquierda = (f_c < 0) == crece
+        a = np.where(izquierda, c, a)
+        b = np.where(izquierda, b, c)
+
+    return (a + b) / 2
+
+
+def get_k_optimos(tasas, params, k_min=5, k_max=15):
+    '''
+    Número de contactos promedio cuyo eigenvalor dominante es igual a cada tasa de crecimiento (raíz exacta).
+
+    Inputs:
+        - tasas: tasas de crecimiento (exponente + 1); escalar o arreglo
+        - params: parámetros del modelo, difundibles contra `tasas`
+        - k_min=5, k_max=15: rango de valores admisibles de k
+
+    Outputs:
+        - k: arreglo con la forma difundida de `tasas` y `params`, recortado a [k_min, k_max].
+          Las tasas que no alcanza ningún k > 0 dan k_min, igual que el mínimo del barrido de `get_k_optimo`.
+    '''
+
+    λ = np.asarray(tasas, dtype=np.float64)
+    β, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ = _parametros(params)
+    M_II = _M_II(params)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b_k = (λ - 1 + η) * (λ - 1 + α) * (λ - M_II) / (η * ((λ - M_II) + ν * α))
+        k = b_k / -np.log(1 - β)
+
+    # La raíz solo es la de Perron si λ supera al mayor eigenvalor con b_k = 0
+    valida = λ > _tasa_minima(params)
+    k = np.where(valida & np.isfinite(k), k, k_min)
+
+    return np.clip(k, k_min, k_max)
+
+
+def numeros_reproduccion(k, params):
+    '''
+    Número de reproducción del operador de siguiente generación para cada valor de `k` y de los parámetros.
+    '''
+
+    β, η, α, ν, μ, γ, ω, ψ, χᴵ, χᴴ = _parametros(params)
+    b_k = -np.asarray(k, dtype=np.float64) * np.log(1 - β)
+
+    return b_k * (1/α + ν / (1 - _M_II(params)))
+
+
+def get_R_efectivos(series, params, metrica='hospitalizados_acumulados', ventana=9, k_min=0, k_max=np.inf):
+    '''
+    Números de reproducción efectivos diarios para todos los estados a partir de las tasas de crecimiento móviles.
+
+    Inputs:
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
+        - params: parámetros del modelo. Puede ser un solo vector o un diccionario entidad → vector
+        - metrica='hospitalizados_acumulados': serie con la que se estiman las tasas
+        - ventana=9: días de cada ajuste de la tasa
+        - k_min=0, k_max=inf: rango admisible de k
+
+    Outputs:
+        - R: DataFrame (Fecha × entidad) con R_t; NaN donde no hay tasa o esta es menor que la de b_k = 0
+    '''
+
+    tasas = get_tasas_crecimiento(series, metrica=metrica, ventana=ventana)
+
+    if isinstance(params, dict):
+        # Un vector de parámetros por columna, apilados para difundirse contra (ND, NE)
+        params = [np.array([params[estado][i] for estado in tasas.columns]) for i in range(11)]
+
+    k = get_k_optimos(tasas.values, params, k_min=k_min, k_max=k_max)
+    # Sin tasa, o con una tasa que ningún k > 0 explica, no hay R_t
+    valida = tasas.values > _tasa_minima(params)
+    R = np.where(valida, numeros_reproduccion(k, params), np.nan)
+
+    return pd.DataFrame(R, index=tasas.index, columns=tasas.columns)
@@ -7,27 +7,34 @@
 '''
 
 # Standard libraries
+import os
 import pandas as pd
 import numpy as np
 import datetime as dt
 
 # Minimizer library
 import scipy
+from concurrent.futures import ProcessPoolExecutor
 
-# Módulo de manejo de datos
-from data_handling.data_processing import *
-from data_handling.parameters import *
+# Módulo de manejo de datos. Se reexportan las funciones de datos y parámetros que usa la calibración
+from data_handling.data_processing import series_panel_por_estado, get_serie_nacional, get_serie_estatal, get_lista_entidades, dias_desde_t0
+from data_handling.parameters import (get_params_arenas, get_parametros, get_poblacion, get_superficie, get_t0,
+                                      get_fit_param, get_matriz_transicion_linealizada, get_k_optimo, get_tiempo_duplicacion)
+from data_handling.panel import get_panel
+from data_handling.instrumentacion import instrumenta, cuenta
 
 # El modelo
-from arenas_model import iterate_model
+from arenas_model import iterate_model, iterate_model_batch, model_states, iterate_model_sensitivities
+from parameter_sets import ArenasParams
 
 
+@instrumenta(estado='estado')
 def get_condiciones_iniciales(series, estado, params, t0):
     '''
     Calcula las condiciones iniciales necesarias para el modelo para `estado`.
 
     Inputs:
-        - series: Dataframe con las series de tiempo de todos los estados
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
         - estado: Entidad federativa a considerar
         - params: Parámetros del modelo. Aquí se utilizan η, α, χᴵ, χᴴ
         - t0: Fecha inicial
@@ -37,8 +44,9 @@ def get_condiciones_iniciales(series, estado, params, t0):
 
     '''
 
-    # Toma la series del estado de interés
-    series = get_serie_estatal(series, estado)
+    # Toma el panel y el día entero de t0
+    panel = get_panel(series)
+    d0 = panel.dia(t0)
 
     # Toma la población del estado de interés
     N = get_poblacion(estado)
@@ -50,21 +58,21 @@ def get_condiciones_iniciales(series, estado, params, t0):
     χᴴ = params[10]
 
     # Variables en las que confiamos
-    fallecidos_t0 = series.loc[t0, 'fallecidos_acumulados']
-    hospitalizados_t0 = series.loc[t0, 'hospitalizados_acumulados']
+    fallecidos_t0 = panel.valor(estado, d0, 'fallecidos_acumulados')
+    hospitalizados_t0 = panel.valor(estado, d0, 'hospitalizados_acumulados')
 
     # Variables latentes: E,A,I,R.
     # Las variables a continuación solo dan un estimado inicial que luego ajustamos mejor
-    confirmados_t0 = series.loc[t0, 'confirmados_acumulados']
+    confirmados_t0 = panel.valor(estado, d0, 'confirmados_acumulados')
 
-    expuestos_t0 = series.loc[dias_desde_t0(t0, 1):dias_desde_t0(t0, np.round(1/α)), 'confirmados_diarios'].sum()
+    expuestos_t0 = panel.suma(estado, 'confirmados_diarios', d0 + 1, d0 + np.round(1/α))
 
-    asintomaticos_t0 = series.loc[dias_desde_t0(t0, np.round(1/α)):dias_desde_t0(t0, np.round(1/α + 1/η)), 'confirmados_diarios'].sum()
+    asintomaticos_t0 = panel.suma(estado, 'confirmados_diarios', d0 + np.round(1/α), d0 + np.round(1/α + 1/η))
 
-    removidos_t0 = series.loc[ dias_desde_t0(t0, -np.round(1/χᴵ)), 'confirmados_acumulados' ] # 'ambulatorios_acumulados'
+    removidos_t0 = panel.valor(estado, d0 - int(np.round(1/χᴵ)), 'confirmados_acumulados') # 'ambulatorios_acumulados'
     recuperados_ambu_t0 = 0
 
-    recuperados_hosp_t0 = series.loc[ dias_desde_t0(t0, -np.round(1/χᴴ)), 'hospitalizados_acumulados' ]
+    recuperados_hosp_t0 = panel.valor(estado, d0 - int(np.round(1/χᴴ)), 'hospitalizados_acumulados')
 
 
     ## initial conditions of state_i setup ##
@@ -82,21 +90,29 @@ def get_condiciones_iniciales(series, estado, params, t0):
 
 ### FUNCIONES DE MANEJO DE VARIABLES LATENTES ###
 
+# Columnas de datos con las que se ajustan las variables latentes
+COLUMNAS_AJUSTE = ['hospitalizados_acumulados', 'fallecidos_acumulados']
+
+# Métodos de minimización que usan el gradiente exacto de las sensibilidades y cotas en lugar de la penalización
+METODOS_GRADIENTE = ('l-bfgs-b',)
+
 def multiplicador_subreporte(x0, params, m=10):
     '''
     Ajusta las condiciones iniciales y la tasa de pacientes que van a hospital (γ) al multiplicador de subreporte `m`.
 
     Inputs:
         - x0: Condiciones iniciales oficiales
-        - params: Parámetros del modelo. La fracción de casos que requieren hospialización se ajusta al multiplicador
+        - params: Parámetros del modelo (lista o `ArenasParams`; no se modifican)
         - m=10: Multiplicador; cuántos veces de casos latentes hay que no son medidos?
 
     Output:
         - x_new: Condiciones iniciales ajustadas por el multiplicador
+        - params_new: `ArenasParams` con la fracción de casos que requieren hospitalización (γ) dividida entre `m`
     '''
 
     # Divide γ / m
-    params[6] = params[6] / m
+    params = ArenasParams.from_list(params)
+    params_new = params.replace(γ=params.γ / m)
 
     # Escala las condiciones iniciales por el multiplicador de casos latentes
     # E, A, I, Rᴵ
@@ -111,21 +127,26 @@ def multiplicador_subreporte(x0, params, m=10):
     x0_copy[ [1, 2, 3, 5, 6] ] = x0_latentes
     x0_copy[0] = 1 - x0_copy[1:].sum()
 
-    return x0_copy
+    return x0_copy, params_new
 
-def correccion_x0_latentes(series, estado, x0, params, t0, t_fit=20, method='nelder-mead' ):
+@instrumenta(estado='estado')
+def correccion_x0_latentes(series, estado, x0, params, t0, t_fit=20, method='nelder-mead', arranque=None, diagnostico=None):
     '''
     Modifica las variables latentes (E0, A0, I0, Rᴴ0. Rᴵ0) que mejor se ajusten a los datos dados los parámetros `params` del modelo.
     Dicho ajuste se obtiene minimizando el error cuadrático medio entre el modelo y los datos.
 
     Inputs:
-        - series: Dataframe con las series de tiempo de todos los estados
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
         - estado: Entidad federativa a considerar
         - x0: condiciones iniciales. Se ajustarán las variables latentes: E0, A0, I0, Rᴴ0. Rᴵ0
         - params: Parámetros del modelo
         - t0: fecha inicial para la simulación
         - t_fit=20: días de ajuste desde t0
-        - method='nelder-mead': método de minimización
+        - method='nelder-mead': método de minimización. Con 'l-bfgs-b' se usa el gradiente exacto (sensibilidades del modelo)
+          y cotas de factibilidad en lugar de la penalización de 1e100.
+        - arranque=None: variables latentes (E0, A0, I0, Rᴵ0, Rᴴ0) desde las que arranca la minimización
+          (p. ej. las de un ajuste anterior). Por default, las de `x0`.
+        - diagnostico=None: diccionario en el que se escriben el error, las iteraciones y las evaluaciones del ajuste
 
     Output:
         - x0_new: Nuevas condiciones iniciales para correr el modelo ajustado. Esto da una estimación burda de las variables latentes reales.
@@ -134,23 +155,38 @@ def correccion_x0_latentes(series, estado, x0, params, t0, t_fit=20, method='nel
     '''
 
     # Variables latentes:  E, A, I, Rᴵ, Rᴴ
-    x0_latentes = x0[ [1, 2, 3, 5, 6] ]
+    x0_latentes = x0[ [1, 2, 3, 5, 6] ] if arranque is None else np.asarray(arranque, dtype=np.float64)
 
-    # Obtiene fecha final en formato fecha
-    tf = dias_desde_t0(t0, t_fit)
-    # Arma las series de tiempo de datos para ajuste
-    data = get_serie_estatal(series, estado).loc[t0:tf, ['hospitalizados_acumulados','fallecidos_acumulados']]
+    # Arma las series de tiempo de datos para ajuste entre t0 y t0 + t_fit
+    panel = get_panel(series)
+    d0 = panel.dia(t0)
+    data = panel.ventana(estado, d0, d0 + t_fit, COLUMNAS_AJUSTE)
 
     # Minimización de función objetivo (RMSE)
-    opt = scipy.optimize.minimize(fun= lambda x: RMSE(data, params, x),
-                               x0=x0_latentes, method=method, options={'maxiter':500}  )
+    if method.lower() in METODOS_GRADIENTE:
+        x0_latentes_new, opt = _minimiza_gradiente(data, params, x0_latentes, method)
+        # Cada evaluación simula (con sensibilidades) todo el periodo de ajuste
+        cuenta('evaluaciones', opt.nfev)
+        cuenta('dias_simulados', opt.nfev * (len(data) - 1))
+    else:
+        objetivo = get_objetivo_rmse(data, params)
+        opt = _minimiza_acotado(objetivo, x0_latentes, method)
+        # Variables latentes resultado de la minimización
+        x0_latentes_new = opt.x
+        cuenta('evaluaciones', objetivo.estadisticas['evaluaciones'])
+        cuenta('dias_simulados', objetivo.estadisticas['dias_simulados'])
 
     print('Error: {}\nNúmero de iteraciones: {}'.format(opt.fun, opt.nit) )
 
-    # Variables latentes resultado de la minimización
-    x0_latentes_new = opt.x
+    if diagnostico is not None:
+        diagnostico.update({'error': float(opt.fun), 'iteraciones': int(opt.nit), 'evaluaciones': int(opt.nfev)})
 
-    ## Nuevas condiciones iniciales
+    return _x0_desde_latentes(x0, x0_latentes_new)
+
+def _x0_desde_latentes(x0, x0_latentes_new):
+    '''
+    Nuevas condiciones iniciales a partir de `x0` con las variables latentes E, A, I, Rᴵ, Rᴴ reemplazadas por `x0_latentes_new`.
+    '''
 
     x0_new = 1*x0
     x0_new[ [1, 2, 3, 5, 6] ] = x0_latentes_new
@@ -161,55 +197,407 @@ def correccion_x0_latentes(series, estado, x0, params, t0, t_fit=20, method='nel
 
     return x0_new
 
+def correccion_x0_latentes_multiarranque(series, estado, x0, params, t0, t_fit=20, method='nelder-mead',
+                                         n_arranques=8, n_candidatos=512, escala=10, n_procesos=None, semilla=None):
+    '''
+    Versión de `correccion_x0_latentes` con varios puntos de arranque para evitar mínimos locales pobres.
+
+    1. Genera `n_candidatos` vectores latentes con un hipercubo latino alrededor de las latentes de `x0`
+       (en escala logarítmica, entre x/escala y x·escala; las latentes nulas se muestrean en [0, escala/N]).
+    2. Evalúa todos los candidatos con una sola simulación en lote (`get_objetivo_rmse_lote`) y se queda con los
+       `n_arranques` mejores, incluyendo siempre las latentes de `x0`.
+    3. Corre los optimizadores locales de los arranques en paralelo en un pool de procesos.
+
+    Inputs:
+        - series, estado, x0, params, t0, t_fit, method: como en `correccion_x0_latentes`
+        - n_arranques=8: número de optimizaciones locales
+        - n_candidatos=512: tamaño del hipercubo latino del que se eligen los arranques
+        - escala=10: factor multiplicativo del rango de muestreo alrededor de x0
+        - n_procesos=None: procesos del pool. Por default, uno por núcleo (como mucho `n_arranques`). Con 1 se corre en serie.
+        - semilla=None: semilla del generador aleatorio
+
+    Output:
+        - x0_new: condiciones iniciales del mejor ajuste
+        - arranques: DataFrame (uno por arranque, ordenado por error) con el error inicial, el error final,
+          las iteraciones y las latentes finales. Su dispersión indica qué tan bien determinado está el ajuste.
+    '''
+
+    panel = get_panel(series)
+    d0 = panel.dia(t0)
+    data = panel.ventana(estado, d0, d0 + t_fit, COLUMNAS_AJUSTE)
+    N = float(params[11])
+
+    # Hipercubo latino en escala logarítmica alrededor de las latentes de x0
+    x0_latentes = np.asarray(x0[ [1, 2, 3, 5, 6] ], dtype=np.float64)
+    rng = np.random.default_rng(semilla)
+    u = (rng.permuted(np.tile(np.arange(n_candidatos), (5, 1)), axis=1).T + rng.random([n_candidatos, 5])) / n_candidatos
+    positivas = x0_latentes > 0
+    candidatos = np.where(positivas,
+                          x0_latentes * escala**(2*u - 1),
+                          u * escala / N)
+    candidatos = np.vstack([x0_latentes, candidatos])
+
+    # Evaluación en lote y selección de arranques
+    errores = get_objetivo_rmse_lote(data, params)(candidatos)
+    mejores = np.argsort(errores, kind='stable')[:n_arranques]
+    if 0 not in mejores:
+        mejores[-1] = 0
+
+    # Optimizaciones locales en paralelo
+    tareas = [(data, list(params), candidatos[i], method) for i in mejores]
+    if n_procesos is None:
+        n_procesos = os.cpu_count() or 1
+    n_procesos = max(1, min(n_procesos, len(tareas)))
+    if n_procesos == 1:
+        resultados = [_optimiza_arranque(tarea) for tarea in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=n_procesos) as pool:
+            resultados = list(pool.map(_optimiza_arranque, tareas))
+
+    arranques = pd.DataFrame([{'error_inicial': errores[i], 'error': error, 'iteraciones': nit,
+                               'E0': x[0], 'A0': x[1], 'I0': x[2], 'Rᴵ0': x[3], 'Rᴴ0': x[4]}
+                              for (i, (x, error, nit)) in zip(mejores, resultados)])
+    arranques = arranques.sort_values('error').reset_index(drop=True)
+
+    print('Error: {}\nDispersión del error entre arranques: {}'.format(arranques['error'].iloc[0], arranques['error'].std()) )
+
+    x0_latentes_new = arranques.loc[0, ['E0', 'A0', 'I0', 'Rᴵ0', 'Rᴴ0']].values.astype(np.float64)
+    return _x0_desde_latentes(x0, x0_latentes_new), arranques
+
+def _optimiza_arranque(tarea):
+    '''
+    Optimización local desde un arranque. Regresa (latentes, error, iteraciones).
+    '''
+    data, params, arranque, method = tarea
+
+    if method.lower() in METODOS_GRADIENTE:
+        x, opt = _minimiza_gradiente(data, params, arranque, method)
+    else:
+        opt = _minimiza_acotado(get_objetivo_rmse(data, params), arranque, method)
+        x = opt.x
+    return x, float(opt.fun), int(opt.nit)
+
 ### FUNCIONES DE FIT ###
 
-def RMSE(data, params, x0_latentes):
+def get_objetivo_rmse(data, params):
     '''
-    Calcula el error cuadrático medio (MSE) entre los datos de fallecidos y hospitalizados y el modelo usando dichos datos como condiciones iniciales.
+    Construye la función objetivo RMSE(x0_latentes) para un conjunto de datos y parámetros fijos.
+
+    Los datos se convierten a arreglos una sola vez; en cada evaluación se revisa primero que las condiciones
+    iniciales sean factibles (no negativas) y solo entonces se simula, paso a paso con `model_states`,
+    acumulando el error de hospitalizados y fallecidos sin construir el flujo completo del modelo.
 
     Inputs:
-        - data: Pandas DataFrame con datos de hospitalizados y fallecidos acumulados en el intervalo de tiempo de interés para hacer el ajuste.
+        - data: DataFrame con columnas 'hospitalizados_acumulados' y 'fallecidos_acumulados', o arreglo (T+1, 2) con esas columnas en ese orden
         - params: Parámetros del modelo
-        - x0_latentes: Condiciones iniciales que no se pueden saber directamente de los datos: E,A,I,Rᴴ,Rᴵ
 
     Output:
-        - rmse: raíz del error cuadrático medio entre los datos y las simulaciones del modelo.
+        - objetivo: función objetivo(x0_latentes, cota=None) de x0_latentes = (E0, A0, I0, Rᴵ0, Rᴴ0) que regresa el RMSE
+          (1e100 si x0 no es factible). Con `cota`, la simulación se detiene en cuanto el error parcial rebasa la cota y
+          se regresa ese error parcial, que es mayor a la cota. `objetivo.estadisticas` cuenta evaluaciones, días simulados y abortos.
     '''
 
+    # Datos duros como listas de floats
+    hospitalizados, fallecidos = _datos_ajuste(data)
+
     # Población Total
-    N = params[11]
+    N = float(params[11])
 
-    # Condiciones iniciales latentes
-    E0, A0, I0, Rᴵ0, Rᴴ0 = x0_latentes
+    # Hospitalizados que no han fallecido
+    hospitalizados_vivos = (hospitalizados - fallecidos).tolist()
+    fallecidos_lista = fallecidos.tolist()
+
+    # Dias de simulación: Tantos como haya datos
+    T = len(fallecidos_lista) - 1
+
+    # Condiciones iniciales de los datos duros
+    D0 = fallecidos_lista[0] / N
+    H0_total = hospitalizados[0] / N - D0
+
+    params = list(params)
+
+    # Contadores de evaluaciones del modelo y de días simulados
+    estadisticas = {'evaluaciones': 0, 'dias_simulados': 0, 'abortos': 0}
+
+    def objetivo(x0_latentes, cota=None):
+        # Condiciones iniciales latentes
+        E0, A0, I0, Rᴵ0, Rᴴ0 = x0_latentes
+        H0 = H0_total - Rᴴ0
+        S0 = (1 - E0 - A0 - I0 - H0 - Rᴵ0 - Rᴴ0 - D0)
 
-    # Datos duros
-    # Fallecidos
-    D0 = data['fallecidos_acumulados'][0]/N
-    # Hospitalizados
-    H0 = data['hospitalizados_acumulados'][0]/N - D0 - Rᴴ0
+        # Condiciones de frontera: todas las condiciones iniciales deben ser positivas
+        if S0 < 0 or E0 < 0 or A0 < 0 or I0 < 0 or H0 < 0 or Rᴵ0 < 0 or Rᴴ0 < 0 or D0 < 0:
+            return 1e100
 
+        # Con una cota, se deja de simular en cuanto el error parcial ya la rebasa
+        limite = np.inf if cota is None else cota**2 * (T + 1)
 
-    S0 = (1 - E0 - A0 - I0 - H0 - Rᴵ0 - Rᴴ0 - D0)
+        # Error cuadrático acumulado de fallecidos y de hospitalizados (H + Rᴴ)
+        error = 0.0
+        estadisticas['evaluaciones'] += 1
+        for (t, x) in zip(range(T + 1), model_states((S0, E0, A0, I0, H0, Rᴵ0, Rᴴ0, D0), params)):
+            error += (fallecidos_lista[t] - N*x[7])**2 + (hospitalizados_vivos[t] - N*(x[4] + x[6]))**2
+            if error > limite:
+                estadisticas['abortos'] += 1
+                break
+        estadisticas['dias_simulados'] += t
+
+        # rmse = sqrt(mse). Si se abortó, es una cota inferior del RMSE que ya es mayor a `cota`
+        return np.sqrt(error / (T + 1))
+
+    objetivo.estadisticas = estadisticas
+    return objetivo
+
+def _datos_ajuste(data):
+    '''
+    Hospitalizados y fallecidos acumulados de `data` (DataFrame o arreglo (T+1, 2)) como arreglos de floats.
+    '''
+    if hasattr(data, 'columns'):
+        return (np.asarray(data['hospitalizados_acumulados'], dtype=np.float64),
+                np.asarray(data['fallecidos_acumulados'], dtype=np.float64))
+    data = np.asarray(data, dtype=np.float64)
+    return data[:, 0], data[:, 1]
+
+def get_jacobiano_residuos(data, params, x0_latentes, wrt=(0, 1, 6)):
+    '''
+    Residuos del ajuste y su Jacobiano exacto respecto a las variables latentes y a los parámetros `params[wrt]`,
+    a partir de las sensibilidades del modelo (`iterate_model_sensitivities`). Sirve para estimar incertidumbres,
+    p. ej. con la covarianza aproximada σ² (JᵀJ)⁻¹.
+
+    Inputs:
+        - data: DataFrame o arreglo (T+1, 2) con hospitalizados y fallecidos acumulados
+        - params: Parámetros del modelo
+        - x0_latentes: Condiciones iniciales latentes E0, A0, I0, Rᴵ0, Rᴴ0
+        - wrt=(0, 1, 6): índices de los parámetros a derivar. Por default β, k, γ
+
+    Output:
+        - residuos: arreglo 2(T+1) con (modelo - datos) de fallecidos y de hospitalizados vivos (H + Rᴴ), en número de casos
+        - jacobiano: arreglo (2(T+1), 5 + len(wrt)) con las derivadas de los residuos
+    '''
+
+    hospitalizados, fallecidos = _datos_ajuste(data)
+    N = float(params[11])
+    T = len(fallecidos) - 1
+
+    # Condiciones iniciales completas y su derivada respecto a las latentes: S0 = 1 - E0 - A0 - I0 - Rᴵ0 - (H0 + Rᴴ0) - D0
+    E0, A0, I0, Rᴵ0, Rᴴ0 = x0_latentes
+    D0 = fallecidos[0] / N
+    H0 = hospitalizados[0] / N - D0 - Rᴴ0
+    S0 = 1 - E0 - A0 - I0 - H0 - Rᴵ0 - Rᴴ0 - D0
     x0 = np.array([S0, E0, A0, I0, H0, Rᴵ0, Rᴴ0, D0])
 
-    # Dias de simulación: Tantos como haya datos
-    T = len(data) - 1
-    # Corre el modelo
-    flow = iterate_model(x0, T, params)
-    # Convierte densidades en número de casos
-    flow *= N
-
-    # Error cuadrático medio
-    mse = 0
-    # Por fallecidos
-    mse += ( np.square( data['fallecidos_acumulados']      - flow[:,7] ).mean() )
-    # Por hospitalizados acumulados
-    mse += ( np.square( (data['hospitalizados_acumulados'] - data['fallecidos_acumulados'])
-                    - (flow[:,4] + flow[:,6] ) ).mean() )
-
-    # Condiciones de frontera: todas las condiciones iniciales deben ser positivas
-    if any(x_i < 0 for x_i in x0):
-        return 1e100
-    else:
-        # rmse = sqrt(mse)
-        return np.sqrt(mse)
+    dx0 = np.zeros([8, 5])
+    dx0[[1, 2, 3, 5, 6], range(5)] = 1
+    dx0[0, :4] = -1
+    dx0[4, 4] = -1
+
+    flow, sens = iterate_model_sensitivities(x0, T, params, wrt=wrt)
+    # Cadena: latentes a través de x0; parámetros directos
+    sens = np.concatenate([sens[:, :, :8] @ dx0, sens[:, :, 8:]], axis=2)
+
+    residuos = N * np.concatenate([flow[:, 7] - fallecidos / N,
+                                   flow[:, 4] + flow[:, 6] - (hospitalizados - fallecidos) / N])
+    jacobiano = N * np.concatenate([sens[:, 7, :], sens[:, 4, :] + sens[:, 6, :]])
+
+    return residuos, jacobiano
+
+def _minimiza_gradiente(data, params, x0_latentes, method):
+    '''
+    Minimiza el RMSE con un método cuasi-Newton acotado usando el gradiente exacto.
+    Las variables se escalan a número de casos (latentes · N) para que el problema esté bien condicionado.
+    Las cotas mantienen latentes y H0 no negativos; si el óptimo deja S0 < 0, se vuelve a minimizar con SLSQP
+    y la restricción E0 + A0 + I0 + Rᴵ0 ≤ 1 - H0 - Rᴴ0 - D0.
+
+    Output:
+        - x0_latentes_new: latentes óptimas
+        - opt: resultado de scipy.optimize.minimize
+    '''
+
+    hospitalizados, fallecidos = _datos_ajuste(data)
+    N = float(params[11])
+    n = len(fallecidos)
+
+    # Factibilidad: latentes no negativas, H0 = H0_total - Rᴴ0 ≥ 0 (cotas) y S0 ≥ 0, es decir
+    # E0 + A0 + I0 + Rᴵ0 ≤ cota_S (restricción lineal; las cotas por componente solo la aproximan)
+    D0 = fallecidos[0] / N
+    H0_total = hospitalizados[0] / N - D0
+    cota_S = max(1 - H0_total - D0, 0) * N
+    cotas = [(0, cota_S)] * 4 + [(0, max(H0_total, 0) * N)]
+    fila_S = np.array([1., 1., 1., 1., 0.])
+    restriccion_S = {'type': 'ineq', 'fun': lambda u: cota_S - fila_S @ u, 'jac': lambda u: -fila_S}
+
+    def objetivo(u):
+        residuos, jacobiano = get_jacobiano_residuos(data, params, u / N, wrt=())
+        rmse = np.sqrt(np.square(residuos).sum() / n)
+        if rmse == 0:
+            return 0.0, np.zeros(len(u))
+        # d rmse = (Σ r dr) / (n rmse); dr/du = dr/dx / N
+        return rmse, (residuos @ jacobiano) / (n * rmse * N)
+
+    def factible(u):
+        u = np.clip(u, [c[0] for c in cotas], [c[1] for c in cotas])
+        exceso = fila_S @ u
+        if exceso > cota_S:
+            u[:4] *= cota_S / exceso
+        return u
+
+    u0 = factible(np.asarray(x0_latentes, dtype=np.float64) * N)
+    opt = scipy.optimize.minimize(objetivo, u0, jac=True, method=method, bounds=cotas, options={'maxiter':500})
+
+    # Si el óptimo con cotas deja S0 < 0, se resuelve de nuevo con la restricción desde su proyección factible
+    if fila_S @ opt.x > cota_S * (1 + 1e-9):
+        opt = scipy.optimize.minimize(objetivo, factible(opt.x), jac=True, method='slsqp', bounds=cotas,
+                                      constraints=[restriccion_S], options={'maxiter':500})
+        opt.x = factible(opt.x)
+
+    return opt.x / N, opt
+
+def _minimiza_acotado(objetivo, x0_latentes, method, maxiter=500):
+    '''
+    Minimiza un objetivo con cota (de `get_objetivo_rmse`) con un método sin derivadas.
+
+    Nelder-Mead usa `_nelder_mead_acotado`, que da a cada evaluación la cota exacta de la comparación que sigue,
+    así que recorre los mismos símplices que el de scipy. Los demás métodos de scipy reciben el objetivo sin cota:
+    usan los valores para algo más que comparar (diferencias finitas, búsquedas de línea, modelos) y un RMSE truncado
+    los desviaría.
+    '''
+
+    if method.lower() == 'nelder-mead':
+        return _nelder_mead_acotado(objetivo, x0_latentes, maxiter=maxiter)
+    return scipy.optimize.minimize(fun=objetivo, x0=x0_latentes, method=method, options={'maxiter':maxiter})
+
+def _nelder_mead_acotado(objetivo, x0, maxiter=500, xatol=1e-4, fatol=1e-4):
+    '''
+    Nelder-Mead con los mismos coeficientes, símplex inicial y criterio de paro que `scipy.optimize.minimize(method='nelder-mead')`.
+
+    Cada punto de prueba solo se compara contra un valor (el peor vértice, el segundo peor o el reflejado),
+    así que ese valor se pasa como cota: si el punto pierde la comparación no hace falta su RMSE exacto.
+    Los valores que se guardan en el símplex siempre son evaluaciones completas.
+
+    Output:
+        - opt: OptimizeResult con x, fun, nit y nfev
+    '''
+
+    ρ, χ, ψ, σ = 1, 2, 0.5, 0.5
+
+    x0 = np.asarray(x0, dtype=np.float64)
+    N = len(x0)
+    sim = np.empty((N + 1, N))
+    sim[0] = x0
+    for k in range(N):
+        y = x0.copy()
+        y[k] = (1 + 0.05)*y[k] if y[k] != 0 else 0.00025
+        sim[k + 1] = y
+
+    nfev = N + 1
+    fsim = np.array([objetivo(x) for x in sim])
+    orden = np.argsort(fsim)
+    sim, fsim = sim[orden], fsim[orden]
+
+    nit = 1
+    while nit < maxiter:
+        if np.max(np.abs(sim[1:] - sim[0])) <= xatol and np.max(np.abs(fsim[0] - fsim[1:])) <= fatol:
+            break
+
+        xbar = sim[:-1].sum(axis=0) / N
+        # Reflexión. Por encima del peor vértice su valor exacto no se usa
+        xr = (1 + ρ)*xbar - ρ*sim[-1]
+        fxr = objetivo(xr, cota=fsim[-1])
+        nfev += 1
+        encoge = False
+
+        if fxr < fsim[0]:
+            # Expansión: solo importa si mejora a la reflexión
+            xe = (1 + ρ*χ)*xbar - ρ*χ*sim[-1]
+            fxe = objetivo(xe, cota=fxr)
+            nfev += 1
+            if fxe < fxr:
+                sim[-1], fsim[-1] = xe, fxe
+            else:
+                sim[-1], fsim[-1] = xr, fxr
+        elif fxr < fsim[-2]:
+            sim[-1], fsim[-1] = xr, fxr
+        elif fxr < fsim[-1]:
+            # Contracción exterior
+            xc = (1 + ψ*ρ)*xbar - ψ*ρ*sim[-1]
+            fxc = objetivo(xc, cota=fxr)
+            nfev += 1
+            if fxc <= fxr:
+                sim[-1], fsim[-1] = xc, fxc
+            else:
+                encoge = True
+        else:
+            # Contracción interior
+            xcc = (1 - ψ)*xbar + ψ*sim[-1]
+            fxcc = objetivo(xcc, cota=fsim[-1])
+            nfev += 1
+            if fxcc < fsim[-1]:
+                sim[-1], fsim[-1] = xcc, fxcc
+            else:
+                encoge = True
+
+        if encoge:
+            for j in range(1, N + 1):
+                sim[j] = sim[0] + σ*(sim[j] - sim[0])
+                fsim[j] = objetivo(sim[j])
+                nfev += 1
+
+        nit += 1
+        orden = np.argsort(fsim)
+        sim, fsim = sim[orden], fsim[orden]
+
+    return scipy.optimize.OptimizeResult(x=sim[0], fun=fsim[0], nit=nit, nfev=nfev, success=nit < maxiter)
+
+def get_objetivo_rmse_lote(data, params):
+    '''
+    Versión en lote de `get_objetivo_rmse`: evalúa muchos vectores de latentes con una sola llamada a `iterate_model_batch`.
+
+    Inputs:
+        - data: DataFrame o arreglo (T+1, 2) con hospitalizados y fallecidos acumulados
+        - params: Parámetros del modelo
+
+    Output:
+        - objetivo: función de un arreglo (B, 5) de latentes (E0, A0, I0, Rᴵ0, Rᴴ0) que regresa el arreglo (B,) de RMSE
+          (1e100 para los vectores no factibles)
+    '''
+
+    hospitalizados, fallecidos = _datos_ajuste(data)
+    N = float(params[11])
+    T = len(fallecidos) - 1
+    D0 = fallecidos[0] / N
+    H0_total = hospitalizados[0] / N - D0
+
+    def objetivo(x0_latentes):
+        E0, A0, I0, Rᴵ0, Rᴴ0 = np.atleast_2d(x0_latentes).T
+        H0 = H0_total - Rᴴ0
+        S0 = 1 - E0 - A0 - I0 - H0 - Rᴵ0 - Rᴴ0 - D0
+        x0 = np.column_stack([S0, E0, A0, I0, H0, Rᴵ0, Rᴴ0, np.full_like(S0, D0)])
+
+        # Solo se simulan los vectores factibles
+        factibles = (x0 >= 0).all(axis=1)
+        rmse = np.full(len(x0), 1e100)
+        if factibles.any():
+            flow = iterate_model_batch(x0[factibles], T, params) * N
+            error = (np.square(fallecidos[:, None] - flow[:, :, 7]).sum(axis=0)
+                     + np.square((hospitalizados - fallecidos)[:, None] - flow[:, :, 4] - flow[:, :, 6]).sum(axis=0))
+            rmse[factibles] = np.sqrt(error / (T + 1))
+        return rmse
+
+    return objetivo
+
+def RMSE(data, params, x0_latentes):
+    '''
+    Calcula el error cuadrático medio (MSE) entre los datos de fallecidos y hospitalizados y el modelo usando dichos datos como condiciones iniciales.
+
+    Inputs:
+        - data: Pandas DataFrame con datos de hospitalizados y fallecidos acumulados en el intervalo de tiempo de interés para hacer el ajuste.
+        - params: Parámetros del modelo
+        - x0_latentes: Condiciones iniciales que no se pueden saber directamente de los datos: E,A,I,Rᴴ,Rᴵ
+
+    Output:
+        - rmse: raíz del error cuadrático medio entre los datos y las simulaciones del modelo.
+
+    Nota: Para evaluar muchas veces con los mismos datos conviene usar `get_objetivo_rmse` directamente.
+    '''
+
+    return get_objetivo_rmse(data, params)(x0_latentes)
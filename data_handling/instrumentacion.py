@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo mide, de forma opcional, el tiempo de cada etapa de la calibración: tiempo de reloj, número de
+    llamadas, pico de memoria y contadores propios de cada etapa (p. ej. evaluaciones del modelo y días simulados
+    en el ajuste), por etapa y por estado.
+
+    Está apagado por default y en ese caso cada función instrumentada solo paga una consulta a una variable global.
+    Se enciende con `activa()` o con la variable de entorno ESTRATEGIA_PERFIL=1 (ESTRATEGIA_PERFIL=memoria para
+    medir también el pico de memoria con tracemalloc, que sí alenta la ejecución).
+
+    Uso:
+        from data_handling import instrumentacion
+        instrumentacion.activa()
+        tabla = calibra_estados(series)
+        instrumentacion.tabla()                           # DataFrame por etapa y estado
+        instrumentacion.exporta_json('perfil.json')
+        instrumentacion.exporta_flama('perfil.txt')       # formato "collapsed" de flamegraph.pl / speedscope
+
+    Las etapas se anidan: la ruta de cada registro es la pila de etapas abiertas (calibra_estados → calibra_estado →
+    correccion_x0_latentes). El registro no es seguro entre hilos; los procesos del pool de `calibra_estados`
+    regresan sus registros con cada resultado y se combinan en el proceso principal (ver `extrae` y `combina`).
+'''
+
+import os
+import json
+import time
+import functools
+import contextlib
+import tracemalloc
+
+# Estado global: apagado por default (ver ESTRATEGIA_PERFIL al final del módulo)
+_activo = False
+_memoria = False
+
+# Registros por pila de marcos ('etapa' o 'etapa[ESTADO]' donde cambia el estado) y pila de etapas abiertas
+_registros = {}
+_pila = []
+
+_NULO = contextlib.nullcontext()
+
+
+def activa(memoria=False):
+    '''
+    Enciende la instrumentación. Con `memoria=True` también se mide el pico de memoria rastreada durante cada etapa (tracemalloc).
+    '''
+    global _activo, _memoria
+    _activo = True
+    _memoria = memoria
+    if memoria and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def desactiva():
+    '''
+    Apaga la instrumentación (los registros se conservan hasta `reinicia`).
+    '''
+    global _activo
+    _activo = False
+    if _memoria and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def esta_activa():
+    '''
+    True si la instrumentación está encendida.
+    '''
+    return _activo
+
+
+def configuracion():
+    '''
+    Configuración actual, para encender la instrumentación igual en otros procesos: `activa(**configuracion())`.
+    '''
+    return {'memoria': _memoria} if _activo else None
+
+
+def reinicia():
+    '''
+    Borra todos los registros.
+    '''
+    _registros.clear()
+
+
+def inicia_proceso(configuracion=None):
+    '''
+    Deja la instrumentación de un proceso nuevo del pool con la `configuracion` del proceso principal y sin los
+    registros ni las etapas abiertas que pudo heredar (fork).
+    '''
+    _registros.clear()
+    _pila.clear()
+    if configuracion is not None:
+        activa(**configuracion)
+    elif _activo:
+        desactiva()
+
+
+class _Etapa:
+    '''
+    Contexto de una etapa activa.
+    '''
+    __slots__ = ('nombre', 'estado', 'ruta', 'marcos', 'inicio', 'pico', 'contadores')
+
+    def __init__(self, nombre, estado):
+        self.nombre = nombre
+        self.estado = estado
+
+    def __enter__(self):
+        padre = _pila[-1] if _pila else None
+        if self.estado is None and padre is not None:
+            self.estado = padre.estado
+        self.ruta = (padre.ruta if padre is not None else ()) + (self.nombre,)
+        self.marcos = (padre.marcos if padre is not None else ()) + (_marco(self.nombre, self.estado, padre),)
+        self.contadores = {}
+        self.pico = 0
+        if _memoria:
+            # El pico de la etapa padre hasta aquí se guarda antes de reiniciar el pico para esta etapa
+            if padre is not None:
+                padre.pico = max(padre.pico, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        _pila.append(self)
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excepcion):
+        segundos = time.perf_counter() - self.inicio
+        _pila.pop()
+
+        pico = None
+        if _memoria:
+            pico = max(self.pico, tracemalloc.get_traced_memory()[1])
+            if _pila:
+                _pila[-1].pico = max(_pila[-1].pico, pico)
+            tracemalloc.reset_peak()
+
+        _agrega(self.marcos, self.ruta, self.estado, 1, segundos, pico, self.contadores)
+        return False
+
+
+def _marco(nombre, estado, padre):
+    if estado is None or (padre is not None and padre.estado == estado):
+        return nombre
+    return '{}[{}]'.format(nombre, estado)
+
+
+def _agrega(marcos, ruta, estado, llamadas, segundos, pico, contadores):
+    registro = _registros.get(marcos)
+    if registro is None:
+        registro = _registros[marcos] = {'ruta': ruta, 'estado': estado, 'llamadas': 0, 'segundos': 0.0,
+                                         'pico_memoria': None, 'contadores': {}}
+    registro['llamadas'] += llamadas
+    registro['segundos'] += segundos
+    if pico is not None:
+        registro['pico_memoria'] = max(registro['pico_memoria'] or 0, pico)
+    for (nombre, n) in contadores.items():
+        registro['contadores'][nombre] = registro['contadores'].get(nombre, 0) + n
+
+
+def etapa(nombre, estado=None):
+    '''
+    Contexto que mide una etapa: `with etapa('lectura'): ...`. Si no se da `estado`, se hereda de la etapa que la contiene.
+    '''
+    if not _activo:
+        return _NULO
+    return _Etapa(nombre, estado)
+
+
+def instrumenta(nombre=None, estado=None):
+    '''
+    Decorador que mide cada llamada de la función como una etapa.
+
+    Inputs:
+        - nombre=None: nombre de la etapa. Por default, el de la función.
+        - estado=None: nombre del argumento de la función que trae el estado (p. ej. 'estado')
+    '''
+
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__name__
+        posicion, por_omision = None, None
+        if estado is not None:
+            argumentos = funcion.__code__.co_varnames[:funcion.__code__.co_argcount]
+            posicion = argumentos.index(estado)
+            defaults = funcion.__defaults__ or ()
+            por_omision = dict(zip(argumentos[len(argumentos) - len(defaults):], defaults)).get(estado)
+
+        @functools.wraps(funcion)
+        def instrumentada(*args, **kwargs):
+            if not _activo:
+                return funcion(*args, **kwargs)
+            valor = None
+            if posicion is not None:
+                valor = kwargs.get(estado, args[posicion] if posicion < len(args) else por_omision)
+            with _Etapa(etiqueta, valor):
+                return funcion(*args, **kwargs)
+
+        return instrumentada
+
+    return decorador
+
+
+def cuenta(nombre, n=1):
+    '''
+    Suma `n` al contador `nombre` de la etapa abierta (p. ej. cuenta('dias_simulados', T)). Sin efecto si está apagado.
+    '''
+    if _activo and _pila:
+        contadores = _pila[-1].contadores
+        contadores[nombre] = contadores.get(nombre, 0) + n
+
+
+## COMBINACIÓN ENTRE PROCESOS
+
+def registros():
+    '''
+    Copia de los registros como lista de diccionarios (serializable).
+    '''
+    return [{'marcos': list(marcos), 'ruta': list(registro['ruta']), 'estado': registro['estado'],
+             'llamadas': registro['llamadas'], 'segundos': registro['segundos'],
+             'pico_memoria': registro['pico_memoria'], 'contadores': dict(registro['contadores'])}
+            for (marcos, registro) in _registros.items()]
+
+
+def extrae():
+    '''
+    Registros de este proceso (ver `registros`), que además se borran. Lo usan los procesos del pool.
+    '''
+    lista = registros()
+    reinicia()
+    return lista
+
+
+def combina(lista):
+    '''
+    Agrega registros de otro proceso debajo de la etapa abierta en este proceso.
+    '''
+    padre = _pila[-1] if _pila else None
+    prefijo_marcos, prefijo_ruta = (padre.marcos, padre.ruta) if padre is not None else ((), ())
+    for registro in lista:
+        _agrega(prefijo_marcos + tuple(registro['marcos']), prefijo_ruta + tuple(registro['ruta']), registro['estado'],
+                registro['llamadas'], registro['segundos'], registro['pico_memoria'], registro['contadores'])
+
+
+## EXPORTACIÓN
+
+def tabla():
+    '''
+    Registros en un DataFrame: una fila por (etapa, estado) con llamadas, segundos, segundos por llamada,
+    pico de memoria (MB), cada contador y, si hay 'dias_simulados', los días simulados por segundo.
+    '''
+    import pandas as pd
+
+    filas = []
+    for registro in registros():
+        fila = {'etapa': '/'.join(registro['ruta']), 'estado': registro['estado'], 'llamadas': registro['llamadas'],
+                'segundos': registro['segundos'], 'segundos_por_llamada': registro['segundos'] / registro['llamadas'],
+                'pico_memoria_mb': None if registro['pico_memoria'] is None else registro['pico_memoria'] / 2**20}
+        fila.update(registro['contadores'])
+        if 'dias_simulados' in registro['contadores'] and registro['segundos'] > 0:
+            fila['dias_por_segundo'] = registro['contadores']['dias_simulados'] / registro['segundos']
+        filas.append(fila)
+
+    columnas = ['etapa', 'estado', 'llamadas', 'segundos', 'segundos_por_llamada', 'pico_memoria_mb']
+    return pd.DataFrame(filas, columns=columnas + sorted({c for f in filas for c in f} - set(columnas)))
+
+
+def exporta_json(path):
+    '''
+    Escribe los registros a un archivo JSON.
+    '''
+    with open(path, 'w', encoding='utf-8') as archivo:
+        json.dump({'registros': registros()}, archivo, indent=2, ensure_ascii=False)
+    return path
+
+
+def flama():
+    '''
+    Resumen en formato "collapsed stacks" (una línea 'etapa;subetapa;... microsegundos' con el tiempo propio
+    de cada pila), que leen flamegraph.pl y speedscope. El estado se marca como 'etapa[ESTADO]' donde cambia.
+    '''
+
+    # Tiempo propio = total de la pila - total de sus hijas directas
+    propios = {marcos: registro['segundos'] for (marcos, registro) in _registros.items()}
+    for (marcos, registro) in _registros.items():
+        if marcos[:-1] in propios:
+            propios[marcos[:-1]] -= registro['segundos']
+
+    return '\n'.join('{} {}'.format(';'.join(marcos), int(round(max(segundos, 0.0) * 1e6)))
+                     for (marcos, segundos) in sorted(propios.items()))
+
+
+def exporta_flama(path):
+    '''
+    Escribe el resumen de `flama` a un archivo.
+    '''
+    with open(path, 'w', encoding='utf-8') as archivo:
+        archivo.write(flama() + '\n')
+    return path
+
+
+# Encendido por variable de entorno, con `activa` para que tracemalloc arranque con ESTRATEGIA_PERFIL=memoria
+if os.environ.get('ESTRATEGIA_PERFIL', '') not in ('', '0'):
+    activa(memoria=os.environ['ESTRATEGIA_PERFIL'] == 'memoria')
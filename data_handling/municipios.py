@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo agrega los datos abiertos de la DGE [1] por municipio de residencia (ENTIDAD_RES + MUNICIPIO_RES)
+    y por estrato de edad, para alimentar el modelo acoplado de `coupled_dynamics` con NP parches y NG estratos.
+
+    Los conteos diarios se guardan como matrices dispersas (parche·estrato × día) por métrica, de modo que
+    nunca se materializan tablas densas de ~2,500 municipios × cientos de días llenas de ceros.
+
+    Convención de condiciones iniciales del modelo acoplado:
+    x = S, E, A, I, H, R, D   (tensor NC×NP×NG)
+
+    [1]: https://www.gob.mx/salud/documentos/datos-abiertos-152127
+'''
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from data_handling.registro import get_registro
+
+# Cortes de edad de los estratos de Arenas et al.: jóvenes (<25), adultos (25-64) y mayores (65+)
+CORTES_EDAD = (25, 65)
+
+METRICAS = ['pruebas_diarias', 'confirmados_diarios', 'hospitalizados_diarios', 'fallecidos_diarios']
+
+
+class PanelMunicipal:
+    '''
+    Conteos diarios dispersos por (municipio, estrato de edad, día).
+
+    Atributos:
+        - conteos: diccionario métrica → matriz dispersa CSC (NP·NG × ND); la fila de (i, g) es i·NG + g
+        - parches: arreglo (NP, 2) con las claves (entidad, municipio) de cada parche
+        - ix_parche: mapa (entidad, municipio) → índice de parche
+        - NG: número de estratos de edad
+        - fecha0: fecha del día 0
+        - descartados: registros cuyo municipio no está en el catálogo
+    '''
+
+    def __init__(self, conteos, parches, NG, fecha0, descartados=0):
+        self.conteos = conteos
+        self.parches = parches
+        self.NG = NG
+        self.fecha0 = pd.Timestamp(fecha0)
+        self.descartados = descartados
+
+        self.ix_parche = {(e, m): i for (i, (e, m)) in enumerate(parches.tolist())}
+
+    @property
+    def NP(self): return len(self.parches)
+
+    @property
+    def n_dias(self): return next(iter(self.conteos.values())).shape[1]
+
+    def dia(self, fecha):
+        '''
+        Días enteros entre `fecha0` y `fecha`.
+        '''
+        return (pd.Timestamp(fecha) - self.fecha0).days
+
+    def suma(self, metrica, dia_ini, dia_fin):
+        '''
+        Suma de `metrica` entre `dia_ini` y `dia_fin` (incluidos), recortada a los días disponibles.
+        `dia_ini` y `dia_fin` pueden ser arreglos (NG,) con una ventana distinta por estrato.
+
+        Output:
+            - matriz (NP, NG)
+        '''
+        conteos = self.conteos[metrica]
+        dias_ini = np.broadcast_to(np.asarray(dia_ini, dtype=int), (self.NG,))
+        dias_fin = np.broadcast_to(np.asarray(dia_fin, dtype=int), (self.NG,))
+
+        # Una rebanada de columnas por cada ventana distinta
+        resultado = np.zeros([self.NP, self.NG])
+        for (ini, fin) in set(zip(dias_ini.tolist(), dias_fin.tolist())):
+            estratos = (dias_ini == ini) & (dias_fin == fin)
+            ini, fin = max(ini, 0), min(fin, self.n_dias - 1)
+            if ini > fin:
+                continue
+            total = np.asarray(conteos[:, ini:fin + 1].sum(axis=1)).reshape(self.NP, self.NG)
+            resultado[:, estratos] = total[:, estratos]
+        return resultado
+
+    def acumulado(self, metrica, dia):
+        '''
+        Conteo acumulado de `metrica` hasta `dia` (incluido). `dia` puede ser un arreglo (NG,).
+
+        Output:
+            - matriz (NP, NG)
+        '''
+        return self.suma(metrica, 0, dia)
+
+    def densa(self, metrica, dia_ini, dia_fin):
+        '''
+        Tensor denso (NP, NG, días) de `metrica` entre `dia_ini` y `dia_fin` (incluidos).
+        Solo para ventanas cortas: el tamaño crece con NP·NG·días.
+        '''
+        bloque = self.conteos[metrica][:, max(int(dia_ini), 0):int(dia_fin) + 1].toarray()
+        return bloque.reshape(self.NP, self.NG, -1)
+
+    def por_estado(self, metrica):
+        '''
+        Conteos diarios de `metrica` agregados por entidad y estrato: matriz dispersa (32·NG × ND).
+        '''
+        entidades = np.repeat(self.parches[:, 0].astype(int) - 1, self.NG) * self.NG + np.tile(np.arange(self.NG), self.NP)
+        agregador = scipy.sparse.csr_matrix((np.ones(len(entidades)), (entidades, np.arange(len(entidades)))),
+                                            shape=(32 * self.NG, self.NP * self.NG))
+        return (agregador @ self.conteos[metrica]).tocsc()
+
+
+def get_estratos_edad(edades, cortes=CORTES_EDAD):
+    '''
+    Índice de estrato de edad (0, ..., NG-1) para cada edad de `edades` según los `cortes`.
+    '''
+    return np.searchsorted(np.asarray(cortes), np.asarray(edades), side='right')
+
+
+def get_parches(entidades=None):
+    '''
+    Claves (entidad, municipio) de los parches del catálogo de municipios de la DGE.
+
+    Inputs:
+        - entidades=None: claves de las entidades a incluir. Por default, los 32 estados.
+
+    Output:
+        - parches: arreglo (NP, 2) ordenado por entidad y municipio
+    '''
+    registro = get_registro()
+    parches = np.column_stack([registro.entidades_municipio, registro.claves_municipio]).astype(np.int32)
+
+    if entidades is None:
+        entidades = registro.claves_estado
+    parches = parches[np.isin(parches[:, 0], entidades)]
+
+    return parches[np.lexsort((parches[:, 1], parches[:, 0]))]
+
+
+## Función principal de procesamiento por municipio
+def series_panel_por_municipio(datos_abiertos, cortes_edad=CORTES_EDAD, entidades=None):
+    '''
+    Genera un panel disperso por municipio de residencia y estrato de edad con las series diarias de:
+        - pruebas_diarias (por FECHA_INGRESO)
+        - confirmados_diarios (por FECHA_SINTOMAS)
+        - hospitalizados_diarios (por FECHA_INGRESO)
+        - fallecidos_diarios (por FECHA_DEF)
+
+    Los criterios de cada serie son los mismos que en `series_panel_por_estado`.
+
+    Input:
+        - datos_abiertos: datos abiertos de COVID-19 en México disponibles en [1].
+        - cortes_edad=(25, 65): cortes de los estratos de edad; NG = len(cortes_edad) + 1
+        - entidades=None: claves de las entidades a incluir. Por default, los 32 estados.
+
+    Output:
+        - panel: `PanelMunicipal` con los conteos dispersos
+
+    [1]: https://www.gob.mx/salud/documentos/datos-abiertos-152127
+    '''
+
+    fecha_ingreso = pd.to_datetime(datos_abiertos['FECHA_INGRESO']).values
+    fecha_sintomas = pd.to_datetime(datos_abiertos['FECHA_SINTOMAS']).values
+    fecha_def = pd.to_datetime(datos_abiertos['FECHA_DEF'].where(datos_abiertos['FECHA_DEF'] != '9999-99-99')).values
+
+    # Limpia fechas erróneas como en `series_panel_por_estado`
+    inicio = np.datetime64('2020-01-01')
+    validos = (fecha_ingreso >= inicio) & (fecha_sintomas >= inicio)
+
+    # Índice de parche de cada registro
+    parches = get_parches(entidades)
+    claves = parches[:, 0].astype(np.int64) * 1000 + parches[:, 1]
+    claves_registro = datos_abiertos['ENTIDAD_RES'].values.astype(np.int64) * 1000 + datos_abiertos['MUNICIPIO_RES'].values
+    ix_parche = np.clip(np.searchsorted(claves, claves_registro), 0, len(claves) - 1)
+    en_catalogo = claves[ix_parche] == claves_registro
+    descartados = int((validos & ~en_catalogo).sum())
+    validos &= en_catalogo
+
+    # Fila dispersa de cada registro: parche·NG + estrato
+    NG = len(cortes_edad) + 1
+    filas = ix_parche * NG + get_estratos_edad(datos_abiertos['EDAD'].values, cortes_edad)
+
+    # Ejes de tiempo
+    fecha0 = min(fecha_ingreso[validos].min(), fecha_sintomas[validos].min())
+    dia_ingreso = (fecha_ingreso - fecha0).astype('timedelta64[D]').astype(np.int64)
+    dia_sintomas = (fecha_sintomas - fecha0).astype('timedelta64[D]').astype(np.int64)
+    tiene_def = ~np.isnat(fecha_def)
+    dia_def = np.where(tiene_def, (fecha_def - fecha0).astype('timedelta64[D]').astype(np.int64), 0)
+    n_dias = int(max(dia_ingreso[validos].max(), dia_sintomas[validos].max(), dia_def[validos & tiene_def].max(initial=0))) + 1
+
+    positivo = validos & (datos_abiertos['RESULTADO'].values == 1)
+    hospitalizado = positivo & (datos_abiertos['TIPO_PACIENTE'].values == 2)
+    fallecido = positivo & tiene_def & (dia_def >= 0)
+
+    def _conteo(mask, dias):
+        return scipy.sparse.csc_matrix((np.ones(mask.sum(), dtype=np.int32), (filas[mask], dias[mask])),
+                                       shape=(len(parches) * NG, n_dias))
+
+    conteos = {
+        'pruebas_diarias':        _conteo(validos, dia_ingreso),
+        'confirmados_diarios':    _conteo(positivo, dia_sintomas),
+        'hospitalizados_diarios': _conteo(hospitalizado, dia_ingreso),
+        'fallecidos_diarios':     _conteo(fallecido, dia_def),
+    }
+
+    return PanelMunicipal(conteos, parches, NG, pd.Timestamp(fecha0), descartados)
+
+
+### CONDICIONES INICIALES DEL MODELO ACOPLADO ###
+
+def get_condiciones_iniciales_municipios(panel, n_ig, params, t0):
+    '''
+    Calcula las condiciones iniciales del modelo acoplado para cada parche y estrato de edad.
+    Sigue los mismos criterios que `get_condiciones_iniciales` del modelo agregado, con R = Rᴵ + Rᴴ.
+
+    Inputs:
+        - panel: `PanelMunicipal` de `series_panel_por_municipio`
+        - n_ig: matriz NP×NG de población por parche y estrato de edad
+        - params: Parámetros del modelo acoplado (ver `coupled_dynamics`). Aquí se utilizan ηg, αg, μg, χg
+        - t0: Fecha inicial
+
+    Outputs:
+        - x0: tensor NC×NP×NG de densidades (S, E, A, I, H, R, D). Los parches sin población quedan en S = 1.
+    '''
+
+    d0 = panel.dia(t0)
+    n_ig = np.asarray(n_ig, dtype=np.float64)
+
+    # Parámetros relevantes (escalares o vectores por estrato)
+    ηg = np.broadcast_to(params[2], (panel.NG,))
+    αg = np.broadcast_to(params[3], (panel.NG,))
+    μg = np.broadcast_to(params[5], (panel.NG,))
+    χg = np.broadcast_to(params[9], (panel.NG,))
+
+    # Variables en las que confiamos
+    fallecidos_t0 = panel.acumulado('fallecidos_diarios', d0)
+    hospitalizados_t0 = panel.acumulado('hospitalizados_diarios', d0)
+
+    # Variables latentes: estimados iniciales
+    confirmados_t0 = panel.acumulado('confirmados_diarios', d0)
+    dias_α = np.round(1/αg).astype(int)
+    dias_αη = np.round(1/αg + 1/ηg).astype(int)
+    expuestos_t0 = panel.suma('confirmados_diarios', d0 + 1, d0 + dias_α)
+    asintomaticos_t0 = panel.suma('confirmados_diarios', d0 + dias_α, d0 + dias_αη)
+
+    removidos_t0 = panel.acumulado('confirmados_diarios', d0 - np.round(1/μg).astype(int))
+    recuperados_hosp_t0 = panel.acumulado('hospitalizados_diarios', d0 - np.round(1/χg).astype(int))
+
+    # Densidades; los parches sin población no aportan casos
+    def _densidad(casos):
+        return np.divide(casos, n_ig, out=np.zeros_like(n_ig), where=n_ig > 0)
+
+    Rᴴ0 = _densidad(recuperados_hosp_t0)
+    D0  = _densidad(fallecidos_t0)
+    H0  = _densidad(hospitalizados_t0) - Rᴴ0 - D0
+    Rᴵ0 = _densidad(removidos_t0)
+    I0  = _densidad(confirmados_t0) - H0 - Rᴵ0 - Rᴴ0 - D0
+    E0  = _densidad(expuestos_t0)
+    A0  = _densidad(asintomaticos_t0)
+    S0  = 1 - E0 - A0 - I0 - H0 - Rᴵ0 - Rᴴ0 - D0
+
+    return np.array([S0, E0, A0, I0, H0, Rᴵ0 + Rᴴ0, D0])
+
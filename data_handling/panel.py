@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo define un panel denso de series de tiempo por estado respaldado por un arreglo contiguo de NumPy
+    con ejes (entidad, día, métrica). Sustituye las búsquedas `.loc` sobre el MultiIndex (ENTIDAD, Fecha) que
+    regresa `series_panel_por_estado` por índices enteros: los días se cuentan desde la primera fecha del panel.
+
+    Uso típico:
+        panel = get_panel(series)
+        d0 = panel.dia(t0)
+        panel.valor('JALISCO', d0, 'hospitalizados_acumulados')
+        panel.sumas_ventana('confirmados_diarios', d0 + 1, d0 + 3)  # todos los estados a la vez
+'''
+
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+
+class Panel:
+    '''
+    Panel (entidad, día, métrica) de las series de tiempo de `series_panel_por_estado`.
+
+    Atributos:
+        - datos: arreglo (NE, ND, NM) con las series de cada entidad
+        - nacional: arreglo (ND, NM) con la suma de todas las entidades
+        - entidades: nombres de las entidades en el orden del primer eje
+        - metricas: nombres de las columnas en el orden del tercer eje
+        - fecha0: fecha del día 0
+        - ix_entidad, ix_metrica: mapas nombre → índice
+
+    Nota: La entidad 'Nacional' se resuelve con `nacional` en todos los accesores.
+    '''
+
+    def __init__(self, datos, entidades, metricas, fecha0):
+        self.datos = np.ascontiguousarray(datos)
+        self.entidades = list(entidades)
+        self.metricas = list(metricas)
+        self.fecha0 = pd.Timestamp(fecha0)
+
+        self.ix_entidad = {entidad: i for (i, entidad) in enumerate(self.entidades)}
+        self.ix_metrica = {metrica: j for (j, metrica) in enumerate(self.metricas)}
+
+        # Serie nacional precalculada (equivalente a get_serie_nacional)
+        self.nacional = self.datos.sum(axis=0)
+
+    @classmethod
+    def desde_series(cls, series):
+        '''
+        Construye el panel a partir del DataFrame con índice (ENTIDAD, Fecha) de `series_panel_por_estado`.
+        Los días sin registro se llenan con cero en las series diarias y con el último valor en las acumuladas.
+        '''
+
+        # Conserva el orden de aparición de las entidades (orden del catálogo)
+        ix_e, orden = pd.factorize(series.index.get_level_values(0))
+        fechas = pd.to_datetime(series.index.get_level_values(1))
+
+        fecha0 = fechas.min()
+        ix_d = (fechas - fecha0).days.values
+        n_dias = ix_d.max() + 1
+
+        metricas = list(series.columns)
+        datos = np.zeros([len(orden), n_dias, len(metricas)], dtype=series.values.dtype)
+        datos[ix_e, ix_d, :] = series.values
+
+        # Llena hoyos de las series acumuladas con el último valor observado
+        presente = np.zeros([len(orden), n_dias], dtype=bool)
+        presente[ix_e, ix_d] = True
+        if not presente.all():
+            ultimo = np.where(presente, np.arange(n_dias), 0)
+            ultimo = np.maximum.accumulate(ultimo, axis=1)
+            acumuladas = [j for (j, metrica) in enumerate(metricas) if metrica.endswith('_acumulados') or metrica.endswith('_acumuladas')]
+            for j in acumuladas:
+                valores = np.take_along_axis(datos[:, :, j], ultimo, axis=1)
+                valores[~np.maximum.accumulate(presente, axis=1)] = 0
+                datos[:, :, j] = valores
+
+        return cls(datos, orden, metricas, fecha0)
+
+    ## Dimensiones y fechas
+    @property
+    def n_dias(self): return self.datos.shape[1]
+
+    @property
+    def fechas(self): return pd.date_range(self.fecha0, periods=self.n_dias)
+
+    def dia(self, fecha):
+        '''
+        Días enteros entre `fecha0` y `fecha`.
+        '''
+        return (pd.Timestamp(fecha) - self.fecha0).days
+
+    def fecha(self, dia):
+        '''
+        Fecha correspondiente al día entero `dia`.
+        '''
+        return self.fecha0 + dt.timedelta(days=int(dia))
+
+    ## Accesores
+    def bloque(self, estado):
+        '''
+        Vista (ND, NM) con todas las series de `estado`.
+        '''
+        if estado == 'Nacional':
+            return self.nacional
+        return self.datos[self.ix_entidad[estado]]
+
+    def serie(self, estado, metrica):
+        '''
+        Vista (ND,) de la serie `metrica` de `estado`.
+        '''
+        return self.bloque(estado)[:, self.ix_metrica[metrica]]
+
+    def valor(self, estado, dia, metrica):
+        '''
+        Valor de `metrica` de `estado` en el día entero `dia`. Equivalente a `serie.loc[fecha, metrica]`.
+        '''
+        if not 0 <= dia < self.n_dias:
+            raise KeyError(self.fecha(dia))
+        return self.bloque(estado)[dia, self.ix_metrica[metrica]]
+
+    def suma(self, estado, metrica, dia_ini, dia_fin):
+        '''
+        Suma de `metrica` de `estado` entre los días `dia_ini` y `dia_fin` (incluidos).
+        Como en el rebanado por fechas de pandas, el intervalo se recorta a los días disponibles.
+        '''
+        dia_ini, dia_fin = max(int(dia_ini), 0), min(int(dia_fin), self.n_dias - 1)
+        if dia_ini > dia_fin:
+            return 0
+        return self.serie(estado, metrica)[dia_ini:dia_fin + 1].sum()
+
+    def ventana(self, estado, dia_ini, dia_fin, metricas=None):
+        '''
+        Arreglo (días, métricas) de `estado` entre `dia_ini` y `dia_fin` (incluidos).
+        '''
+        bloque = self.bloque(estado)[max(int(dia_ini), 0):int(dia_fin) + 1]
+        if metricas is None:
+            return bloque
+        return bloque[:, [self.ix_metrica[metrica] for metrica in metricas]]
+
+    ## Operaciones vectorizadas sobre todos los estados
+    def acumulada(self, metrica):
+        '''
+        Suma acumulada (NE, ND + 1) de `metrica` para todos los estados, con un cero inicial.
+        La suma entre los días a y b (incluidos) es `acumulada[:, b + 1] - acumulada[:, a]`.
+        '''
+        cumsum = np.zeros([len(self.entidades), self.n_dias + 1], dtype=np.float64)
+        np.cumsum(self.datos[:, :, self.ix_metrica[metrica]], axis=1, out=cumsum[:, 1:])
+        return cumsum
+
+    def sumas_ventana(self, metrica, dia_ini, dia_fin):
+        '''
+        Suma de `metrica` entre `dia_ini` y `dia_fin` (incluidos) para todos los estados.
+
+        Inputs:
+            - metrica: columna del panel
+            - dia_ini, dia_fin: días enteros; escalares o arreglos (NE,) con una ventana por estado
+
+        Output:
+            - sumas: arreglo (NE,)
+        '''
+        cumsum = self.acumulada(metrica)
+        filas = np.arange(len(self.entidades))
+        dia_ini = np.clip(np.broadcast_to(dia_ini, filas.shape), 0, self.n_dias)
+        dia_fin = np.clip(np.broadcast_to(dia_fin, filas.shape) + 1, 0, self.n_dias)
+        return np.where(dia_fin > dia_ini, cumsum[filas, dia_fin] - cumsum[filas, dia_ini], 0)
+
+    def sumas_moviles(self, metrica, ancho):
+        '''
+        Sumas móviles de `ancho` días de `metrica` para todos los estados.
+        La columna d corresponde a la ventana que termina en el día d + ancho - 1.
+
+        Output:
+            - sumas: arreglo (NE, ND - ancho + 1)
+        '''
+        cumsum = self.acumulada(metrica)
+        return cumsum[:, ancho:] - cumsum[:, :-ancho]
+
+    def primer_dia(self, metrica, umbral):
+        '''
+        Primer día en el que `metrica` alcanza `umbral` para cada estado; -1 si nunca lo alcanza.
+        '''
+        cruza = self.datos[:, :, self.ix_metrica[metrica]] >= umbral
+        return np.where(cruza.any(axis=1), cruza.argmax(axis=1), -1)
+
+    def a_series(self):
+        '''
+        Regresa el panel como DataFrame con índice (ENTIDAD, Fecha), como en `series_panel_por_estado`.
+        '''
+        idx = pd.MultiIndex.from_product([self.entidades, self.fechas], names=[None, 'Fecha'])
+        return pd.DataFrame(self.datos.reshape(-1, len(self.metricas)), index=idx, columns=self.metricas)
+
+
+def get_panel(series):
+    '''
+    Regresa `series` como `Panel`. Si ya es un `Panel`, lo regresa sin copiarlo.
+
+    Nota: Conviene construir el panel una sola vez y pasarlo a las funciones de ajuste en lugar del DataFrame.
+    '''
+    if isinstance(series, Panel):
+        return series
+    return Panel.desde_series(series)
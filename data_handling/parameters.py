@@ -32,21 +32,23 @@
 '''
 
 # Standard libraries
-import pandas as pd
 import numpy as np
 import datetime as dt
-import math
 
-# Libraries for fitting
-from sklearn.linear_model import LinearRegression
-import numpy as np
-from numpy.linalg import eigvals
-
-# Módulo de manejo de datos
-from data_handling.data_processing import *
+# Módulo de manejo de datos. El panel, las tasas de crecimiento y el análisis espectral dependen de pandas
+# y se importan dentro de las funciones que los usan: `get_params_arenas` solo necesita numpy.
+from data_handling.registro import get_registro
+from data_handling.instrumentacion import instrumenta
 
 # Módulos específicos del modelo
 import arenas_params as ap
+from parameter_sets import ARENAS_FIELDS
+
+# Nombres de las entradas del vector de parámetros, de los compartimentos de `iterate_model` (en el orden de sus
+# columnas) y de las condiciones iniciales
+NOMBRES_PARAMETROS = list(ARENAS_FIELDS)
+COMPARTIMENTOS = ['S', 'E', 'A', 'I', 'H', 'Rᴵ', 'Rᴴ', 'D']
+NOMBRES_X0 = [compartimento + '0' for compartimento in COMPARTIMENTOS]
 
 
 def get_params_arenas():
@@ -87,6 +89,7 @@ def get_params_arenas():
     return params
 
 # Parámetros a partir de datos
+@instrumenta(estado='estado')
 def get_parametros(series, estado='Nacional'):
     '''
     Calcula los parámetros relevantes del modelo para `estado` que no vienen de los parámetros de Arenas.
@@ -97,7 +100,7 @@ def get_parametros(series, estado='Nacional'):
         - σ: Promedio de ocupantes en viviendas particulares habitadas
 
     Inputs:
-        - series: Dataframe con las series de tiempo de todos los estados
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
         - estado=Nacional: Entidad federativa a considerar
 
     Outputs:
@@ -105,17 +108,16 @@ def get_parametros(series, estado='Nacional'):
 
     Nota: Si `estado` = 'Nacional', calcula los parámetros a nivel nacional. Esto se recomienda para estados con menor volumen de datos.
     '''
+    from data_handling.panel import get_panel
 
-    if estado == 'Nacional':
-        series = get_serie_nacional( series )
-    else:
-        series = get_serie_estatal( series, estado )
+    panel = get_panel(series)
+    ultimo = panel.n_dias - 1
 
     # fracción de casos que van a hospital
-    γ = series['hospitalizados_acumulados'][-1] / series['confirmados_acumulados'][-1]
+    γ = panel.valor(estado, ultimo, 'hospitalizados_acumulados') / panel.valor(estado, ultimo, 'confirmados_acumulados')
 
     # fracción de hospitalizados que mueren (fallecidos_por_hospitalizacion_acumulados)
-    ω = series['fallecidos_acumulados'][-1] / series['hospitalizados_acumulados'][-1]
+    ω = panel.valor(estado, ultimo, 'fallecidos_acumulados') / panel.valor(estado, ultimo, 'hospitalizados_acumulados')
 
     # tamaño de habitantes por casa promedio [1]
     # [1]: https://www.inegi.org.mx/temas/vivienda/
@@ -130,20 +132,28 @@ def get_parametros(series, estado='Nacional'):
 
 def get_poblacion(estado):
     '''
-    Población (según Wikipedia) para `estado`.
+    Población (según Wikipedia) para `estado`. Para 'Nacional' da la suma de todos los estados.
     '''
 
-    path = './data/poblaciones_y_superficies_por_estado.csv'
-    return pd.read_csv( path, index_col='ENTIDAD' )['POBLACIONES'][estado]
+    return get_registro().poblacion(estado)
 
 
+def get_superficie(estado):
+    '''
+    Superficie en km² para `estado`. Para 'Nacional' da la suma de todos los estados.
+    '''
+
+    return get_registro().superficie(estado)
+
+
+@instrumenta(estado='estado')
 def get_t0(series, estado, umbral=30):
     '''
     Da el día en el que se cruza el `umbral` de hospitalizados.
     Por default, se toma un umbral de 30 hospitalizados. Recomendamos no tomar menos.
 
     Inputs:
-        - series: Dataframe con las series de tiempo de todos los estados
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
         - estado: Entidad federativa a considerar
         - umbral=30: Corte de casos de hospitalización
 
@@ -151,24 +161,28 @@ def get_t0(series, estado, umbral=30):
         - t0: fecha en la cual el estado cruza el `umbral` de hospitalizados.
 
     '''
+    from data_handling.panel import get_panel
+
+    panel = get_panel(series)
 
-    series = get_serie_estatal(series, estado)
+    # Las series acumuladas no decrecen: el primer día que cruza el umbral es el de menos confirmados
+    cruza = np.flatnonzero( panel.serie(estado, 'hospitalizados_acumulados') >= umbral )
 
-    try:
-        return series[series['hospitalizados_acumulados'] >= umbral]['confirmados_acumulados'].idxmin()
-    except:
+    if len(cruza) == 0:
         raise ValueError( 'No se ha cruzado el umbral de {} hospitalizados para {}.'.format( umbral, estado ) )
+    return panel.fecha(cruza[0])
 
 
 ### FUNCIONES DE FIT ###
 
 ## TO-DO: Recognize if t0_fit < t_JNSD (tc) or not. If it is, k_optim = <k>, else k_optim = <k_c>
+@instrumenta(estado='estado')
 def get_fit_param(series, estado, umbral=25, t0_fit=None):
     '''
     Calcula la tasa de crecimiento de hospitalizados haciendo el ajusta a 1 semana a partir de los casos determinados por `umbral`.
 
     Input:
-        - series: Dataframe con las series de tiempo de todos los estados
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
         - estado: Entidad federativa a considerar
         - umbral=25: Corte de casos de hospitalización
         - t0_fit=None: Fecha inicial para determinar la tasa de crecimiento. Por default toma la fecha respecto a `umbral`
@@ -177,28 +191,25 @@ def get_fit_param(series, estado, umbral=25, t0_fit=None):
 
     Nota: Para el crecimiento exponencial en tiempo discreto: y_t = (λ + 1)^t * y_0
     '''
+    from data_handling.panel import get_panel
+    from data_handling.crecimiento import tasas_moviles
 
-    if t0_fit == None:
-        t0_fit = get_t0(series, estado, umbral=umbral)
-        #t0_fit = dias_desde_t0(t0_fit, 8)
-        tf_fit = dias_desde_t0(t0_fit, n_dias=8)
-
-    series = get_serie_estatal(series, estado)
-
-    series = series.loc[t0_fit:tf_fit,'hospitalizados_acumulados']
-    #series = series.loc[t0_fit:tf_fit,'fallecidos_acumulados']
-    #series = series.loc[t0_fit:tf_fit,'fallecidos_diarios']
-    #series = series.loc[t0_fit:tf_fit,'hospitalizados_diarios']
-
-    ydata = np.log(series)
-    xdata = np.array( range(len(ydata)) ).reshape(-1,1)
+    panel = get_panel(series)
 
+    if t0_fit == None:
+        t0_fit = get_t0(panel, estado, umbral=umbral)
+    # Ventana de ajuste de 9 días: [t0_fit, t0_fit + 8]
+    d0_fit = panel.dia(t0_fit)
+    df_fit = d0_fit + 8
 
-    regressor = LinearRegression()
-    regressor.fit(xdata, ydata) #training the algorithm
+    series = panel.ventana(estado, d0_fit, df_fit, ['hospitalizados_acumulados'])[:, 0]
+    #series = panel.ventana(estado, d0_fit, df_fit, ['fallecidos_acumulados'])[:, 0]
+    #series = panel.ventana(estado, d0_fit, df_fit, ['fallecidos_diarios'])[:, 0]
+    #series = panel.ventana(estado, d0_fit, df_fit, ['hospitalizados_diarios'])[:, 0]
 
-    # in the discrete case, the parameter is the exponent plus one.
-    return regressor.coef_[0] + 1
+    # Ajuste log-lineal por mínimos cuadrados en forma cerrada sobre toda la ventana.
+    # In the discrete case, the parameter is the exponent plus one.
+    return tasas_moviles(series, ventana=len(series))[-1]
 
 def get_matriz_transicion_linealizada(k, params):
     '''
@@ -238,9 +249,11 @@ def get_matriz_transicion_linealizada(k, params):
     return M
 
 
+@instrumenta()
 def get_k_optimo(tasa, params, k_min=5, k_max=15):
     '''
     Obtiene el numero de contactos promedio óptimo (<k>) respecto a la tasa de crecimiento de hospitalizados `λ`.
+    El óptimo es el k cuyo eigenvalor dominante de crecimiento de la matriz linealizada es igual a `λ`, recortado a [k_min, k_max].
 
     Inputs:
         - tasa: Tasa de crecimiento de hospitalizados dadas por el fit.
@@ -252,29 +265,18 @@ def get_k_optimo(tasa, params, k_min=5, k_max=15):
         - k_optim: Número de contactos promedio ajustado a la tasa de crecimiento.
     '''
 
-    # Optimización por barrido de valores en un rango de confianza
-    k_range = np.linspace(k_min, k_max, num=100)
-
-    # Sweep the eigvals of M for k in k_range. We are interested in the 3rd eigenvalue
-    barrido_eigvals = np.zeros( len(k_range) )
-    for (i,k) in enumerate(k_range):
-
-        # Obtiene el 3er eigenvalor de la matriz de transición
-        λ3 = eigvals( get_matriz_transicion_linealizada(k, params) )[2]
-
-        # Obtiene la diferencia absoluta entre dicho eigenvalor y el exponente λ del fit.
-        barrido_eigvals[i] = np.abs( λ3 - tasa )
+    from data_handling.espectral import get_k_optimos
 
-#     print (barrido_eigvals)
-    # Calcula el óptimo tomando el mínimo del barrido
-    ix_min = np.argmin( barrido_eigvals )
-    return k_range[ix_min]
+    # Raíz exacta del eigenvalor dominante del bloque (E, A, I) igual a la tasa; ver data_handling.espectral
+    return float( get_k_optimos(tasa, params, k_min=k_min, k_max=k_max) )
 
 ## Funciones extra
 def get_tiempo_duplicacion(tasa):
     '''
     Calcula el tiempo de duplicación de casos (en días) dada una `tasa` de crecimiento.
     '''
+    from data_handling.crecimiento import tiempos_duplicacion
 
-    print('Tiempo de duplicación: {} días'.format( np.round(math.log(2, tasa) , 1) ) )
-    return math.log(2, tasa)
+    tiempo = tiempos_duplicacion(tasa)
+    print('Tiempo de duplicación: {} días'.format( np.round(tiempo, 1) ) )
+    return tiempo
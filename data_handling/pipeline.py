@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo corre la calibración completa del modelo para todos los estados (y el agregado Nacional) en paralelo.
+
+    Para cada entidad la calibración sigue la misma secuencia que el trabajo de producción:
+        get_t0 → get_parametros → get_fit_param → get_k_optimo → get_condiciones_iniciales
+               → multiplicador_subreporte → correccion_x0_latentes
+
+    Las entidades se reparten en un pool de procesos. El panel se entrega una sola vez a cada proceso
+    (al iniciarlo) y solo se lee. Los errores de cada entidad se reportan por separado sin detener la corrida.
+
+    Con la instrumentación encendida (ver data_handling.instrumentacion) se mide cada etapa de cada entidad,
+    también dentro de los procesos del pool.
+
+    Con un `AlmacenAjustes` (ver data_handling.ajustes), el ajuste de las latentes arranca de la calibración
+    compatible más reciente del estado y los resultados nuevos se guardan en el almacén.
+'''
+
+import os
+import traceback
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from data_handling.panel import get_panel
+from data_handling.ajustes import AlmacenAjustes, get_registro_ajuste
+from data_handling import instrumentacion
+from data_handling.initial_conditions import *
+from data_handling.parameters import NOMBRES_PARAMETROS, NOMBRES_X0
+from parameter_sets import ArenasParams
+
+# Panel de solo lectura de cada proceso del pool
+_panel = None
+# Almacén de ajustes de cada proceso del pool (se abre del path, no viaja con cada tarea)
+_almacen = None
+# True en los procesos del pool: sus registros de instrumentación viajan con cada resultado
+_proceso_pool = False
+
+
+@instrumentacion.instrumenta(estado='estado')
+def calibra_estado(series, estado, umbral=30, umbral_fit=25, m=10, t_fit=20, parametros_nacionales=True, method='nelder-mead',
+                   almacen=None, fecha_corte=None, guarda=True):
+    '''
+    Calibra el modelo para `estado`: parámetros y condiciones iniciales ajustadas.
+
+    Inputs:
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
+        - estado: Entidad federativa a considerar (o 'Nacional')
+        - umbral=30: umbral de hospitalizados para t0
+        - umbral_fit=25: umbral de hospitalizados para el ajuste de la tasa de crecimiento
+        - m=10: multiplicador de subreporte
+        - t_fit=20: días de ajuste de las variables latentes
+        - parametros_nacionales=True: calcula γ, ω, χᴵ, σ con la serie nacional (recomendado para estados con pocos datos)
+        - method='nelder-mead': método de minimización de `correccion_x0_latentes`
+        - almacen=None: `AlmacenAjustes` del que se toma el arranque tibio de las latentes
+        - fecha_corte=None: fecha de corte de los datos. Por default, la última fecha del panel.
+        - guarda=True: guarda el resultado en `almacen`
+
+    Output:
+        - resultado: diccionario con t0, tasa, error del ajuste, los parámetros `params`, las condiciones iniciales `x0`
+          y el `diagnostico` del ajuste (error, iteraciones, evaluaciones, método y arranque)
+    '''
+
+    panel = get_panel(series)
+
+    t0 = get_t0(panel, estado, umbral=umbral)
+
+    # Parámetros
+    γ, ω, χᴵ, σ = get_parametros(panel, 'Nacional' if parametros_nacionales else estado)
+    params = ArenasParams.from_list(get_params_arenas()).replace(γ=γ, ω=ω, χᴵ=χᴵ, σ=σ, N=get_poblacion(estado))
+
+    # Número de contactos a partir de la tasa de crecimiento
+    tasa = get_fit_param(panel, estado, umbral=umbral_fit)
+    params = params.replace(k=get_k_optimo(tasa, params))
+
+    # Condiciones iniciales
+    x0 = get_condiciones_iniciales(panel, estado, params, t0)
+    x0, params = multiplicador_subreporte(x0, params, m=m)
+
+    d0 = panel.dia(t0)
+    objetivo = get_objetivo_rmse(panel.ventana(estado, d0, d0 + t_fit, COLUMNAS_AJUSTE), params)
+
+    # Arranque tibio: las latentes del ajuste compatible más reciente, si ajustan mejor que las de x0
+    diagnostico = {'metodo': method, 'arranque': 'frio'}
+    arranque = None
+    if almacen is not None:
+        if fecha_corte is None:
+            fecha_corte = panel.fechas[-1]
+        previo = almacen.busca(estado, t0, fecha_corte=fecha_corte)
+        if previo is not None and objetivo(previo['latentes']) < objetivo(x0[[1, 2, 3, 5, 6]]):
+            arranque = previo['latentes']
+            diagnostico['arranque'] = 'tibio {:%Y-%m-%d}'.format(previo['fecha_corte'])
+
+    x0 = correccion_x0_latentes(panel, estado, x0, params, t0, t_fit=t_fit, method=method,
+                                arranque=arranque, diagnostico=diagnostico)
+
+    # Error del ajuste final
+    error = objetivo(x0[[1, 2, 3, 5, 6]])
+
+    resultado = {'estado': estado, 't0': t0, 'tasa': tasa, 'error': error, 'params': params, 'x0': x0, 'diagnostico': diagnostico}
+    if almacen is not None and guarda:
+        almacen.guarda(get_registro_ajuste(resultado, fecha_corte))
+
+    return resultado
+
+
+def _inicializa(panel, perfil=None, pool=False, path_almacen=None):
+    global _panel, _almacen, _proceso_pool
+    _panel = panel
+    _almacen = AlmacenAjustes(path_almacen) if path_almacen is not None else None
+    _proceso_pool = pool
+    if pool:
+        instrumentacion.inicia_proceso(perfil)
+
+
+def _calibra(estado, opciones):
+    '''
+    Calibra `estado` con el panel del proceso y captura cualquier excepción como parte del resultado.
+    '''
+    if _almacen is not None:
+        opciones = dict(opciones, almacen=_almacen)
+    try:
+        resultado = calibra_estado(_panel, estado, **opciones)
+        resultado['excepcion'] = None
+    except Exception as e:
+        resultado = {'estado': estado, 'excepcion': '{}: {}'.format(type(e).__name__, e),
+                     'traceback': traceback.format_exc()}
+    if _proceso_pool and instrumentacion.esta_activa():
+        resultado['perfil'] = instrumentacion.extrae()
+    return resultado
+
+
+def calibra_estados(series, estados=None, nacional=True, n_procesos=None, **opciones):
+    '''
+    Calibra el modelo para varias entidades en paralelo y consolida los resultados.
+
+    Inputs:
+        - series: Dataframe (o `Panel`) con las series de tiempo de todos los estados
+        - estados=None: lista de entidades. Por default, todas las del panel.
+        - nacional=True: agrega la calibración 'Nacional'
+        - n_procesos=None: número de procesos. Por default, los núcleos disponibles. Con 1 se corre en serie.
+        - **opciones: argumentos de `calibra_estado` (umbral, m, t_fit, method, almacen, fecha_corte, ...).
+          Con `almacen`, los procesos solo leen (cada uno abre el archivo del almacén una vez) y los resultados
+          se guardan todos juntos al final.
+
+    Output:
+        - tabla: DataFrame indexado por entidad con t0, tasa, error, los parámetros, las condiciones iniciales
+          y la columna 'excepcion' (None si la calibración terminó bien)
+    '''
+
+    panel = get_panel(series)
+
+    if estados is None:
+        estados = list(panel.entidades)
+    estados = list(estados) + (['Nacional'] if nacional and 'Nacional' not in estados else [])
+
+    almacen = opciones.get('almacen')
+    if almacen is not None:
+        opciones = dict(opciones, guarda=False)
+        if opciones.get('fecha_corte') is None:
+            opciones['fecha_corte'] = panel.fechas[-1]
+
+    if n_procesos is None:
+        n_procesos = os.cpu_count() or 1
+    n_procesos = max(1, min(n_procesos, len(estados)))
+
+    with instrumentacion.etapa('calibra_estados'):
+        if n_procesos == 1:
+            _inicializa(panel)
+            resultados = [_calibra(estado, opciones) for estado in estados]
+        else:
+            # El almacén llega a cada proceso por su path: la tabla completa no se serializa en cada tarea
+            initargs = (panel, instrumentacion.configuracion(), True, None if almacen is None else almacen.path)
+            opciones_tarea = {nombre: valor for (nombre, valor) in opciones.items() if nombre != 'almacen'}
+            with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializa, initargs=initargs) as pool:
+                resultados = list(pool.map(_calibra, estados, [opciones_tarea] * len(estados)))
+            for resultado in resultados:
+                instrumentacion.combina(resultado.pop('perfil', []))
+
+    if almacen is not None:
+        almacen.guarda([get_registro_ajuste(resultado, opciones['fecha_corte'])
+                        for resultado in resultados if resultado['excepcion'] is None])
+
+    return tabla_resultados(resultados)
+
+
+def tabla_resultados(resultados):
+    '''
+    Consolida una lista de resultados de `calibra_estado` en un DataFrame indexado por entidad.
+    '''
+
+    filas = []
+    for resultado in resultados:
+        fila = {'estado': resultado['estado'],
+                't0': resultado.get('t0'),
+                'tasa': resultado.get('tasa', np.nan),
+                'error': resultado.get('error', np.nan)}
+        params = resultado.get('params')
+        x0 = resultado.get('x0')
+        for (i, nombre) in enumerate(NOMBRES_PARAMETROS):
+            fila[nombre] = params[i] if params is not None else np.nan
+        for (i, nombre) in enumerate(NOMBRES_X0):
+            fila[nombre] = x0[i] if x0 is not None else np.nan
+        diagnostico = resultado.get('diagnostico', {})
+        fila['iteraciones'] = diagnostico.get('iteraciones', np.nan)
+        fila['arranque'] = diagnostico.get('arranque')
+        fila['excepcion'] = resultado.get('excepcion')
+        filas.append(fila)
+
+    return pd.DataFrame(filas).set_index('estado')
+
+
+def get_params_tabla(tabla, estado):
+    '''
+    Vector de parámetros y condiciones iniciales de `estado` a partir de la tabla de `calibra_estados`.
+
+    Output:
+        - params: `ArenasParams` con los parámetros en el orden de `get_params_arenas`
+        - x0: condiciones iniciales (S0, E0, A0, I0, H0, Rᴵ0, Rᴴ0, D0)
+    '''
+
+    fila = tabla.loc[estado]
+    if fila['excepcion'] is not None and not pd.isna(fila['excepcion']):
+        raise ValueError('La calibración de {} falló: {}'.format(estado, fila['excepcion']))
+
+    params = ArenasParams(*[float(fila[nombre]) for nombre in NOMBRES_PARAMETROS])
+    x0 = np.array([fila[nombre] for nombre in NOMBRES_X0], dtype=np.float64)
+    return params, x0
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo concentra los datos de referencia que usan las funciones de data_handling:
+        - Catálogo de entidades federativas (claves, nombres y abreviaturas) de `Catalogos_0412.xlsx`
+        - Catálogo de municipios (claves de municipio y de entidad, nombres) de `Catalogos_0412.xlsx`
+        - Poblaciones y superficies por estado de `poblaciones_y_superficies_por_estado.csv`
+
+    Los datos se leen una sola vez por proceso y se guardan en un archivo de caché precompilado.
+    El caché se invalida cuando cambia la fecha de modificación (mtime) de alguno de los archivos fuente,
+    de modo que leer el Excel solo ocurre la primera vez o cuando se actualiza el catálogo.
+'''
+
+import os
+import pickle
+import numpy as np
+
+PATH_CATALOGOS = './data/diccionario_datos_covid19/Catalogos_0412.xlsx'
+PATH_POBLACIONES = './data/poblaciones_y_superficies_por_estado.csv'
+PATH_CACHE = './data/cache/registro.pkl'
+
+# Registros ya cargados en este proceso, por rutas de origen
+_registros = {}
+
+
+class Registro:
+    '''
+    Datos de referencia en arreglos compactos.
+
+    Atributos:
+        - claves_entidad, nombres_entidad, abreviaturas: catálogo de entidades (incluye 36, 97, 98 y 99)
+        - claves_municipio, entidades_municipio, nombres_municipio: catálogo de municipios
+        - claves_estado, poblaciones, superficies: los 32 estados, ordenados por clave
+        - ix_estado: mapa nombre → índice de los 32 estados
+    '''
+
+    def __init__(self, datos):
+        for (nombre, valor) in datos.items():
+            setattr(self, nombre, valor)
+
+        self.ix_estado = {estado: i for (i, estado) in enumerate(self.estados)}
+        self.ix_clave = {clave: i for (i, clave) in enumerate(self.claves_estado)}
+
+    def _indice(self, estado):
+        try:
+            return self.ix_estado[estado]
+        except KeyError:
+            raise KeyError('{} no está en el registro de estados.'.format(estado))
+
+    def poblacion(self, estado):
+        '''
+        Población de `estado`. Para 'Nacional' da la suma de todos los estados.
+        '''
+        if estado == 'Nacional':
+            return self.poblaciones.sum()
+        return self.poblaciones[self._indice(estado)]
+
+    def superficie(self, estado):
+        '''
+        Superficie (km²) de `estado`. Para 'Nacional' da la suma de todos los estados.
+        '''
+        if estado == 'Nacional':
+            return self.superficies.sum()
+        return self.superficies[self._indice(estado)]
+
+    def clave(self, estado):
+        '''
+        Clave de entidad (CVE_ENTIDAD) de `estado`.
+        '''
+        return self.claves_estado[self._indice(estado)]
+
+    def nombre(self, clave):
+        '''
+        Nombre del estado con clave de entidad `clave`.
+        '''
+        return self.estados[self.ix_clave[clave]]
+
+    def municipios(self, clave_entidad):
+        '''
+        Claves y nombres de los municipios de la entidad `clave_entidad`.
+        '''
+        mask = self.entidades_municipio == clave_entidad
+        return self.claves_municipio[mask], self.nombres_municipio[mask]
+
+
+def _mtimes(paths):
+    return tuple(os.stat(path).st_mtime_ns for path in paths)
+
+
+def _lee_fuentes(path_catalogos, path_poblaciones):
+    '''
+    Lee los archivos fuente y regresa el diccionario de arreglos del registro.
+    '''
+    import pandas as pd
+
+    catalogos = pd.read_excel(path_catalogos,
+                              sheet_name=['Catálogo de ENTIDADES', 'Catálogo MUNICIPIOS'])
+    entidades = catalogos['Catálogo de ENTIDADES']
+    municipios = catalogos['Catálogo MUNICIPIOS']
+
+    poblaciones = pd.read_csv(path_poblaciones).sort_values('CVE_ENTIDAD')
+
+    return {
+        'claves_entidad':      entidades['CLAVE_ENTIDAD'].values.astype(np.int16),
+        'nombres_entidad':     entidades['ENTIDAD_FEDERATIVA'].values.astype(str),
+        'abreviaturas':        entidades['ABREVIATURA'].fillna('').values.astype(str),
+        'claves_municipio':    municipios['CLAVE_MUNICIPIO'].values.astype(np.int16),
+        'entidades_municipio': municipios['CLAVE_ENTIDAD'].values.astype(np.int16),
+        'nombres_municipio':   municipios['MUNICIPIO'].values.astype(str),
+        'estados':             poblaciones['ENTIDAD'].values.astype(str),
+        'claves_estado':       poblaciones['CVE_ENTIDAD'].values.astype(np.int16),
+        'poblaciones':         poblaciones['POBLACIONES'].values.astype(np.int64),
+        'superficies':         poblaciones['SUPERFICIES'].values.astype(np.float64),
+    }
+
+
+def get_registro(path_catalogos=PATH_CATALOGOS, path_poblaciones=PATH_POBLACIONES, path_cache=PATH_CACHE):
+    '''
+    Regresa el registro de datos de referencia.
+
+    Busca primero en memoria, luego en el caché en disco y, si alguno de los archivos fuente cambió (mtime),
+    relee las fuentes y reescribe el caché.
+
+    Inputs:
+        - path_catalogos: Excel de catálogos de la DGE
+        - path_poblaciones: csv de poblaciones y superficies por estado
+        - path_cache: archivo de caché precompilado. Si es None no se usa caché en disco.
+
+    Output:
+        - registro: `Registro` con los arreglos de referencia
+    '''
+
+    fuentes = (path_catalogos, path_poblaciones)
+    mtimes = _mtimes(fuentes)
+
+    # Caché en memoria
+    cargado = _registros.get(fuentes)
+    if cargado is not None and cargado[0] == mtimes:
+        return cargado[1]
+
+    datos = None
+
+    # Caché en disco
+    if path_cache is not None and os.path.exists(path_cache):
+        try:
+            with open(path_cache, 'rb') as archivo:
+                guardado = pickle.load(archivo)
+            if guardado['fuentes'] == fuentes and guardado['mtimes'] == mtimes:
+                datos = guardado['datos']
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError):
+            datos = None
+
+    # Fuentes originales
+    if datos is None:
+        datos = _lee_fuentes(path_catalogos, path_poblaciones)
+        if path_cache is not None:
+            os.makedirs(os.path.dirname(path_cache) or '.', exist_ok=True)
+            # Escritura atómica para que procesos concurrentes no lean un caché a medias
+            temporal = '{}.{}.tmp'.format(path_cache, os.getpid())
+            with open(temporal, 'wb') as archivo:
+                pickle.dump({'fuentes': fuentes, 'mtimes': mtimes, 'datos': datos}, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, path_cache)
+
+    registro = Registro(datos)
+    _registros[fuentes] = (mtimes, registro)
+    return registro
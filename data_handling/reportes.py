@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo genera las figuras de los reportes: una por estado (y Nacional) y escenario, con los compartimentos
+    del modelo en personas y las marcas de contención (tc) y reactivación (tc + tf).
+
+    Las figuras se dibujan sin interfaz gráfica (backend Agg de matplotlib), directo de los arreglos de
+    `iterate_model_batch` o del almacén de pronósticos, y se reparten en un pool de procesos. Cada archivo se escribe
+    de forma atómica en el directorio de salida.
+
+    Uso:
+        trabajos = trabajos_lote(estados, iterate_model_batch(x0, T, params), params, t0s, escenario='tc=10,tf=30')
+        renderiza(trabajos, './reportes', n_procesos=4)
+
+        trabajos = trabajos_almacen(AlmacenPronosticos('./data/pronosticos'), escenario='20200509:tc=10,tf=30')
+        renderiza(trabajos, './reportes', formato='svg')
+'''
+
+import os
+import re
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from data_handling import instrumentacion
+from data_handling.parameters import COMPARTIMENTOS
+
+# Paneles de cada figura: compartimentos activos arriba y los acumulados (que dominan la escala) abajo
+PANELES = [['E', 'A', 'I', 'H', 'D'], ['S', 'Rᴵ', 'Rᴴ']]
+
+
+def trabajos_lote(estados, flow, params, t0, escenario='', dias=None):
+    '''
+    Trabajos de `renderiza` a partir de una simulación por lotes.
+
+    Inputs:
+        - estados: lista con el estado de cada miembro del lote (B)
+        - flow: arreglo (T+1, B, 8) de `iterate_model_batch` (densidades)
+        - params: parámetros del lote (lista de 18 escalares o arreglos (B,))
+        - t0: fecha inicial de cada miembro (una o una lista de B)
+        - escenario='': nombre del escenario, o lista con el de cada miembro
+        - dias=None: días que se grafican de cada miembro (uno o una lista de B). Por default, T.
+
+    Output:
+        - lista de diccionarios con estado, escenario, t0, tc, tf y la trayectoria (T+1, 8) en personas
+    '''
+
+    flow = np.asarray(flow)
+    B = flow.shape[1]
+    N, tc, tf = [np.broadcast_to(np.asarray(params[i], dtype=np.float64), (B,)) for i in (11, 15, 16)]
+    escenarios = [escenario] * B if isinstance(escenario, str) else list(escenario)
+    t0 = pd.to_datetime([t0] * B if np.ndim(t0) == 0 else list(t0))
+    dias = np.broadcast_to(flow.shape[0] - 1 if dias is None else np.asarray(dias), (B,))
+
+    return [{'estado': estados[b], 'escenario': escenarios[b], 't0': t0[b], 'tc': tc[b], 'tf': tf[b],
+             'flow': flow[:dias[b] + 1, b] * N[b]}
+            for b in range(B)]
+
+
+def trabajos_almacen(almacen, estado=None, escenario=None):
+    '''
+    Trabajos de `renderiza` con las series vigentes de un `AlmacenPronosticos` (ver data_handling.resultados).
+
+    Inputs:
+        - almacen: AlmacenPronosticos
+        - estado=None, escenario=None: un valor o una lista para filtrar. Por default, todos.
+    '''
+    return [{'estado': fila.estado, 'escenario': fila.escenario, 't0': fila.t0, 'tc': fila.tc, 'tf': fila.tf,
+             'flow': almacen.trayectoria(fila.escenario, fila.estado, personas=True)}
+            for fila in almacen.series(estado=estado, escenario=escenario).itertuples(index=False)]
+
+
+def nombre_archivo(trabajo, formato='png'):
+    '''
+    Nombre del archivo de la figura de un trabajo: 'ESTADO_escenario.formato' sin espacios ni separadores.
+    '''
+    partes = [trabajo['estado']] + ([trabajo['escenario']] if trabajo['escenario'] else [])
+    return re.sub(r'[^\w.=+-]+', '_', '_'.join(str(p) for p in partes)) + '.' + formato
+
+
+def grafica(trabajo, path, formato='png', dpi=100):
+    '''
+    Dibuja la figura de un trabajo y la escribe en `path` (de forma atómica).
+    No usa pyplot: la figura no queda registrada en ningún estado global y se libera al terminar.
+    '''
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    flow = trabajo['flow']
+    fechas = pd.date_range(trabajo['t0'], periods=flow.shape[0])
+    marcas = []
+    if np.isfinite(trabajo['tc']):
+        marcas.append((trabajo['t0'] + pd.Timedelta(days=trabajo['tc']), 'contención', '-'))
+        if np.isfinite(trabajo['tf']):
+            marcas.append((trabajo['t0'] + pd.Timedelta(days=trabajo['tc'] + trabajo['tf']), 'reactivación', '--'))
+
+    figura = Figure(figsize=(9, 7))
+    FigureCanvasAgg(figura)
+    ejes = figura.subplots(len(PANELES), 1, sharex=True)
+    for (eje, compartimentos) in zip(ejes, PANELES):
+        for c in compartimentos:
+            eje.plot(fechas, flow[:, COMPARTIMENTOS.index(c)], label=c, lw=1.5)
+        for (fecha, etiqueta, estilo) in marcas:
+            if fechas[0] <= fecha <= fechas[-1]:
+                eje.axvline(fecha, label=etiqueta, c='black', lw=1, ls=estilo)
+        eje.set_ylabel('personas')
+        eje.grid(alpha=0.3)
+        eje.legend(loc='upper left', fontsize='small')
+
+    titulo = trabajo['estado'] + (' · ' + trabajo['escenario'] if trabajo['escenario'] else '')
+    ejes[0].set_title(titulo)
+    figura.autofmt_xdate()
+
+    temporal = '{}.{}.tmp'.format(path, os.getpid())
+    figura.savefig(temporal, format=formato, dpi=dpi, bbox_inches='tight')
+    os.replace(temporal, path)
+    return path
+
+
+def _inicializa():
+    '''
+    Carga matplotlib con el backend Agg una vez por proceso del pool (en el proceso principal no se toca el backend).
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.backends import backend_agg  # noqa: F401
+
+
+def _grafica(argumentos):
+    return grafica(*argumentos)
+
+
+def renderiza(trabajos, directorio, n_procesos=None, formato='png', dpi=100):
+    '''
+    Escribe la figura de cada trabajo en `directorio`, repartiendo las figuras en un pool de procesos.
+
+    Inputs:
+        - trabajos: lista de `trabajos_lote` o `trabajos_almacen`
+        - directorio: directorio de salida (se crea si no existe)
+        - n_procesos=None: procesos del pool. Por default, los núcleos de la máquina. Con 1, se dibuja en este proceso.
+        - formato='png': formato de las figuras ('png', 'svg', 'pdf')
+        - dpi=100: resolución de las figuras en mapa de bits
+
+    Output:
+        - lista con el path de cada figura, en el orden de `trabajos`
+    '''
+
+    os.makedirs(directorio, exist_ok=True)
+    argumentos = [(trabajo, os.path.join(directorio, nombre_archivo(trabajo, formato)), formato, dpi)
+                  for trabajo in trabajos]
+
+    if n_procesos is None:
+        n_procesos = os.cpu_count() or 1
+    n_procesos = max(1, min(n_procesos, len(argumentos)))
+
+    with instrumentacion.etapa('renderiza'):
+        instrumentacion.cuenta('figuras', len(argumentos))
+        if n_procesos == 1:
+            paths = [_grafica(a) for a in argumentos]
+        else:
+            # Varias figuras por envío para no pagar la comunicación con el pool en cada una
+            bloque = max(1, len(argumentos) // (4 * n_procesos))
+            with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializa) as pool:
+                paths = list(pool.map(_grafica, argumentos, chunksize=bloque))
+
+    return paths
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo guarda pronósticos precalculados (escenario, estado, día, compartimento) en un almacén columnar de
+    solo anexado, para que tableros y reportes los lean en milisegundos sin volver a correr `iterate_model`.
+
+    Estructura en disco:
+        <path>/manifiesto.json                     lista de segmentos (se reescribe de forma atómica)
+        <path>/segmento_000012/valores.npy         arreglo (8, R): una columna contigua por compartimento
+        <path>/segmento_000012/series.pkl          una fila por serie: escenario, estado, t0, inicio y número de días
+                                                   dentro de `valores`, población, parámetros y condiciones iniciales
+
+    Cada `agrega` escribe un segmento nuevo y nunca modifica los anteriores; si una (escenario, estado) ya existía,
+    la lectura usa la del segmento más reciente. Los lectores abren `valores.npy` con memoria mapeada y solo
+    tocan los renglones de las series que piden: filtrar por estado o escenario no carga el resto del almacén.
+    Se supone un solo escritor a la vez; los lectores pueden ser muchos y de otros procesos.
+
+    Uso:
+        almacen = AlmacenPronosticos('./data/pronosticos')
+        almacen.agrega('tc=10,tf=30', estados, iterate_model_batch(x0, T, params), params, x0, t0s)
+        almacen.lee(estado='JALISCO')                           # DataFrame (escenario, estado, Fecha) × compartimento
+        almacen.trayectoria('tc=10,tf=30', 'JALISCO')           # arreglo (T+1, 8) sin copias
+'''
+
+import os
+import json
+import pickle
+import numpy as np
+import pandas as pd
+
+from data_handling.parameters import COMPARTIMENTOS, NOMBRES_PARAMETROS, NOMBRES_X0
+
+
+class AlmacenPronosticos:
+    '''
+    Almacén columnar de pronósticos en el directorio `path`.
+    Las lecturas recargan el manifiesto si otro proceso agregó segmentos.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._segmentos = []
+        self._series = None
+        self._valores = {}
+
+    ## ESCRITURA
+
+    def agrega(self, escenario, estados, flow, params, x0, t0, dias=None, metadatos=None):
+        '''
+        Agrega un lote de pronósticos como un segmento nuevo.
+
+        Inputs:
+            - escenario: nombre del escenario, o lista con el escenario de cada miembro del lote
+            - estados: lista con el estado de cada miembro del lote (B)
+            - flow: arreglo (T+1, B, 8) de `iterate_model_batch` (densidades), o (T+1, 8) para un solo miembro
+            - params: parámetros del lote (lista de 18 escalares o arreglos (B,), o `ArenasParamsBatch`)
+            - x0: condiciones iniciales (B, 8) o (8,)
+            - t0: fecha inicial de cada miembro (una o una lista de B)
+            - dias=None: días simulados que se guardan de cada miembro (uno o una lista de B, a lo más T). Por default, T.
+            - metadatos=None: diccionario serializable en JSON que se guarda con el segmento (p. ej. el corte)
+
+        Output:
+            - nombre del segmento
+        '''
+
+        flow = np.asarray(flow, dtype=np.float64)
+        if flow.ndim == 2:
+            flow = flow[:, None, :]
+        B = flow.shape[1]
+        n_dias = np.broadcast_to(flow.shape[0] - 1 if dias is None else np.asarray(dias), (B,)).astype(np.int64) + 1
+        if (n_dias > flow.shape[0]).any() or (n_dias < 1).any():
+            raise ValueError('dias debe estar entre 0 y {}'.format(flow.shape[0] - 1))
+
+        estados = [estados] * B if isinstance(estados, str) else list(estados)
+        escenarios = [escenario] * B if isinstance(escenario, str) else list(escenario)
+        t0 = pd.to_datetime([t0] * B if np.ndim(t0) == 0 else list(t0))
+        if not len(estados) == len(escenarios) == len(t0) == B:
+            raise ValueError('Se esperaban {} estados, escenarios y fechas iniciales'.format(B))
+
+        matriz_params = np.column_stack([np.broadcast_to(np.asarray(p, dtype=np.float64), (B,)) for p in params])
+        matriz_x0 = np.broadcast_to(np.asarray(x0, dtype=np.float64), (B, 8))
+
+        series = pd.DataFrame({'escenario': escenarios, 'estado': estados, 't0': t0,
+                               'inicio': np.concatenate([[0], np.cumsum(n_dias)[:-1]]), 'dias': n_dias})
+        for (i, nombre) in enumerate(NOMBRES_PARAMETROS):
+            series[nombre] = matriz_params[:, i]
+        for (i, nombre) in enumerate(NOMBRES_X0):
+            series[nombre] = matriz_x0[:, i]
+
+        # Columnas contiguas: valores[c] tiene las series una tras otra
+        valores = np.concatenate([flow[:n_dias[b], b].T for b in range(B)], axis=1)
+
+        self._carga()
+        numero = 1 + max([int(s['nombre'].split('_')[-1]) for s in self._segmentos], default=-1)
+        nombre = 'segmento_{:06d}'.format(numero)
+
+        # El segmento se escribe completo en un directorio temporal y después se renombra
+        os.makedirs(self.path, exist_ok=True)
+        temporal = os.path.join(self.path, '{}.{}.tmp'.format(nombre, os.getpid()))
+        os.makedirs(temporal)
+        np.save(os.path.join(temporal, 'valores.npy'), valores)
+        series.to_pickle(os.path.join(temporal, 'series.pkl'))
+        os.replace(temporal, os.path.join(self.path, nombre))
+
+        segmentos = self._segmentos + [{'nombre': nombre, 'series': B, 'renglones': int(n_dias.sum()),
+                                        'escenarios': sorted(set(escenarios)), 'estados': sorted(set(estados)),
+                                        'metadatos': metadatos or {}}]
+        self._escribe_manifiesto(segmentos)
+
+        return nombre
+
+    def _escribe_manifiesto(self, segmentos):
+        path = os.path.join(self.path, 'manifiesto.json')
+        temporal = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump({'segmentos': segmentos}, archivo, indent=1, ensure_ascii=False, default=str)
+        os.replace(temporal, path)
+
+    ## LECTURA
+
+    def _carga(self):
+        path = os.path.join(self.path, 'manifiesto.json')
+        if not os.path.exists(path):
+            return
+        mtime = os.stat(path).st_mtime_ns
+        if mtime != self._mtime:
+            with open(path, encoding='utf-8') as archivo:
+                self._segmentos = json.load(archivo)['segmentos']
+            self._mtime = mtime
+            self._series = None
+
+    def segmentos(self):
+        '''
+        Lista de segmentos del manifiesto (nombre, número de series y de renglones, escenarios, estados y metadatos).
+        '''
+        self._carga()
+        return list(self._segmentos)
+
+    def series(self, estado=None, escenario=None):
+        '''
+        Tabla de las series vigentes (la más reciente de cada (escenario, estado)), con sus parámetros y condiciones iniciales.
+
+        Inputs:
+            - estado=None, escenario=None: un valor o una lista para filtrar. Por default, todos.
+        '''
+
+        self._carga()
+        if self._series is None:
+            tablas = []
+            for segmento in self._segmentos:
+                with open(os.path.join(self.path, segmento['nombre'], 'series.pkl'), 'rb') as archivo:
+                    tabla = pickle.load(archivo)
+                tabla.insert(0, 'segmento', segmento['nombre'])
+                tablas.append(tabla)
+            if tablas:
+                self._series = (pd.concat(tablas, ignore_index=True)
+                                .drop_duplicates(subset=['escenario', 'estado'], keep='last')
+                                .reset_index(drop=True))
+            else:
+                self._series = pd.DataFrame(columns=['segmento', 'escenario', 'estado', 't0', 'inicio', 'dias']
+                                            + NOMBRES_PARAMETROS + NOMBRES_X0)
+
+        tabla = self._series
+        for (columna, valor) in (('estado', estado), ('escenario', escenario)):
+            if valor is not None:
+                tabla = tabla[tabla[columna].isin([valor] if isinstance(valor, str) else list(valor))]
+        return tabla
+
+    def _valores_segmento(self, nombre):
+        valores = self._valores.get(nombre)
+        if valores is None:
+            valores = self._valores[nombre] = np.load(os.path.join(self.path, nombre, 'valores.npy'), mmap_mode='r')
+        return valores
+
+    def trayectoria(self, escenario, estado, personas=False):
+        '''
+        Trayectoria de (escenario, estado) como arreglo (T+1, 8) de solo lectura (vista de la memoria mapeada).
+        Con `personas=True` se multiplica por la población (y se copia).
+        '''
+        fila = self.series(estado=estado, escenario=escenario)
+        if len(fila) == 0:
+            raise KeyError('No hay pronóstico de {} en el escenario {}'.format(estado, escenario))
+        fila = fila.iloc[0]
+        inicio = int(fila['inicio'])
+        vista = self._valores_segmento(fila['segmento'])[:, inicio:inicio + int(fila['dias'])].T
+        return vista * fila['N'] if personas else vista
+
+    def lee(self, estado=None, escenario=None, compartimentos=None, personas=True):
+        '''
+        Pronósticos filtrados por estado y/o escenario en un DataFrame.
+
+        Inputs:
+            - estado=None, escenario=None: un valor o una lista para filtrar. Por default, todos.
+            - compartimentos=None: columnas a leer (p. ej. ['H', 'D']). Por default, las 8.
+            - personas=True: multiplica por la población de cada serie. Con False se dan densidades.
+
+        Output:
+            - DataFrame indexado por (escenario, estado, Fecha) con una columna por compartimento
+        '''
+
+        compartimentos = COMPARTIMENTOS if compartimentos is None else list(compartimentos)
+        columnas = [COMPARTIMENTOS.index(c) for c in compartimentos]
+        tabla = self.series(estado=estado, escenario=escenario)
+
+        partes = []
+        for fila in tabla.itertuples(index=False):
+            valores = self._valores_segmento(fila.segmento)[columnas, fila.inicio:fila.inicio + fila.dias].T
+            parte = pd.DataFrame(valores * fila.N if personas else np.array(valores), columns=compartimentos)
+            parte.index = pd.MultiIndex.from_arrays([np.repeat(fila.escenario, fila.dias), np.repeat(fila.estado, fila.dias),
+                                                     pd.date_range(fila.t0, periods=fila.dias)],
+                                                    names=['escenario', 'estado', 'Fecha'])
+            partes.append(parte)
+
+        if not partes:
+            return pd.DataFrame(columns=compartimentos, index=pd.MultiIndex.from_arrays([[], [], []], names=['escenario', 'estado', 'Fecha']))
+        return pd.concat(partes)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo hace el análisis de sensibilidad global (índices de Sobol) de las salidas del modelo respecto a las
+    entradas del vector de parámetros de `get_params_arenas`.
+
+    Diseño de Saltelli: con dos matrices A y B de n puntos cuasi-aleatorios (Sobol) en los rangos de los d parámetros,
+    y las matrices A_B^i (A con la columna i de B), se evalúa el modelo n (d + 2) veces. Con f la salida y V su varianza:
+
+        S_i  = mean( f(B) (f(A_B^i) - f(A)) ) / V          (primer orden, Saltelli et al. 2010)
+        ST_i = mean( (f(A) - f(A_B^i))² ) / (2 V)          (total, Jansen 1999)
+
+    Todas las corridas pasan por `iterate_model_batch` en lotes de tamaño acotado.
+'''
+
+import numpy as np
+import pandas as pd
+import scipy.stats
+
+from data_handling.parameters import NOMBRES_PARAMETROS
+from arenas_model import iterate_model_batch
+
+# Parámetros que el modelo usa como días enteros (confinamiento y reactivación)
+PARAMETROS_ENTEROS = [15, 16]
+
+# Salidas del modelo: función de la trayectoria en personas (T+1, B, 8)
+SALIDAS = {
+    'pico_H': lambda flow: flow[:, :, 4].max(axis=0),
+    'dia_pico_H': lambda flow: flow[:, :, 4].argmax(axis=0).astype(np.float64),
+    'H_T': lambda flow: flow[-1, :, 4],
+    'D_T': lambda flow: flow[-1, :, 7],
+    'hospitalizados_acumulados_T': lambda flow: flow[-1, :, 4] + flow[-1, :, 6] + flow[-1, :, 7],
+}
+
+
+def _indice(parametro):
+    return parametro if isinstance(parametro, (int, np.integer)) else NOMBRES_PARAMETROS.index(parametro)
+
+
+def diseno_saltelli(rangos, n=1024, semilla=None):
+    '''
+    Diseño de Saltelli sobre los rangos de los parámetros.
+
+    Inputs:
+        - rangos: diccionario parámetro → (mínimo, máximo). El parámetro es su nombre ('β', 'k', ...) o su índice en params
+        - n=1024: puntos base (de preferencia potencia de 2)
+        - semilla=None: semilla de la secuencia de Sobol revuelta
+
+    Output:
+        - indices: lista de índices en params de los d parámetros
+        - muestras: arreglo (n (d + 2), d) con las filas de A, B y A_B^1, ..., A_B^d, en ese orden
+    '''
+
+    indices = [_indice(parametro) for parametro in rangos]
+    lo = np.array([rangos[parametro][0] for parametro in rangos], dtype=np.float64)
+    hi = np.array([rangos[parametro][1] for parametro in rangos], dtype=np.float64)
+    d = len(indices)
+
+    u = scipy.stats.qmc.Sobol(d=2 * d, scramble=True, seed=semilla).random(n)
+    A = lo + u[:, :d] * (hi - lo)
+    B = lo + u[:, d:] * (hi - lo)
+
+    bloques = [A, B]
+    for i in range(d):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        bloques.append(AB)
+
+    return indices, np.vstack(bloques)
+
+
+def evalua_diseno(muestras, indices, params, x0, T, salidas=('pico_H', 'D_T'), tamano_lote=10000):
+    '''
+    Evalúa las salidas del modelo en cada fila del diseño, en lotes de `tamano_lote` corridas.
+
+    Inputs:
+        - muestras: arreglo (M, d) de `diseno_saltelli`
+        - indices: índices en params de las columnas de `muestras`
+        - params: parámetros base (los demás quedan fijos)
+        - x0: condiciones iniciales
+        - T: días de simulación
+        - salidas=('pico_H', 'D_T'): nombres de SALIDAS o funciones de la trayectoria en personas (T+1, B, 8)
+        - tamano_lote=10000: corridas por llamada a `iterate_model_batch`
+
+    Output:
+        - Y: arreglo (M, número de salidas)
+    '''
+
+    funciones = [SALIDAS[salida] if isinstance(salida, str) else salida for salida in salidas]
+    Y = np.empty((len(muestras), len(funciones)))
+
+    for inicio in range(0, len(muestras), tamano_lote):
+        lote = muestras[inicio:inicio + tamano_lote]
+        params_lote = list(params)
+        for (j, i) in enumerate(indices):
+            params_lote[i] = np.round(lote[:, j]) if i in PARAMETROS_ENTEROS else lote[:, j]
+
+        N = np.asarray(params_lote[11], dtype=np.float64)
+        flow = iterate_model_batch(x0, T, params_lote) * N[..., None]
+        for (s, funcion) in enumerate(funciones):
+            Y[inicio:inicio + tamano_lote, s] = funcion(flow)
+
+    return Y
+
+
+def indices_sobol(Y, d):
+    '''
+    Índices de Sobol de primer orden y totales a partir de las salidas del diseño de Saltelli.
+
+    Inputs:
+        - Y: arreglo (n (d + 2),) o (n (d + 2), S) de `evalua_diseno`
+        - d: número de parámetros
+
+    Output:
+        - S1, ST: arreglos (d,) o (d, S)
+    '''
+
+    Y = np.asarray(Y, dtype=np.float64)
+    n = len(Y) // (d + 2)
+    f_A = Y[:n]
+    f_B = Y[n:2 * n]
+    f_AB = Y[2 * n:].reshape((d, n) + Y.shape[1:])
+
+    V = np.var(np.concatenate([f_A, f_B]), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S1 = np.mean(f_B * (f_AB - f_A), axis=1) / V
+        ST = np.mean(np.square(f_A - f_AB), axis=1) / (2 * V)
+
+    return S1, ST
+
+
+def analisis_sobol(params, x0, T, rangos, n=1024, salidas=('pico_H', 'D_T'), tamano_lote=10000, semilla=None):
+    '''
+    Análisis de sensibilidad global de las salidas del modelo respecto a los parámetros de `rangos`.
+
+    Inputs:
+        - params: parámetros base del modelo (p. ej. de `calibra_estado`)
+        - x0: condiciones iniciales
+        - T: días de simulación
+        - rangos: diccionario parámetro → (mínimo, máximo), ver `diseno_saltelli`
+        - n=1024: puntos base; el modelo se corre n (d + 2) veces
+        - salidas=('pico_H', 'D_T'): salidas a analizar, ver `evalua_diseno`
+        - tamano_lote=10000: corridas por lote
+        - semilla=None: semilla del diseño
+
+    Output:
+        - indices: DataFrame indexado por parámetro con columnas (salida, 'S1') y (salida, 'ST')
+    '''
+
+    indices, muestras = diseno_saltelli(rangos, n=n, semilla=semilla)
+    Y = evalua_diseno(muestras, indices, params, x0, T, salidas=salidas, tamano_lote=tamano_lote)
+    S1, ST = indices_sobol(Y, len(indices))
+
+    nombres = [salida if isinstance(salida, str) else getattr(salida, '__name__', str(s)) for (s, salida) in enumerate(salidas)]
+    columnas = pd.MultiIndex.from_product([nombres, ['S1', 'ST']])
+    datos = np.stack([S1, ST], axis=-1).reshape(len(indices), -1)
+
+    return pd.DataFrame(datos, index=pd.Index([NOMBRES_PARAMETROS[i] for i in indices], name='parametro'), columns=columnas)
+
+
+def get_rangos(params, parametros=None, fraccion=0.2):
+    '''
+    Rangos por default: ±`fraccion` alrededor del valor de cada parámetro (recortados a [0, 1] para las probabilidades).
+
+    Inputs:
+        - params: parámetros base del modelo
+        - parametros=None: nombres o índices a incluir. Por default, todos menos N, tc y tf.
+        - fraccion=0.2: semiancho relativo del rango
+
+    Output:
+        - rangos: diccionario nombre → (mínimo, máximo)
+    '''
+
+    if parametros is None:
+        parametros = [i for i in range(len(NOMBRES_PARAMETROS)) if i not in [11] + PARAMETROS_ENTEROS]
+
+    rangos = {}
+    for parametro in parametros:
+        i = _indice(parametro)
+        valor = float(params[i])
+        lo, hi = valor * (1 - fraccion), valor * (1 + fraccion)
+        if i not in [1, 11, 12] + PARAMETROS_ENTEROS:
+            lo, hi = max(lo, 0.), min(hi, 1.)
+        rangos[NOMBRES_PARAMETROS[i]] = (lo, hi)
+
+    return rangos
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+'''
+    Servicio HTTP local (asyncio, solo biblioteca estándar) para consultas de escenarios del modelo calibrado:
+    "¿qué pasa en JALISCO si la contención empieza el día 20 y termina 30 días después?".
+
+    Rutas:
+        GET  /salud                      estado del servicio y estadísticas (consultas, lotes, aciertos de caché)
+        GET  /estados                    entidades disponibles con su t0 y población
+        POST /escenario                  cuerpo JSON: {"estado": "JALISCO", "dias": 120, "cambios": {"tc": 20, "tf": 30}}
+        GET  /escenario?estado=JALISCO&dias=120&tc=20&tf=30
+
+    `cambios` sustituye entradas del vector de parámetros calibrado por nombre (ver NOMBRES_PARAMETROS; también
+    se aceptan los alias de ALIAS, p. ej. "kappa0"). Los valores deben ser finitos (tc y tf aceptan inf: sin
+    contención o sin reactivación) y los de INTERVALOS deben estar en su intervalo (400 si no). Una simulación con
+    valores no finitos se responde con 422 y no se guarda en el caché. La respuesta trae las fechas y el flujo de
+    cada compartimento en personas (o en densidades con "personas": false).
+
+    Las consultas que llegan casi al mismo tiempo se juntan en un solo lote de `iterate_model_batch` (se espera a lo
+    más `ventana` segundos o `max_lote` consultas), que corre fuera del ciclo de eventos. Las respuestas se guardan
+    en un caché LRU por (estado, cambios, días, personas), y las consultas idénticas en vuelo comparten el resultado.
+
+    Uso:
+        python -m data_handling.cli sirve --puerto 8050             (con las calibraciones del caché)
+        servicio = ServicioEscenarios(tabla); asyncio.run(servicio.sirve('127.0.0.1', 8050))
+'''
+
+import json
+import asyncio
+import collections
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+import pandas as pd
+
+from arenas_model import iterate_model_batch
+from parameter_sets import ArenasParamsBatch
+from data_handling.parameters import COMPARTIMENTOS, NOMBRES_PARAMETROS
+from data_handling.pipeline import get_params_tabla
+
+# Nombres en ASCII de los parámetros
+ALIAS = {'beta': 'β', 'eta': 'η', 'alfa': 'α', 'nu': 'ν', 'mu': 'μ', 'gamma': 'γ', 'omega': 'ω', 'psi': 'ψ',
+         'chiI': 'χᴵ', 'chiH': 'χᴴ', 'sigma': 'σ', 'kappa0': 'κ0', 'phi': 'ϕ', 'kappaf': 'κf'}
+
+# Intervalos válidos (mínimo, máximo, máximo incluido): probabilidades y fracciones en [0, 1], κ0 < 1 porque la
+# reactivación divide entre 1 - κ0, k ≥ 0 y σ ≥ 1 (tamaño del hogar). Los demás parámetros solo deben ser finitos.
+INTERVALOS = dict({nombre: (0, 1, True) for nombre in ['β', 'η', 'α', 'μ', 'γ', 'ω', 'ψ', 'χᴵ', 'χᴴ', 'ϕ', 'κf']},
+                  **{'κ0': (0, 1, False), 'k': (0, np.inf, False), 'σ': (1, np.inf, False)})
+# Días de contención y reactivación: inf es "nunca"
+DIAS_INTERVENCION = {'tc', 'tf'}
+
+# Límite de días por consulta
+MAX_DIAS = 3650
+
+_RAZONES = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 422: 'Unprocessable Entity',
+            500: 'Internal Server Error'}
+
+
+class ErrorConsulta(ValueError):
+    '''
+    Consulta inválida; se responde con el código `codigo`.
+    '''
+
+    def __init__(self, mensaje, codigo=400):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+class ServicioEscenarios:
+    '''
+    Servicio de escenarios a partir de la tabla de `calibra_estados`.
+
+    Inputs:
+        - tabla: DataFrame de `calibra_estados` (se usan las entidades sin excepción)
+        - ventana=0.005: segundos que se espera a juntar consultas en un lote
+        - max_lote=256: consultas por lote
+        - tamano_cache=4096: respuestas guardadas en el caché LRU
+    '''
+
+    def __init__(self, tabla, ventana=0.005, max_lote=256, tamano_cache=4096):
+        self.ventana = ventana
+        self.max_lote = max_lote
+        self.tamano_cache = tamano_cache
+
+        self.calibraciones = {}
+        for estado in tabla.index:
+            excepcion = tabla.loc[estado, 'excepcion']
+            if excepcion is None or pd.isna(excepcion):
+                params, x0 = get_params_tabla(tabla, estado)
+                self.calibraciones[estado] = (params, x0, pd.Timestamp(tabla.loc[estado, 't0']))
+
+        self._cache = collections.OrderedDict()
+        self._en_vuelo = {}
+        self._cola = None
+        self.estadisticas = {'consultas': 0, 'aciertos_cache': 0, 'compartidas': 0, 'lotes': 0, 'simulaciones': 0}
+
+    ## CONSULTAS
+
+    def normaliza(self, consulta):
+        '''
+        Valida una consulta y regresa su llave (estado, cambios, dias, personas).
+        '''
+
+        estado = consulta.get('estado')
+        if estado not in self.calibraciones:
+            raise ErrorConsulta('Estado desconocido o sin calibración: {}'.format(estado), 404)
+
+        try:
+            dias = int(consulta.get('dias', 120))
+        except (TypeError, ValueError):
+            raise ErrorConsulta('dias debe ser un entero')
+        if not 0 < dias <= MAX_DIAS:
+            raise ErrorConsulta('dias debe estar entre 1 y {}'.format(MAX_DIAS))
+
+        cambios = {}
+        for (nombre, valor) in (consulta.get('cambios') or {}).items():
+            nombre = ALIAS.get(nombre, nombre)
+            if nombre not in NOMBRES_PARAMETROS or nombre == 'N':
+                raise ErrorConsulta('Parámetro desconocido: {}'.format(nombre))
+            try:
+                valor = float(valor)
+            except (TypeError, ValueError):
+                raise ErrorConsulta('El valor de {} debe ser numérico'.format(nombre))
+            if not (np.isfinite(valor) or (nombre in DIAS_INTERVENCION and valor == np.inf)):
+                raise ErrorConsulta('El valor de {} debe ser finito'.format(nombre)
+                                    + (' (o inf)' if nombre in DIAS_INTERVENCION else ''))
+            if nombre in INTERVALOS:
+                (minimo, maximo, incluye_maximo) = INTERVALOS[nombre]
+                if not (minimo <= valor and (valor <= maximo if incluye_maximo else valor < maximo)):
+                    raise ErrorConsulta('El valor de {} debe estar en [{}, {}{}'.format(
+                        nombre, minimo, maximo, ']' if incluye_maximo else ')'))
+            cambios[nombre] = valor
+
+        personas = consulta.get('personas', True)
+        if isinstance(personas, str):
+            personas = personas.lower() not in ('0', 'false', 'no')
+        return (estado, tuple(sorted(cambios.items())), dias, bool(personas))
+
+    async def consulta(self, consulta):
+        '''
+        Respuesta (bytes JSON) de una consulta: del caché, de una consulta idéntica en vuelo o del siguiente lote.
+        '''
+
+        llave = self.normaliza(consulta)
+        self.estadisticas['consultas'] += 1
+
+        respuesta = self._cache.get(llave)
+        if respuesta is not None:
+            self._cache.move_to_end(llave)
+            self.estadisticas['aciertos_cache'] += 1
+            return respuesta
+
+        futuro = self._en_vuelo.get(llave)
+        if futuro is not None:
+            self.estadisticas['compartidas'] += 1
+            return await asyncio.shield(futuro)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_vuelo[llave] = futuro
+        await self._cola.put(llave)
+        return await asyncio.shield(futuro)
+
+    async def _agrupa(self):
+        '''
+        Tarea que junta las consultas pendientes en lotes y los simula fuera del ciclo de eventos.
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = [await self._cola.get()]
+            limite = loop.time() + self.ventana
+            while len(lote) < self.max_lote:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self._cola.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                respuestas = await loop.run_in_executor(None, self.simula, lote)
+            except Exception as e:
+                respuestas = [e] * len(lote)
+
+            self.estadisticas['lotes'] += 1
+            self.estadisticas['simulaciones'] += len(lote)
+            for (llave, respuesta) in zip(lote, respuestas):
+                futuro = self._en_vuelo.pop(llave)
+                if isinstance(respuesta, Exception):
+                    futuro.set_exception(respuesta)
+                    continue
+                futuro.set_result(respuesta)
+                self._cache[llave] = respuesta
+                if len(self._cache) > self.tamano_cache:
+                    self._cache.popitem(last=False)
+
+    def simula(self, llaves):
+        '''
+        Simula un lote de consultas normalizadas con una sola llamada a `iterate_model_batch`.
+
+        Output:
+            - lista de respuestas (bytes JSON), una por llave. Las simulaciones con valores no finitos se responden
+              con un ErrorConsulta (422), que no se guarda en el caché.
+        '''
+
+        registros, filas_x0 = [], []
+        for (estado, cambios, _, _) in llaves:
+            params, x0, _ = self.calibraciones[estado]
+            registros.append(params.replace(**dict(cambios)))
+            filas_x0.append(x0)
+
+        T = max(dias for (_, _, dias, _) in llaves)
+        flow = iterate_model_batch(np.array(filas_x0), T, ArenasParamsBatch.from_records(registros))
+
+        respuestas = []
+        for (b, (estado, cambios, dias, personas)) in enumerate(llaves):
+            t0 = self.calibraciones[estado][2]
+            escala = registros[b].N if personas else 1.0
+            valores = flow[:dias + 1, b] * escala
+            if not np.isfinite(valores).all():
+                respuestas.append(ErrorConsulta('La simulación de {} con {} da valores no finitos'.format(
+                    estado, dict(cambios)), 422))
+                continue
+            cuerpo = {'estado': estado, 't0': '{:%Y-%m-%d}'.format(t0), 'dias': dias, 'personas': personas,
+                      'cambios': {nombre: _finito(valor) for (nombre, valor) in cambios},
+                      'parametros': dict(zip(NOMBRES_PARAMETROS, [_finito(p) for p in registros[b]])),
+                      'fechas': pd.date_range(t0, periods=dias + 1).strftime('%Y-%m-%d').tolist(),
+                      'flujo': {c: valores[:, i].tolist() for (i, c) in enumerate(COMPARTIMENTOS)}}
+            respuestas.append(json.dumps(cuerpo, ensure_ascii=False).encode('utf-8'))
+        return respuestas
+
+    ## HTTP
+
+    async def _responde(self, metodo, ruta, cuerpo):
+        '''
+        Código y cuerpo JSON de una petición.
+        '''
+        partes = urlsplit(ruta)
+
+        if partes.path == '/salud':
+            return 200, json.dumps(dict(self.estadisticas, estados=len(self.calibraciones), cache=len(self._cache))).encode()
+
+        if partes.path == '/estados':
+            estados = [{'estado': estado, 't0': '{:%Y-%m-%d}'.format(t0), 'N': params[11]}
+                       for (estado, (params, _, t0)) in self.calibraciones.items()]
+            return 200, json.dumps(estados, ensure_ascii=False).encode('utf-8')
+
+        if partes.path == '/escenario':
+            if metodo == 'POST':
+                try:
+                    consulta = json.loads(cuerpo or b'{}')
+                except ValueError:
+                    raise ErrorConsulta('El cuerpo no es JSON válido')
+                if not isinstance(consulta, dict):
+                    raise ErrorConsulta('El cuerpo debe ser un objeto JSON')
+            elif metodo == 'GET':
+                argumentos = dict(parse_qsl(partes.query))
+                consulta = {'estado': argumentos.pop('estado', None), 'dias': argumentos.pop('dias', 120),
+                            'personas': argumentos.pop('personas', True), 'cambios': argumentos}
+            else:
+                raise ErrorConsulta('Método no permitido', 405)
+            return 200, await self.consulta(consulta)
+
+        raise ErrorConsulta('Ruta desconocida: {}'.format(partes.path), 404)
+
+    async def _conexion(self, lector, escritor):
+        '''
+        Atiende una conexión HTTP/1.1 (con keep-alive) hasta que el cliente la cierra.
+        '''
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                try:
+                    metodo, ruta, version = linea.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                encabezados = {}
+                while True:
+                    linea = await lector.readline()
+                    if linea in (b'\r\n', b'\n', b''):
+                        break
+                    nombre, _, valor = linea.decode('latin-1').partition(':')
+                    encabezados[nombre.strip().lower()] = valor.strip()
+
+                cuerpo = await lector.readexactly(int(encabezados.get('content-length', 0) or 0))
+
+                try:
+                    codigo, respuesta = await self._responde(metodo.upper(), ruta, cuerpo)
+                except ErrorConsulta as e:
+                    codigo, respuesta = e.codigo, json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf-8')
+                except Exception as e:
+                    codigo, respuesta = 500, json.dumps({'error': '{}: {}'.format(type(e).__name__, e)}).encode('utf-8')
+
+                sigue = version == 'HTTP/1.1' and encabezados.get('connection', '').lower() != 'close'
+                escritor.write('HTTP/1.1 {} {}\r\nContent-Type: application/json; charset=utf-8\r\n'
+                               'Content-Length: {}\r\nConnection: {}\r\n\r\n'
+                               .format(codigo, _RAZONES[codigo], len(respuesta), 'keep-alive' if sigue else 'close')
+                               .encode('latin-1') + respuesta)
+                await escritor.drain()
+                if not sigue:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            escritor.close()
+
+    async def sirve(self, host='127.0.0.1', puerto=8050, listo=None):
+        '''
+        Corre el servicio hasta que se cancele.
+
+        Inputs:
+            - host='127.0.0.1', puerto=8050: dirección (por default, solo local)
+            - listo=None: asyncio.Event que se activa cuando el servidor ya acepta conexiones
+        '''
+        self._cola = asyncio.Queue()
+        agrupador = asyncio.create_task(self._agrupa())
+        servidor = await asyncio.start_server(self._conexion, host, puerto)
+        print('Sirviendo {} estados en http://{}:{}'.format(len(self.calibraciones), host, puerto))
+        if listo is not None:
+            listo.set()
+        try:
+            async with servidor:
+                await servidor.serve_forever()
+        finally:
+            agrupador.cancel()
+
+
+def _finito(valor):
+    # JSON no admite infinito: tc y tf sin contención se reportan como null
+    return float(valor) if np.isfinite(valor) else None
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+'''
+    Este módulo genera cortes sintéticos de los datos abiertos de la DGE [1] para pruebas de carga sin datos reales
+    ni descargas: las mismas 35 columnas (ver `Descriptores_0419.xlsx`), claves de `Catalogos_0412.xlsx`, fechas
+    en texto AAAA-MM-DD y el centinela '9999-99-99' en FECHA_DEF de quienes no fallecieron.
+
+    Cada entidad tiene su propia curva epidémica (logística con inicio, tasa de crecimiento y pico propios), y los
+    casos se reparten entre entidades en proporción a su población. La hospitalización, la defunción, la intubación
+    y el ingreso a UCI dependen de la edad, como en los datos reales.
+
+    Los renglones se generan por bloques de BLOQUE renglones; el bloque i usa su propia semilla derivada de
+    (semilla, i), así que el resultado solo depende de `semilla` y del número de renglones (no del tamaño de los
+    bloques que se escriben a disco) y cualquier tamaño se genera con memoria acotada.
+
+    Uso:
+        escribe_datos_abiertos('./data/sinteticos_10M.csv', 10_000_000, semilla=0)
+        series = series_panel_por_estado(pd.read_csv('./data/sinteticos_10M.csv'))
+
+    [1]: https://www.gob.mx/salud/documentos/datos-abiertos-152127
+'''
+
+import os
+import gzip
+import numpy as np
+import pandas as pd
+
+from data_handling.registro import get_registro, PATH_CATALOGOS
+
+# Columnas de los datos abiertos, en el orden de la DGE
+COLUMNAS = ['FECHA_ACTUALIZACION', 'ID_REGISTRO', 'ORIGEN', 'SECTOR', 'ENTIDAD_UM', 'SEXO', 'ENTIDAD_NAC', 'ENTIDAD_RES',
+            'MUNICIPIO_RES', 'TIPO_PACIENTE', 'FECHA_INGRESO', 'FECHA_SINTOMAS', 'FECHA_DEF', 'INTUBADO', 'NEUMONIA',
+            'EDAD', 'NACIONALIDAD', 'EMBARAZO', 'HABLA_LENGUA_INDIG', 'DIABETES', 'EPOC', 'ASMA', 'INMUSUPR',
+            'HIPERTENSION', 'OTRAS_COM', 'CARDIOVASCULAR', 'OBESIDAD', 'RENAL_CRONICA', 'TABAQUISMO', 'OTRO_CASO',
+            'RESULTADO', 'MIGRANTE', 'PAIS_NACIONALIDAD', 'PAIS_ORIGEN', 'UCI']
+
+# Renglones por bloque de generación (cada bloque tiene su propia semilla)
+BLOQUE = 250_000
+
+# Fecha sin dato
+CENTINELA = '9999-99-99'
+
+# Comorbilidades (catálogo SI_NO) y su prevalencia aproximada
+COMORBILIDADES = {'DIABETES': 0.16, 'EPOC': 0.02, 'ASMA': 0.03, 'INMUSUPR': 0.015, 'HIPERTENSION': 0.2,
+                  'OTRAS_COM': 0.03, 'CARDIOVASCULAR': 0.025, 'OBESIDAD': 0.2, 'RENAL_CRONICA': 0.02, 'TABAQUISMO': 0.09}
+
+# Reparto de unidades por sector (el resto se reparte entre los demás sectores del catálogo)
+PESOS_SECTOR = {4: 0.45, 12: 0.4}
+
+
+def get_catalogos(path_catalogos=PATH_CATALOGOS):
+    '''
+    Claves de los catálogos de la DGE que usa el generador.
+
+    Output:
+        - catalogos: diccionario catálogo → Series de claves indexada por su descripción en mayúsculas ('ORIGEN',
+          'SECTOR', 'SEXO', 'TIPO_PACIENTE', 'SI_NO', 'NACIONALIDAD', 'RESULTADO')
+    '''
+
+    hojas = ['ORIGEN', 'SECTOR', 'SEXO', 'TIPO_PACIENTE', 'SI_NO', 'NACIONALIDAD', 'RESULTADO']
+    leidas = pd.read_excel(path_catalogos, sheet_name=['Catálogo {}'.format(hoja) for hoja in hojas], header=None)
+
+    catalogos = {}
+    for hoja in hojas:
+        tabla = leidas['Catálogo {}'.format(hoja)]
+        claves = pd.to_numeric(tabla.iloc[:, 0], errors='coerce')
+        validas = claves.notna()
+        descripciones = tabla.iloc[:, 1][validas].astype(str).str.strip().str.upper()
+        catalogos[hoja] = pd.Series(claves[validas].values.astype(np.int16), index=descripciones.values)
+    return catalogos
+
+
+class _Escenario:
+    '''
+    Todo lo que no cambia entre bloques: catálogos, curvas epidémicas y tablas de fechas.
+    '''
+
+    def __init__(self, semilla, fecha_inicio, fecha_corte, path_catalogos):
+        registro = get_registro(path_catalogos=path_catalogos)
+        self.semilla = semilla
+        self.catalogos = get_catalogos(path_catalogos)
+
+        self.fecha_inicio = pd.Timestamp(fecha_inicio)
+        self.fecha_corte = pd.Timestamp(fecha_corte)
+        self.n_dias = (self.fecha_corte - self.fecha_inicio).days + 1
+        # Fechas en texto; el índice n_dias es el centinela
+        self.fechas = np.append(pd.date_range(self.fecha_inicio, self.fecha_corte).strftime('%Y-%m-%d').values.astype(object), CENTINELA)
+
+        # Curvas epidémicas por entidad (con una semilla propia, independiente de los bloques)
+        rng = np.random.default_rng(np.random.SeedSequence(semilla, spawn_key=(2**32 - 1,)))
+        self.entidades = registro.claves_estado.astype(np.int16)
+        E = len(self.entidades)
+        inicio = rng.uniform(0.45, 0.7, E) * self.n_dias
+        tasa = rng.uniform(0.08, 0.16, E)
+        pico = self.n_dias + rng.uniform(-15, 45, E)
+        t = np.arange(self.n_dias)
+        logistica = 1 / (1 + np.exp(-tasa[:, None] * (t[None, :] - pico[:, None])))
+        epidemia = logistica * (1 - logistica) * (t[None, :] >= inicio[:, None])
+        # Sospechosos de otras enfermedades respiratorias durante todo el periodo (casi siempre negativos)
+        otros = 0.03 * epidemia.max(axis=1, keepdims=True) * np.ones_like(epidemia)
+        incidencia = epidemia + otros
+        pesos = incidencia / incidencia.sum(axis=1, keepdims=True) * registro.poblaciones[:, None]
+        self.acumulada = np.cumsum(pesos.ravel()) / pesos.sum()
+        self.positividad = (epidemia / incidencia).ravel()
+
+        # Municipios de cada entidad, contiguos en un solo arreglo
+        orden = np.argsort(registro.entidades_municipio, kind='stable')
+        entidades_mun = registro.entidades_municipio[orden]
+        self.municipios = registro.claves_municipio[orden]
+        self.inicio_mun = np.searchsorted(entidades_mun, self.entidades, side='left')
+        self.n_mun = np.searchsorted(entidades_mun, self.entidades, side='right') - self.inicio_mun
+
+        sectores = self.catalogos['SECTOR'].values
+        pesos = np.array([PESOS_SECTOR.get(clave, 0.) for clave in sectores])
+        pesos[pesos == 0] = (1 - pesos.sum()) / (pesos == 0).sum()
+        self.sectores, self.pesos_sector = sectores, pesos
+
+        # Claves por descripción de los demás catálogos
+        self.origen = self.claves('ORIGEN', 'USMER', 'FUERA DE USMER')
+        self.mujer, self.hombre = self.claves('SEXO', 'MUJER', 'HOMBRE')
+        self.ambulatorio, self.hospitalizado = self.claves('TIPO_PACIENTE', 'AMBULATORIO', 'HOSPITALIZADO')
+        self.si, self.no, self.no_aplica, self.se_ignora, self.no_especificado = self.claves(
+            'SI_NO', 'SI', 'NO', 'NO APLICA', 'SE IGNORA', 'NO ESPECIFICADO')
+        self.mexicana, self.extranjera = self.claves('NACIONALIDAD', 'MEXICANA', 'EXTRANJERA')
+        self.positivo, self.no_positivo, self.pendiente = self.claves(
+            'RESULTADO', 'POSITIVO SARS-COV-2', 'NO POSITIVO SARS-COV-2', 'RESULTADO PENDIENTE')
+
+    def claves(self, hoja, *descripciones):
+        '''
+        Claves de un catálogo para las descripciones dadas (en mayúsculas), como arreglo int16.
+        '''
+        return self.catalogos[hoja][list(descripciones)].values
+
+    def bloque(self, i, filas, columnas):
+        '''
+        Renglones del bloque `i` (de tamaño `filas`) como DataFrame con `columnas`.
+        '''
+
+        rng = np.random.default_rng(np.random.SeedSequence(self.semilla, spawn_key=(i,)))
+        E, D = len(self.entidades), self.n_dias
+
+        # Entidad y fecha de ingreso según las curvas epidémicas
+        celda = np.minimum(np.searchsorted(self.acumulada, rng.random(filas), side='right'), E * D - 1)
+        ix_entidad, ingreso = np.divmod(celda, D)
+        entidad = self.entidades[ix_entidad]
+
+        edad = np.clip(rng.normal(44, 17, filas), 0, 105).astype(np.int16)
+        sexo = rng.choice(np.array([self.mujer, self.hombre]), filas)
+
+        # Hospitalización y defunción crecen con la edad
+        p_hosp = 1 / (1 + np.exp(-(edad - 62) / 10))
+        hospitalizado = rng.random(filas) < p_hosp
+        sintomas = np.maximum(ingreso - np.where(hospitalizado, rng.geometric(0.25, filas), rng.geometric(0.6, filas) - 1), 0)
+        muere = rng.random(filas) < np.where(hospitalizado, 0.1 + 0.5 * p_hosp, 0.005)
+        defuncion = ingreso + rng.geometric(0.1, filas)
+        defuncion = np.where(muere & (defuncion < D), defuncion, D)
+
+        # Resultado: los casos recientes aún pueden estar pendientes
+        pendiente = rng.random(filas) < 0.6 * np.exp(-(D - 1 - ingreso) / 4)
+        positivo = rng.random(filas) < self.positividad[celda] * (0.7 + 0.2 * hospitalizado)
+        resultado = np.where(pendiente, self.pendiente, np.where(positivo, self.positivo, self.no_positivo)).astype(np.int16)
+        defuncion = np.where((resultado == self.no_positivo) & (rng.random(filas) < 0.7), D, defuncion)
+
+        residencia = np.where(rng.random(filas) < 0.96, ix_entidad, rng.integers(0, E, filas))
+        nacimiento = np.where(rng.random(filas) < 0.8, residencia, rng.integers(0, E, filas))
+        municipio = self.municipios[self.inicio_mun[residencia] + (rng.random(filas) * self.n_mun[residencia]).astype(np.int64)]
+        extranjero = rng.random(filas) < 0.005
+
+        def si_no(p, aplica=None):
+            valores = np.where(rng.random(filas) < p, self.si, self.no).astype(np.int16)
+            valores[rng.random(filas) < 0.004] = self.se_ignora
+            if aplica is not None:
+                valores[~aplica] = self.no_aplica
+            return valores
+
+        generadores = {
+            'FECHA_ACTUALIZACION': lambda: np.full(filas, self.fechas[D - 1], dtype=object),
+            # Identificador hexadecimal único: permutación biyectiva del número de renglón
+            'ID_REGISTRO':         lambda: pd.Series((i * BLOQUE + np.arange(filas, dtype=np.int64)) * 2654435761 % 2**40).map('{:010x}'.format).values,
+            'ORIGEN':              lambda: rng.choice(self.origen, filas, p=[0.3, 0.7]),
+            'SECTOR':              lambda: rng.choice(self.sectores, filas, p=self.pesos_sector),
+            'ENTIDAD_UM':          lambda: entidad,
+            'SEXO':                lambda: sexo,
+            'ENTIDAD_NAC':         lambda: np.where(extranjero, 99, self.entidades[nacimiento]).astype(np.int16),
+            'ENTIDAD_RES':         lambda: self.entidades[residencia],
+            'MUNICIPIO_RES':       lambda: municipio,
+            'TIPO_PACIENTE':       lambda: np.where(hospitalizado, self.hospitalizado, self.ambulatorio).astype(np.int16),
+            'FECHA_INGRESO':       lambda: self.fechas[ingreso],
+            'FECHA_SINTOMAS':      lambda: self.fechas[sintomas],
+            'FECHA_DEF':           lambda: self.fechas[defuncion],
+            'INTUBADO':            lambda: si_no(0.12 + 0.2 * p_hosp, aplica=hospitalizado),
+            'NEUMONIA':            lambda: si_no(0.05 + 0.6 * hospitalizado),
+            'EDAD':                lambda: edad,
+            'NACIONALIDAD':        lambda: np.where(extranjero, self.extranjera, self.mexicana).astype(np.int16),
+            'EMBARAZO':            lambda: si_no(0.02, aplica=(sexo == self.mujer) & (edad >= 12) & (edad <= 50)),
+            'HABLA_LENGUA_INDIG':  lambda: si_no(0.015),
+            'OTRO_CASO':           lambda: si_no(0.35),
+            'RESULTADO':           lambda: resultado,
+            'MIGRANTE':            lambda: np.where(rng.random(filas) < 0.001, self.si, self.no_especificado).astype(np.int16),
+            'PAIS_NACIONALIDAD':   lambda: np.where(extranjero, 'Estados Unidos de América', 'México').astype(object),
+            'PAIS_ORIGEN':         lambda: np.where(extranjero, 'Estados Unidos de América', '97').astype(object),
+            'UCI':                 lambda: si_no(0.08 + 0.1 * p_hosp, aplica=hospitalizado),
+        }
+        for (columna, p) in COMORBILIDADES.items():
+            generadores[columna] = lambda p=p: si_no(p * (0.5 + edad / 50))
+
+        # Cada columna se genera aunque no se pida, para que los renglones no dependan de `columnas`
+        datos = {columna: generadores[columna]() for columna in COLUMNAS}
+        return pd.DataFrame({columna: datos[columna] for columna in columnas})
+
+
+def genera_datos_abiertos(filas, semilla=0, fecha_inicio='2020-01-01', fecha_corte='2020-05-09', tamano_bloque=1_000_000,
+                          columnas=None, path_catalogos=PATH_CATALOGOS):
+    '''
+    Genera un corte sintético de los datos abiertos por bloques.
+
+    Inputs:
+        - filas: número total de renglones
+        - semilla=0: semilla; el mismo valor da exactamente los mismos renglones
+        - fecha_inicio='2020-01-01', fecha_corte='2020-05-09': periodo del corte (fecha_corte es la FECHA_ACTUALIZACION)
+        - tamano_bloque=1_000_000: renglones aproximados por DataFrame entregado (múltiplo de BLOQUE)
+        - columnas=None: columnas a entregar. Por default, todas las de COLUMNAS.
+        - path_catalogos: Excel de catálogos de la DGE
+
+    Output:
+        - generador de DataFrames con las columnas pedidas
+    '''
+
+    columnas = COLUMNAS if columnas is None else list(columnas)
+    desconocidas = set(columnas) - set(COLUMNAS)
+    if desconocidas:
+        raise ValueError('Columnas desconocidas: {}'.format(sorted(desconocidas)))
+
+    escenario = _Escenario(semilla, fecha_inicio, fecha_corte, path_catalogos)
+
+    bloques_por_entrega = max(1, tamano_bloque // BLOQUE)
+    # Con filas=0 se entrega un bloque vacío, con las columnas y sus tipos
+    n_bloques = max(1, -(-filas // BLOQUE))
+    for inicio in range(0, n_bloques, bloques_por_entrega):
+        partes = [escenario.bloque(i, min(BLOQUE, filas - i * BLOQUE), columnas)
+                  for i in range(inicio, min(inicio + bloques_por_entrega, n_bloques))]
+        yield pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+
+
+def get_datos_abiertos_sinteticos(filas, semilla=0, **opciones):
+    '''
+    Corte sintético completo en un solo DataFrame (ver `genera_datos_abiertos`).
+    '''
+    return pd.concat(genera_datos_abiertos(filas, semilla=semilla, **opciones), ignore_index=True)
+
+
+def escribe_datos_abiertos(path, filas, semilla=0, **opciones):
+    '''
+    Escribe un corte sintético a un csv (comprimido con gzip si `path` termina en .gz) bloque por bloque,
+    con memoria acotada para cualquier número de renglones. La escritura es atómica.
+
+    Inputs:
+        - path: archivo de salida
+        - filas, semilla, **opciones: ver `genera_datos_abiertos`
+
+    Output:
+        - path
+    '''
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporal = '{}.{}.tmp'.format(path, os.getpid())
+    if path.endswith('.gz'):
+        archivo = gzip.open(temporal, 'wt', encoding='utf-8', newline='', compresslevel=1)
+    else:
+        archivo = open(temporal, 'w', encoding='utf-8', newline='')
+
+    with archivo:
+        for (i, bloque) in enumerate(genera_datos_abiertos(filas, semilla=semilla, **opciones)):
+            bloque.to_csv(archivo, header=(i == 0), index=False)
+    os.replace(temporal, path)
+
+    return path
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Genera un corte sintético de los datos abiertos de la DGE')
+    parser.add_argument('salida')
+    parser.add_argument('filas', type=int)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--fecha-corte', default='2020-05-09')
+    args = parser.parse_args()
+
+    escribe_datos_abiertos(args.salida, args.filas, semilla=args.semilla, fecha_corte=args.fecha_corte)
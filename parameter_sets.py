@@ -0,0 +1,163 @@
+## Structured, immutable parameter sets for the decoupled Arenas model (arenas_model.py).
+# Both forms behave like the legacy 18-slot list (params[0], params[:11], list(params), ...),
+# so they can be passed directly to `iterate_model`, `iterate_model_batch`, `model_states`, etc.
+
+import unicodedata
+from collections import namedtuple
+
+import numpy as np
+
+# Slot names in the order of `get_params_arenas`
+ARENAS_FIELDS = ('β', 'k', 'η', 'α', 'ν', 'μ', 'γ', 'ω', 'ψ', 'χᴵ', 'χᴴ', 'N', 'σ', 'κ0', 'ϕ', 'tc', 'tf', 'κf')
+
+# Python normalizes identifiers (NFKC): `p.χᴵ` and `replace(χᴵ=...)` arrive as 'χI'. Map them back to the slot names.
+_FIELD_NAMES = {unicodedata.normalize('NFKC', name): name for name in ARENAS_FIELDS}
+
+
+def _field(name):
+    return _FIELD_NAMES.get(name, name)
+
+
+class ArenasParams(namedtuple('ArenasParams', ARENAS_FIELDS)):
+    '''
+    Frozen, hashable record with one parameter set. Fields are accessible by name (`p.γ`) or by legacy slot (`p[6]`).
+
+    Use `replace` (or `_replace`) instead of assigning to a slot:
+        params = ArenasParams.from_list(get_params_arenas()).replace(N=N, tc=10, tf=10)
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def from_list(cls, params):
+        '''
+        Builds the record from a legacy 18-slot list.
+        '''
+        if len(params) != len(ARENAS_FIELDS):
+            raise ValueError('Expected {} parameters, got {}'.format(len(ARENAS_FIELDS), len(params)))
+        return cls(*[float(p) for p in params])
+
+    def to_list(self):
+        '''
+        Legacy (mutable) 18-slot list.
+        '''
+        return list(self)
+
+    def replace(self, **changes):
+        '''
+        New record with the given fields changed.
+        '''
+        return self._replace(**{_field(name): float(value) for (name, value) in changes.items()})
+
+    def __getattr__(self, name):
+        if _field(name) != name:
+            return getattr(self, _field(name))
+        raise AttributeError(name)
+
+
+class ArenasParamsBatch:
+    '''
+    Columnar batch of B parameter sets, backed by a read-only NumPy structured array of shape (B,).
+
+    Like the legacy list it has 18 entries: `batch[i]` (or `batch.γ`) is the (B,) column of slot i, a view without copies.
+    This is the layout `iterate_model_batch` expects, so a batch is simulated with a single call:
+        flow = iterate_model_batch(x0, T, batch)
+
+    The batch is hashable (by content) for caching; `size` is the number of parameter sets.
+    '''
+
+    dtype = np.dtype([(name, np.float64) for name in ARENAS_FIELDS])
+
+    def __init__(self, data):
+        data = np.array(data, dtype=self.dtype).reshape(-1)
+        data.setflags(write=False)
+        self.data = data
+
+    ## CONSTRUCTION
+
+    @classmethod
+    def from_records(cls, records):
+        '''
+        Batch from a sequence of records or legacy lists.
+        '''
+        return cls(np.array([tuple(float(p) for p in record) for record in records], dtype=cls.dtype))
+
+    @classmethod
+    def from_columns(cls, base, **columns):
+        '''
+        Batch that takes every field from `base` (a record or legacy list) except the given columns.
+        All columns are broadcast to a common size B.
+
+        Example:
+            batch = ArenasParamsBatch.from_columns(params, β=β_samples, k=k_samples)
+        '''
+        columns = {_field(name): np.asarray(value, dtype=np.float64) for (name, value) in columns.items()}
+        unknown = set(columns) - set(ARENAS_FIELDS)
+        if unknown:
+            raise ValueError('Unknown parameters: {}'.format(sorted(unknown)))
+
+        B = np.broadcast(*columns.values()).size if columns else 1
+        data = np.empty(B, dtype=cls.dtype)
+        for (i, name) in enumerate(ARENAS_FIELDS):
+            data[name] = columns[name] if name in columns else float(base[i])
+        return cls(data)
+
+    ## LEGACY LIST PROTOCOL
+
+    def __len__(self):
+        return len(ARENAS_FIELDS)
+
+    def __getitem__(self, i):
+        if isinstance(i, str):
+            return self.data[i]
+        if isinstance(i, slice):
+            return [self.data[name] for name in ARENAS_FIELDS[i]]
+        return self.data[ARENAS_FIELDS[i]]
+
+    def __iter__(self):
+        return (self.data[name] for name in ARENAS_FIELDS)
+
+    def __getattr__(self, name):
+        if _field(name) in ARENAS_FIELDS:
+            return self.data[_field(name)]
+        raise AttributeError(name)
+
+    ## BATCH ACCESS
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def record(self, b):
+        '''
+        Parameter set `b` as an `ArenasParams` record.
+        '''
+        return ArenasParams(*self.data[b].tolist())
+
+    def records(self):
+        return [ArenasParams(*row) for row in self.data.tolist()]
+
+    def to_lists(self):
+        '''
+        Legacy lists, one per parameter set.
+        '''
+        return [list(row) for row in self.data.tolist()]
+
+    def replace(self, **columns):
+        '''
+        New batch with the given columns changed (scalars or (B,) arrays).
+        '''
+        data = self.data.copy()
+        for (name, value) in columns.items():
+            data[_field(name)] = value
+        return ArenasParamsBatch(data)
+
+    ## HASHING
+
+    def __hash__(self):
+        return hash((self.size, self.data.tobytes()))
+
+    def __eq__(self, other):
+        return isinstance(other, ArenasParamsBatch) and np.array_equal(self.data, other.data)
+
+    def __repr__(self):
+        return 'ArenasParamsBatch(size={})'.format(self.size)
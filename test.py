@@ -2,12 +2,15 @@
 # Run this script to see the model in action with artificial parameters and initial conditions.
 
 import numpy as np
-import matplotlib.pyplot as plt
 from arenas_model import *
 from  data_handling.parameters import get_params_arenas
+from parameter_sets import ArenasParams
 
 
 def main():
+    # matplotlib is only needed for the plots, so importing this module stays light
+    import matplotlib.pyplot as plt
+
     # Set number of compartiments (S,E,A,I,H,Rᴵ,Rᴴ,D -> 8)
     NC = 8
 
@@ -19,13 +22,12 @@ def main():
     ##--SET MODEL PARAMETERS--##
 
     # Arenas parameters (χ is repeated for the new model with one more compartiment)
-    params = get_params_arenas()
+    params = ArenasParams.from_list(get_params_arenas())
 
     ## Containtment parameters
     tc = 10
-    params[-2] = tc
     tf = 10
-    params[-1] = tf
+    params = params.replace(N=N, tc=tc, tf=tf)
 
     ##--SET ARTIFICIAL INITIAL CONDITIONS--##
     # I'll put a small amount of asymptomatic cases. The rest will be all susceptible.